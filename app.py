@@ -1,306 +1,1037 @@
-from flask import Flask, render_template, request, jsonify
-import requests
-import re
+from flask import Flask, Response, render_template, request, jsonify, g
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import atexit
+from datetime import datetime, timezone
+import hashlib
+import json
+import math
+import os
+import time
+
+from cache import TTLCache
+from decoder import (REPORT_MODIFIERS, SKY_CODES, TAF_CONTINUATION_PATTERN, WEATHER_CODES, decode_memo,
+                     decode_profile_state, describe_weather, parse_metar, parse_metar_cached, parse_sky, parse_taf,
+                     parse_weather)
+from metrics import Registry, UpstreamHealth
+from prefetch import PrefetchScheduler
+from shared_cache import CacheBackendError, open_backend
+from stations import DEFAULT_CATALOG, load_catalog, valid_station_id
+from store import ObservationStore, observation_time
+from stream import StreamHub
+from upstream import CircuitBreaker, TokenBucket, UpstreamClient, UpstreamUnavailable
+
+def process_start_time():
+    """Return when this process started, in epoch seconds.
+
+    Read from /proc so interpreter startup and imports count; elsewhere it
+    falls back to now. Forked gunicorn workers inherit the master's value,
+    which in a container is close to the container's start.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            started_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - started_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+PROCESS_STARTED = process_start_time()
 
 app = Flask(__name__)
 
+# Upstream METARs only change every 30-60 minutes, so share recent lookups
+metar_cache = TTLCache(
+    maxsize=int(os.environ.get('METAR_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('METAR_CACHE_TTL', 300)),
+)
+
+# Optional second tier shared by every worker, so one upstream fetch serves them all
+shared_cache = open_backend(os.environ.get('METAR_SHARED_CACHE', ''))
+SHARED_LOCK_LEASE = float(os.environ.get('METAR_SHARED_LOCK_LEASE', 30))
+SHARED_LOCK_WAIT = float(os.environ.get('METAR_SHARED_LOCK_WAIT', 10))
+# Lease background refreshes take; lowercase, so no station ID can collide
+REFRESH_LEASE_KEY = 'background-refresh'
+
+# Serialized /metar bodies with their ETags, so a repeated report is neither
+# decoded nor serialized again and revalidations are answered from memory
+response_memo = TTLCache(maxsize=int(os.environ.get('METAR_RESPONSE_MEMO_SIZE', 4096)), ttl=None)
+
+# Products other than METARs (TAF), by name; see register_product. TAFs are
+# issued every six hours but amended at any time, so keep them for minutes.
+products = {}
+taf_cache = TTLCache(
+    maxsize=int(os.environ.get('METAR_TAF_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('METAR_TAF_CACHE_TTL', 900)),
+)
+# Products requested along with every METAR fetch, so one upstream poll
+# refreshes all of them, e.g. METAR_BUNDLE_PRODUCTS=taf
+BUNDLED_PRODUCTS = os.environ.get('METAR_BUNDLE_PRODUCTS', '').replace(',', ' ').lower().split()
+
+# Clients and CDNs may reuse a /metar response until the station's next
+# routine report is due (observation time + interval + delay), within bounds
+REPORT_INTERVAL = float(os.environ.get('METAR_REPORT_INTERVAL', 3600))
+REPORT_DELAY = float(os.environ.get('METAR_REPORT_DELAY', 300))
+MAX_AGE_MIN = int(os.environ.get('METAR_MAX_AGE_MIN', 30))
+MAX_AGE = int(os.environ.get('METAR_MAX_AGE', metar_cache.ttl))
+
+# Shared keep-alive connection pool for aviationweather.gov
+upstream = UpstreamClient(
+    connect_timeout=float(os.environ.get('METAR_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.environ.get('METAR_READ_TIMEOUT', 10)),
+    pool_size=int(os.environ.get('METAR_POOL_SIZE', 10)),
+    retries=int(os.environ.get('METAR_RETRIES', 2)),
+    backoff=float(os.environ.get('METAR_RETRY_BACKOFF', 0.3)),
+)
+
+# Upstream API host, e.g. a local stub for load tests; METAR_API_URL overrides the whole endpoint
+UPSTREAM_BASE_URL = os.environ.get('METAR_UPSTREAM_URL', "https://aviationweather.gov").rstrip('/')
+METAR_API_URL = os.environ.get('METAR_API_URL', f"{UPSTREAM_BASE_URL}/api/data/metar")
+
+# Outgoing request budget per process; a request waits this long for a token before it is shed
+upstream_limiter = TokenBucket(
+    rate=float(os.environ.get('METAR_UPSTREAM_RATE', 0)),
+    burst=int(os.environ.get('METAR_UPSTREAM_BURST', 10)),
+)
+UPSTREAM_RATE_WAIT = float(os.environ.get('METAR_UPSTREAM_RATE_WAIT', 0.5))
+
+# Operational metrics, exposed in Prometheus text format at /metrics
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    'metar_stage_seconds', 'Time spent in each stage of serving a request', ['stage'])
+request_seconds = metrics.histogram(
+    'metar_request_seconds', 'Time spent serving API requests', ['endpoint'])
+api_requests = metrics.counter(
+    'metar_requests_total', 'API requests by endpoint and response status', ['endpoint', 'status'])
+upstream_requests = metrics.counter(
+    'metar_upstream_requests_total', 'Upstream requests by response status, or error if none', ['status'])
+upstream_throttled = metrics.counter(
+    'metar_upstream_throttled_total', 'Upstream requests not sent, by reason', ['reason'])
+breaker_transitions = metrics.counter(
+    'metar_breaker_transitions_total', 'Upstream circuit breaker state changes, by the state entered', ['state'])
+stale_served = metrics.counter(
+    'metar_stale_served_total', 'Last known reports served because a fresh one could not be fetched')
+not_modified = metrics.counter('metar_not_modified_total', '/metar requests answered with 304 Not Modified')
+for cache_name, cache in (('metar_cache', metar_cache), ('metar_decode_memo', decode_memo),
+                          ('metar_response_memo', response_memo), ('metar_taf_cache', taf_cache)):
+    for counter in ('hits', 'misses', 'evictions'):
+        metrics.callback(f'{cache_name}_{counter}_total', f'{cache_name} {counter}',
+                         lambda cache=cache, counter=counter: getattr(cache, counter), 'counter')
+    metrics.callback(f'{cache_name}_size', f'Entries in {cache_name}', cache.__len__)
+metrics.callback('metar_cache_coalesced_total', 'Lookups that waited on an in-flight upstream request',
+                 lambda: metar_cache.coalesced, 'counter')
+if shared_cache is not None:
+    for counter in ('hits', 'misses', 'errors', 'lock_waits', 'lock_timeouts'):
+        metrics.callback(f'metar_shared_cache_{counter}_total', f'Shared cache {counter.replace("_", " ")} in this process',
+                         lambda counter=counter: getattr(shared_cache, counter), 'counter')
+
+# /health reports unhealthy when the upstream is unreachable and there are no
+# reports to serve stale, and degraded when more than this share of recent
+# upstream requests failed
+upstream_health = UpstreamHealth(window=int(os.environ.get('METAR_HEALTH_WINDOW', 100)))
+HEALTH_MAX_ERROR_RATE = float(os.environ.get('METAR_HEALTH_MAX_ERROR_RATE', 0.5))
+
+# Stops sending upstream requests after repeated failures, probing again after a pause
+upstream_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('METAR_BREAKER_THRESHOLD', 5)),
+    reset_timeout=float(os.environ.get('METAR_BREAKER_RESET', 30)),
+    on_transition=lambda state: breaker_transitions.inc(state=state),
+)
+BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+metrics.callback('metar_breaker_state', 'Upstream circuit breaker state: 0 closed, 1 half-open, 2 open',
+                 lambda: BREAKER_STATES[upstream_breaker.state])
+
+# Refreshes revalidate the last response per upstream URL with its ETag or
+# Last-Modified, so an unchanged answer comes back as an empty 304
+CONDITIONAL_REQUESTS = os.environ.get('METAR_CONDITIONAL_REQUESTS', '1') != '0'
+upstream_validators = TTLCache(maxsize=int(os.environ.get('METAR_VALIDATOR_CACHE_SIZE', 4096)), ttl=None)
+
+# Last report fetched per station, to tell new observations from repeats
+last_reports = TTLCache(maxsize=int(os.environ.get('METAR_CHANGE_TRACKING_SIZE', 16384)), ttl=None)
+change_listeners = []
+polls = metrics.counter(
+    'metar_polls_total', 'Fetched station reports by whether they changed since the last fetch', ['result'])
+
+# Batch lookups are split into upstream requests of at most this many stations
+BATCH_CHUNK_SIZE = int(os.environ.get('METAR_BATCH_CHUNK_SIZE', 100))
+BATCH_MAX_STATIONS = int(os.environ.get('METAR_BATCH_MAX_STATIONS', 1000))
+
+# Runs the upstream requests of a batch lookup concurrently
+batch_executor = ThreadPoolExecutor(max_workers=upstream.pool_size, thread_name_prefix='metar-batch')
+
+# Known stations, to refuse bad IDs without an upstream round trip and to find
+# the stations near a position. 'format' refuses IDs that are not ICAO shaped,
+# 'catalog' also those missing from the catalog, 'off' sends everything upstream.
+station_catalog = load_catalog(os.environ.get('METAR_STATIONS_PATH') or DEFAULT_CATALOG)
+STATION_VALIDATION = os.environ.get('METAR_STATION_VALIDATION', 'format')
+NEARBY_DEFAULT_STATIONS = int(os.environ.get('METAR_NEARBY_DEFAULT_STATIONS', 5))
+NEARBY_MAX_STATIONS = int(os.environ.get('METAR_NEARBY_MAX_STATIONS', 50))
+stations_rejected = metrics.counter(
+    'metar_stations_rejected_total', 'Station IDs refused without an upstream request')
+metrics.callback('metar_station_catalog_size', 'Stations in the station catalog', station_catalog.__len__)
+
+def record_upstream(status_code, seconds, permit=True):
+    """Record the duration and status of one upstream request (None if it raised) and its breaker permit"""
+    stage_seconds.observe(seconds, stage='fetch')
+    upstream_requests.inc(status='error' if status_code is None else status_code)
+    upstream_health.record(status_code)
+    upstream_breaker.record(status_code is None or status_code >= 500 or status_code == 429, permit)
+
+def upstream_permit(wait=0):
+    """Check the breaker and take a rate-limit token before an upstream request.
+
+    Returns the breaker's permit, for record_upstream. Raises
+    UpstreamUnavailable if the request must not be sent.
+    """
+    permit = upstream_breaker.allow()
+    if not permit:
+        upstream_throttled.inc(reason='circuit_open')
+        raise UpstreamUnavailable('Upstream circuit breaker is open')
+    if not upstream_limiter.acquire(wait):
+        upstream_breaker.release(permit)
+        upstream_throttled.inc(reason='rate_limit')
+        raise UpstreamUnavailable('Upstream rate limit reached')
+    return permit
+
+def upstream_get(url, headers=None):
+    """GET an upstream URL through the shared pool, recording metrics"""
+    permit = upstream_permit(UPSTREAM_RATE_WAIT)
+    start = time.perf_counter()
+    try:
+        response = upstream.get(url, headers=headers) if headers else upstream.get(url)
+    except Exception:
+        record_upstream(None, time.perf_counter() - start, permit)
+        raise
+    record_upstream(response.status_code, time.perf_counter() - start, permit)
+    return response
+
+def conditional_headers(url):
+    """Return the If-None-Match/If-Modified-Since headers for revalidating url"""
+    validators = upstream_validators.get(url) if CONDITIONAL_REQUESTS else None
+    if validators is None:
+        return {}
+    etag, last_modified, _ = validators
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+def resolve_conditional(url, status_code, text, headers):
+    """Return (status_code, text) for an upstream answer to a conditional GET.
+
+    A 304 is answered with the body stored for url, as a 200. The
+    validators of a 200 are stored with its body for the next request.
+    """
+    if status_code == 304:
+        validators = upstream_validators.get(url)
+        return (200, validators[2]) if validators is not None else (status_code, text)
+    if status_code == 200 and CONDITIONAL_REQUESTS and isinstance(headers, Mapping):
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if etag or last_modified:
+            upstream_validators.set(url, (etag, last_modified, text))
+    return status_code, text
+
+def conditional_get(url):
+    """GET an upstream URL, revalidating the last answer; returns (status_code, text)"""
+    response = upstream_get(url, conditional_headers(url))
+    return resolve_conditional(url, response.status_code, response.text, response.headers)
+
+def upstream_url(station_ids, extra=()):
+    """Return the upstream URL for the METARs of station_ids.
+
+    Bundled products, and those named in extra, are asked for in the same
+    request, so their reports come back along with the METARs.
+    """
+    url = f"{METAR_API_URL}?ids={','.join(station_ids)}"
+    for name in dict.fromkeys(BUNDLED_PRODUCTS + list(extra)):
+        product = products.get(name)
+        if product is not None:
+            url += f"&{product.query}"
+    return url
+
+def single_metar(station_id, text):
+    """Return the METAR in a one-station upstream answer, caching any products that came along"""
+    if not BUNDLED_PRODUCTS:
+        return text.strip()
+    reports = split_reports(text)
+    store_products(reports)
+    return reports['metar'].get(station_id)
+
 def fetch_metar(station_id):
     """Fetch METAR data from aviationweather.gov API"""
-    url = f"https://aviationweather.gov/api/data/metar?ids={station_id}"
+    url = upstream_url([station_id])
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text.strip()
+        status_code, text = conditional_get(url)
+        if status_code == 200:
+            metar_data = single_metar(station_id, text)
+            record_fetched([metar_data])
+            publish_changes({station_id: metar_data})
+            return metar_data
         else:
             return None
     except Exception as e:
         return None
 
-def decode_metar(metar_text):
-    """Decode METAR text into plain English"""
-    if not metar_text:
-        return "Unable to fetch METAR data"
-    
-    # Parse basic elements
-    parts = metar_text.split()
-    
-    # Extract station ID (first element should be station code)
-    station_id = "Unknown"
-    start_index = 0
-    
-    # Check if first element is METAR or SPECI (report type)
-    if parts[0] in ["METAR", "SPECI"] and len(parts) > 1:
-        station_id = parts[1]
-        start_index = 1
-    elif parts[0] not in ["METAR", "SPECI"]:
-        station_id = parts[0]
-        start_index = 0
-    
-    # Extract date/time (element after station ID)
-    datetime = parts[start_index + 1] if len(parts) > start_index + 1 else "Unknown"
-    day = datetime[:2] if len(datetime) >= 2 else "Unknown"
-    time = datetime[2:6] if len(datetime) >= 6 else "Unknown"
-    
-    # Extract wind information
-    wind_info = "Calm"
-    for i in range(start_index + 2, len(parts)):
-        part = parts[i]
-        if re.match(r'^\d{3}\d{2}(?:G\d{2})?(?:KT|MPS|KMH)$', part):
-            wind_dir = part[:3]
-            wind_speed = part[3:5]
-            gust = ""
-            if 'G' in part:
-                gust_start = part.find('G')
-                gust = f" gusting to {part[gust_start+1:gust_start+3]} knots"
-            
-            # Convert wind direction to compass direction
-            if wind_dir == "000":
-                direction = "Calm"
-            elif wind_dir == "VRB":
-                direction = "Variable"
+def fetch_reports(station_ids, extra=()):
+    """Fetch METARs, and products riding along, for several stations in one upstream request.
+
+    Product reports are cached as they arrive. Returns {product name:
+    {station_id: report}} with the METARs under 'metar', or None if the
+    request failed.
+    """
+    url = upstream_url(station_ids, extra)
+    try:
+        status_code, text = conditional_get(url)
+    except Exception:
+        return None
+    # The API answers 204 when none of the stations has a report
+    if status_code == 204:
+        text = ''
+    elif status_code != 200:
+        return None
+    reports = split_reports(text)
+    store_products(reports)
+    record_fetched(reports['metar'].values())
+    publish_changes(reports['metar'])
+    return reports
+
+def fetch_metar_batch(station_ids):
+    """Fetch METAR data for several stations in one upstream request.
+
+    Returns a {station_id: metar} dict, or None if the request failed.
+    """
+    reports = fetch_reports(station_ids)
+    return None if reports is None else reports['metar']
+
+def publish_changes(metars):
+    """Count fetched reports as updated or unchanged and pass on the updated ones.
+
+    A report is unchanged when its text, observation time included, is the
+    one last fetched for the station. Updated reports are decoded into the
+    memo once and handed to every change listener as {station_id: metar}.
+    Returns the updated reports.
+    """
+    updated = {}
+    for station_id, metar_data in metars.items():
+        if not metar_data:
+            continue
+        if last_reports.get(station_id) == metar_data:
+            polls.inc(result='unchanged')
+            continue
+        polls.inc(result='updated')
+        last_reports.set(station_id, metar_data)
+        parse_metar_cached(metar_data)
+        updated[station_id] = metar_data
+    if updated:
+        for listener in list(change_listeners):
+            try:
+                listener(updated)
+            except Exception:
+                pass
+    return updated
+
+def record_fetched(metars):
+    """Queue freshly fetched reports for the history store, if enabled"""
+    if history_store is not None:
+        for metar_data in metars:
+            if metar_data:
+                history_store.append(metar_data)
+
+def split_reports(text):
+    """Split an upstream answer into {product name: {station_id: report}}.
+
+    METARs take one line each and are filed under 'metar'. A line that
+    starts with a product keyword, such as TAF, begins a report of that
+    product, and the indented or change group lines after it continue
+    it; the report is joined into one line. The first (most recent)
+    report per station and product is kept.
+    """
+    reports = {name: {} for name in ['metar', *products]}
+    keywords = {product.keyword: product for product in products.values()}
+    current = None
+    for line in text.splitlines():
+        parts = line.split(None, 2)
+        if not parts:
+            current = None
+            continue
+        if current is not None and (line[0].isspace() or current[0].continuation.match(parts[0])):
+            current[2].append(line.strip())
+            continue
+        if current is not None:
+            reports[current[0].name].setdefault(current[1], ' '.join(current[2]))
+            current = None
+
+        product = keywords.get(parts[0])
+        if product is not None:
+            words = line.split()
+            station_ids = [word for word in words[1:] if word not in REPORT_MODIFIERS]
+            if station_ids:
+                current = (product, station_ids[0], [line.strip()])
+            continue
+        if parts[0] in ["METAR", "SPECI"] and len(parts) > 1:
+            station_id = parts[1]
+        else:
+            station_id = parts[0]
+        # Keep the first (most recent) report per station
+        reports['metar'].setdefault(station_id, line.strip())
+    if current is not None:
+        reports[current[0].name].setdefault(current[1], ' '.join(current[2]))
+    return reports
+
+def split_metars(text):
+    """Split a multi-station upstream response into {station_id: metar}"""
+    return split_reports(text)['metar']
+
+def store_products(reports):
+    """Cache the product reports of an upstream answer, by product and station"""
+    for name, product in products.items():
+        for station_id, report in reports.get(name, {}).items():
+            product.cache.set(station_id, report)
+
+def chunk_stations(station_ids, max_size):
+    """Split station IDs into the fewest evenly sized chunks of at most max_size"""
+    count = math.ceil(len(station_ids) / max_size)
+    size = math.ceil(len(station_ids) / count)
+    return [station_ids[i:i + size] for i in range(0, len(station_ids), size)]
+
+def shared_get(station_ids):
+    """Return {station_id: (metar, seconds left)} from the shared cache, empty if it fails"""
+    try:
+        return shared_cache.get_many(station_ids)
+    except CacheBackendError:
+        return {}
+
+def shared_set(metars):
+    """Write fetched reports to the shared cache, ignoring failures"""
+    try:
+        shared_cache.set_many(metars, metar_cache.ttl)
+    except CacheBackendError:
+        pass
+
+def load_metar(station_id):
+    """Load a station missing from the local cache, through the shared cache.
+
+    Another worker may have fetched it already. If not, the worker that
+    takes the station's lease fetches it upstream while the others wait
+    for the lease and then read its result. Entries from the shared cache
+    are kept locally only for the time they have left there. A failing
+    shared cache falls back to fetching upstream.
+    """
+    if shared_cache is None:
+        return fetch_metar(station_id)
+    cached = shared_get([station_id]).get(station_id)
+    if cached is None:
+        try:
+            with shared_cache.lock(station_id, SHARED_LOCK_LEASE, SHARED_LOCK_WAIT):
+                cached = shared_get([station_id]).get(station_id)
+                if cached is None:
+                    metar_data = fetch_metar(station_id)
+                    if metar_data:
+                        shared_set({station_id: metar_data})
+                    return metar_data
+        except CacheBackendError:
+            return fetch_metar(station_id)
+    metar_data, ttl = cached
+    metar_cache.set(station_id, metar_data, ttl=ttl)
+    return metar_data
+
+def get_metar_cached(station_id):
+    """Fetch METAR data through the cache, coalescing concurrent misses"""
+    return metar_cache.get_or_load(station_id, load_metar)
+
+def stale_metar(station_id):
+    """Return the last report fetched for a station, to serve when a fresh one can't be had"""
+    metar_data = last_reports.get(station_id)
+    if metar_data:
+        stale_served.inc()
+    return metar_data
+
+def fill_stale(metars, errors):
+    """Move failed stations with a last known report from errors into metars.
+
+    Returns the set of stations that are now served stale.
+    """
+    stale = set()
+    for station_id in list(errors):
+        metar_data = stale_metar(station_id)
+        if metar_data:
+            metars[station_id] = metar_data
+            del errors[station_id]
+            stale.add(station_id)
+    return stale
+
+def get_metars_cached(station_ids):
+    """Fetch METAR data for many stations through the cache.
+
+    Stations missing from the cache are fetched in concurrent chunked
+    upstream requests. Returns ({station_id: metar}, {station_id: error}).
+    """
+    metars = {}
+    missing = []
+    for station_id in station_ids:
+        metar_data = metar_cache.get(station_id)
+        if metar_data:
+            metars[station_id] = metar_data
+        else:
+            missing.append(station_id)
+
+    if missing and shared_cache is not None:
+        for station_id, (metar_data, ttl) in shared_get(missing).items():
+            metar_cache.set(station_id, metar_data, ttl=ttl)
+            metars[station_id] = metar_data
+        missing = [station_id for station_id in missing if station_id not in metars]
+
+    if not missing:
+        return metars, {}
+
+    fetched, errors = refresh_metars(missing)
+    metars.update(fetched)
+    return metars, errors
+
+def refresh_metars(station_ids):
+    """Fetch stations upstream in concurrent chunks and cache the results.
+
+    Returns ({station_id: metar}, {station_id: error}).
+    """
+    metars = {}
+    errors = {}
+    chunks = chunk_stations(station_ids, BATCH_CHUNK_SIZE)
+    for chunk, fetched in zip(chunks, batch_executor.map(fetch_metar_batch, chunks)):
+        for station_id in chunk:
+            if fetched is None:
+                errors[station_id] = f'Unable to fetch METAR data for {station_id}'
+            elif station_id not in fetched:
+                errors[station_id] = f'No METAR data found for {station_id}'
             else:
-                wind_deg = int(wind_dir)
-                if (338 <= wind_deg <= 360) or (0 <= wind_deg <= 22):
-                    direction = "North"
-                elif 23 <= wind_deg <= 67:
-                    direction = "Northeast"
-                elif 68 <= wind_deg <= 112:
-                    direction = "East"
-                elif 113 <= wind_deg <= 157:
-                    direction = "Southeast"
-                elif 158 <= wind_deg <= 202:
-                    direction = "South"
-                elif 203 <= wind_deg <= 247:
-                    direction = "Southwest"
-                elif 248 <= wind_deg <= 292:
-                    direction = "West"
-                elif 293 <= wind_deg <= 337:
-                    direction = "Northwest"
-                else:
-                    direction = f"{wind_deg} degrees"
-            
-            wind_info = f"{direction} at {int(wind_speed)} knots{gust}"
-            break
-    
-    # Extract visibility
-    visibility = "Unknown"
-    for i in range(start_index + 2, len(parts)):
-        part = parts[i]
-        # Handle visibility in meters
-        if re.match(r'^\d{4}$', part) and int(part) < 9999:
-            # Meters visibility
-            meters = int(part)
-            miles = meters / 1609.34
-            visibility = f"{miles:.1f} miles"
-            break
-        # Handle fractional visibility in statute miles
-        elif re.match(r'^\d/\d(?:SM)?$', part):
-            if part.endswith("SM"):
-                # Statute miles
-                vis_value = part[:-2]
-                visibility = f"{vis_value} statute miles"
+                metar_cache.set(station_id, fetched[station_id])
+                metars[station_id] = fetched[station_id]
+    if shared_cache is not None:
+        shared_set(metars)
+    return metars, errors
+
+def shared_fresh(station_ids, fresh_for):
+    """Return {station_id: metar} for the stations the shared cache holds for more than fresh_for seconds.
+
+    They are cached locally for the time they have left and published as
+    if fetched, so this worker's stream subscribers see them too.
+    """
+    fresh = {}
+    for station_id, (metar_data, ttl) in shared_get(station_ids).items():
+        if ttl > fresh_for:
+            metar_cache.set(station_id, metar_data, ttl=ttl)
+            fresh[station_id] = metar_data
+    publish_changes(fresh)
+    return fresh
+
+def refresh_background(station_ids, fresh_for):
+    """Refresh stations for the prefetcher or the stream poll, once across workers.
+
+    Every worker runs its own background refreshes. With a shared cache,
+    stations it still holds for more than fresh_for seconds were refreshed
+    by another worker and are read from there. The rest are fetched under
+    one lease, so workers whose cycles coincide take turns, and the one
+    that waited reads what the other fetched instead of fetching it again.
+    Returns ({station_id: metar}, {station_id: error}) like refresh_metars.
+    """
+    if shared_cache is None:
+        return refresh_metars(station_ids)
+    metars = shared_fresh(station_ids, fresh_for)
+    missing = [station_id for station_id in station_ids if station_id not in metars]
+    if not missing:
+        return metars, {}
+    try:
+        with shared_cache.lock(REFRESH_LEASE_KEY, SHARED_LOCK_LEASE, SHARED_LOCK_WAIT):
+            metars.update(shared_fresh(missing, fresh_for))
+            missing = [station_id for station_id in missing if station_id not in metars]
+            fetched, errors = refresh_metars(missing) if missing else ({}, {})
+    except CacheBackendError:
+        fetched, errors = refresh_metars(missing)
+    metars.update(fetched)
+    return metars, errors
+
+class Product:
+    """A kind of upstream report fetched along with METARs, such as TAF.
+
+    keyword starts the product's reports in an upstream answer, query is
+    the parameter asking the upstream for them and parse turns one report
+    into an object with render() and to_dict(). Reports are cached per
+    station in cache and decoded once through memo.
+    """
+
+    def __init__(self, name, keyword, query, parse, cache, continuation, memo_size=1024):
+        self.name = name
+        self.keyword = keyword
+        self.query = query
+        self.parse = parse
+        self.cache = cache
+        self.continuation = continuation
+        self.memo = TTLCache(maxsize=memo_size, ttl=None)
+
+    def decode(self, report):
+        """Parse a report through the memo; None if it can't be decoded"""
+        decoded = self.memo.get(report)
+        if decoded is None:
+            decoded = self.parse(report)
+            if decoded is not None:
+                self.memo.set(report, decoded)
+        return decoded
+
+def register_product(product):
+    """Make a product available to upstream fetches and lookups"""
+    products[product.name] = product
+    return product
+
+taf = register_product(Product('taf', 'TAF', 'taf=true', parse_taf, taf_cache, TAF_CONTINUATION_PATTERN))
+
+def cache_metars(metars):
+    """Keep METARs that came with a product fetch in the local cache"""
+    for station_id, metar_data in metars.items():
+        metar_cache.set(station_id, metar_data)
+
+def cached_reports(product, station_ids):
+    """Return ({station_id: report} found in the product's cache, [stations missing])"""
+    reports = {}
+    missing = []
+    for station_id in station_ids:
+        report = product.cache.get(station_id)
+        if report:
+            reports[station_id] = report
+        else:
+            missing.append(station_id)
+    return reports, missing
+
+def collect_reports(product, chunks, fetched_chunks):
+    """Sort product fetches by chunk into ({station_id: report}, {station_id: error}).
+
+    The METARs that came along are cached too, so a product lookup also
+    refreshes the stations' METARs.
+    """
+    label = product.keyword
+    reports = {}
+    errors = {}
+    for chunk, fetched in zip(chunks, fetched_chunks):
+        if fetched is not None:
+            cache_metars(fetched['metar'])
+        for station_id in chunk:
+            if fetched is None:
+                errors[station_id] = f'Unable to fetch {label} data for {station_id}'
+            elif station_id not in fetched[product.name]:
+                errors[station_id] = f'No {label} data found for {station_id}'
             else:
-                visibility = f"{part} statute miles"
-            break
-        # Handle whole number or mixed number visibility
-        elif re.match(r'^\d+(?:\s\d/\d)?SM$', part):
-            # Statute miles
-            vis_value = part[:-2]
-            visibility = f"{vis_value} statute miles"
-            break
-        elif part == "CAVOK":
-            visibility = "Greater than 6 statute miles (Cloud and Visibility OK)"
-            break
-    
-    # Extract weather conditions
-    weather_conditions = []
-    weather_codes = {
-        '-': 'Light',
-        '+': 'Heavy',
-        'VC': 'In the vicinity',
-        'MI': 'Shallow',
-        'PR': 'Partial',
-        'BC': 'Patches',
-        'DR': 'Low drifting',
-        'BL': 'Blowing',
-        'SH': 'Showers',
-        'TS': 'Thunderstorm',
-        'FZ': 'Freezing',
-        'DZ': 'Drizzle',
-        'RA': 'Rain',
-        'SN': 'Snow',
-        'SG': 'Snow grains',
-        'IC': 'Ice crystals',
-        'PL': 'Ice pellets',
-        'GR': 'Hail',
-        'GS': 'Small hail',
-        'UP': 'Unknown precipitation',
-        'BR': 'Mist',
-        'FG': 'Fog',
-        'FU': 'Smoke',
-        'VA': 'Volcanic ash',
-        'DU': 'Dust',
-        'SA': 'Sand',
-        'HZ': 'Haze',
-        'PY': 'Spray',
-        'PO': 'Dust whirls',
-        'SQ': 'Squalls',
-        'FC': 'Funnel cloud/tornado',
-        'SS': 'Sandstorm'
+                reports[station_id] = fetched[product.name][station_id]
+    return reports, errors
+
+def load_report(product, station_id):
+    """Fetch one station's product report with its METAR, or None"""
+    fetched = fetch_reports([station_id], (product.name,))
+    if fetched is None:
+        return None
+    cache_metars(fetched['metar'])
+    return fetched[product.name].get(station_id)
+
+def get_report_cached(product, station_id):
+    """Fetch one station's product report through its cache, coalescing concurrent misses"""
+    return product.cache.get_or_load(station_id, lambda station_id: load_report(product, station_id))
+
+def get_reports_cached(product, station_ids):
+    """Fetch a product's reports for many stations through its cache.
+
+    Misses are fetched with their METARs in concurrent chunked upstream
+    requests, the same ones METAR lookups make. Returns ({station_id:
+    report}, {station_id: error}).
+    """
+    reports, missing = cached_reports(product, station_ids)
+    if not missing:
+        return reports, {}
+    chunks = chunk_stations(missing, BATCH_CHUNK_SIZE)
+    fetched_chunks = batch_executor.map(lambda chunk: fetch_reports(chunk, (product.name,)), chunks)
+    fetched, errors = collect_reports(product, chunks, fetched_chunks)
+    reports.update(fetched)
+    return reports, errors
+
+def report_result(product, report, structured=False):
+    """Build the JSON result for one raw product report"""
+    decoded = product.decode(report)
+    result = {
+        f'raw_{product.name}': report,
+        'decoded_report': decoded.render() if decoded is not None else f'Unable to decode {product.keyword}',
     }
-    
-    # Look for weather condition codes in the METAR
-    for i in range(start_index + 2, len(parts)):
-        part = parts[i]
-        # Skip parts that are clearly not weather codes
-        if re.match(r'^\d{3}\d{2}(?:G\d{2})?(?:KT|MPS|KMH)$', part) or \
-           re.match(r'^\d{4}$', part) or \
-           re.match(r'^\d+SM$', part) or \
-           part.startswith('A') or part.startswith('Q') or \
-           '/' in part:
-            continue
-            
-        # Check if this part contains weather codes
-        matched_conditions = []
-        temp_part = part
-        
-        # Handle intensity modifiers
-        if temp_part.startswith('-'):
-            matched_conditions.append('Light')
-            temp_part = temp_part[1:]
-        elif temp_part.startswith('+'):
-            matched_conditions.append('Heavy')
-            temp_part = temp_part[1:]
-        
-        # Process weather codes
-        while temp_part:
-            found = False
-            # Try to match longer codes first
-            for length in [4, 3, 2]:
-                if len(temp_part) >= length:
-                    code = temp_part[:length]
-                    if code in weather_codes:
-                        matched_conditions.append(weather_codes[code])
-                        temp_part = temp_part[length:]
-                        found = True
-                        break
-            if not found and len(temp_part) >= 2:
-                code = temp_part[:2]
-                if code in weather_codes:
-                    matched_conditions.append(weather_codes[code])
-                    temp_part = temp_part[2:]
-                    found = True
-            if not found:
-                # Skip unrecognized characters
-                temp_part = temp_part[1:] if temp_part else ""
-        
-        if matched_conditions:
-            weather_conditions.append(' '.join(matched_conditions))
-    
-    # Extract sky conditions
-    sky_conditions = []
-    sky_codes = {
-        'SKC': 'Sky clear',
-        'NCD': 'No clouds detected',
-        'CLR': 'Clear',
-        'NSC': 'No significant clouds',
-        'FEW': 'Few clouds',
-        'SCT': 'Scattered clouds',
-        'BKN': 'Broken clouds',
-        'VV': 'Vertical visibility',
-        'OVC': 'Overcast'
+    if structured and decoded is not None:
+        result['decoded'] = decoded.to_dict()
+    return result
+
+def product_results(product, station_ids, reports, errors, structured=False):
+    """Build the batch body of a product lookup, results in the requested order"""
+    results = {
+        station_id: report_result(product, reports[station_id], structured)
+        for station_id in station_ids if station_id in reports
     }
-    
-    for i in range(start_index + 2, len(parts)):
-        part = parts[i]
-        if 'CLR' in part:
-            sky_conditions.append('Clear')
-            break
-        for code, description in sky_codes.items():
-            if part.startswith(code):
-                if code in ['FEW', 'SCT', 'BKN', 'OVC'] and len(part) > 3:
-                    # Extract altitude information
-                    altitude = part[3:]
-                    if altitude.isdigit():
-                        feet = int(altitude) * 100
-                        sky_conditions.append(f"{description} at {feet} feet")
-                    else:
-                        sky_conditions.append(description)
-                elif code in ['VV'] and len(part) > 2:
-                    # Extract vertical visibility
-                    vv = part[2:]
-                    if vv.isdigit():
-                        feet = int(vv) * 100
-                        sky_conditions.append(f"Vertical visibility {feet} feet")
-                    else:
-                        sky_conditions.append(description)
-                else:
-                    sky_conditions.append(description)
-                break
-    
-    # Extract temperature/dewpoint
-    temp_dewpoint = "Unknown"
-    for i in range(start_index + 2, len(parts)):
-        part = parts[i]
-        if '/' in part and len(part) >= 3 and len(part) <= 7:
-            # Check if it looks like temperature/dewpoint
-            if 'M' in part or part.replace('/', '').replace('M', '').isdigit():
-                # Handle potential temperature/dewpoint
-                if '/' in part:
-                    temp_part, dew_part = part.split('/')
-                    try:
-                        # Handle negative temperatures (M prefix)
-                        temp = int(temp_part.replace('M', '-')) if temp_part else 0
-                        dew = int(dew_part.replace('M', '-')) if dew_part else 0
-                        temp_dewpoint = f"Temperature {temp}°C, Dewpoint {dew}°C"
-                        break
-                    except:
-                        continue
-    
-    # Extract altimeter (pressure)
-    altimeter = "Unknown"
-    for i in range(start_index + 2, len(parts)):
-        part = parts[i]
-        if part.startswith('A') and len(part) == 5 and part[1:].isdigit():
-            # Inches of mercury
-            alt_value = int(part[1:]) / 100
-            altimeter = f"Altimeter {alt_value:.2f} inches of mercury"
-            break
-        elif part.startswith('Q') and len(part) == 5 and part[1:].isdigit():
-            # Hectopascals
-            alt_value = int(part[1:])
-            altimeter = f"Altimeter {alt_value} hectopascals"
-            break
-    
-    # Create friendly readable report
-    report_lines = []
-    report_lines.append(f"Weather report for {station_id}")
-    report_lines.append(f"Day {day} at {time[:2]}:{time[2:]} UTC")
-    
-    # Wind information
-    report_lines.append(f"Wind: {wind_info}")
-        
-    # Visibility
-    if visibility != "Unknown":
-        report_lines.append(f"Visibility: {visibility}")
-        
-    # Weather conditions
-    if weather_conditions:
-        report_lines.append(f"Weather: {', '.join(weather_conditions)}")
-    elif sky_conditions:
-        report_lines.append(f"Sky: {', '.join(sky_conditions)}")
+    return {'results': results, 'errors': errors}
+
+def serialized_result(station_id, metar_data, structured=False, stale=False):
+    """Return (JSON bytes, ETag digest, observed epoch or None) for a /metar result.
+
+    Each combination of station, report, format and staleness is decoded
+    and serialized once; the ETag is a digest of those exact bytes.
+    """
+    key = (station_id, metar_data, structured, stale)
+    entry = response_memo.get(key)
+    if entry is None:
+        with stage_seconds.time(stage='decode'):
+            result = metar_result(metar_data, structured)
+        result['station_id'] = station_id
+        if stale:
+            result['stale'] = True
+        with stage_seconds.time(stage='response'):
+            body = (app.json.dumps(result) + '\n').encode()
+        decoded = parse_metar_cached(metar_data)
+        observed = None
+        if decoded is not None and decoded.day and decoded.time:
+            observed = observation_time(decoded.day, decoded.time, datetime.now(timezone.utc))
+        entry = (body, hashlib.blake2b(body, digest_size=16).hexdigest(), observed and observed.timestamp())
+        response_memo.set(key, entry)
+    return entry
+
+def report_max_age(observed, now=None):
+    """Seconds until a station's next routine report is due, within MAX_AGE_MIN..MAX_AGE"""
+    if observed is None:
+        return MAX_AGE_MIN
+    due = observed + REPORT_INTERVAL + REPORT_DELAY - (time.time() if now is None else now)
+    return int(max(MAX_AGE_MIN, min(MAX_AGE, due)))
+
+def cache_headers(etag, observed, stale=False):
+    """Return the ETag and Cache-Control headers of a /metar response"""
+    cache_control = 'no-cache' if stale else f'public, max-age={report_max_age(observed)}'
+    return {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+
+def normalize_station_ids(station_ids):
+    """Turn a list or comma-separated string of station IDs into a clean list.
+
+    IDs are uppercased and duplicates dropped, keeping the requested order.
+    """
+    if isinstance(station_ids, str):
+        station_ids = station_ids.replace(',', ' ').split()
+    elif not isinstance(station_ids, (list, tuple)):
+        return []
+    return list(dict.fromkeys(str(s).strip().upper() for s in station_ids if str(s).strip()))
+
+def station_error(station_id):
+    """Return why a station ID is refused without an upstream request, or None"""
+    if STATION_VALIDATION == 'off':
+        return None
+    if not valid_station_id(station_id):
+        error = f'{station_id} is not an ICAO station ID'
+    elif STATION_VALIDATION == 'catalog' and station_id not in station_catalog:
+        error = f'Unknown station ID {station_id}'
     else:
-        report_lines.append("Sky: Clear")
-        
-    # Temperature/Dewpoint
-    if temp_dewpoint != "Unknown":
-        report_lines.append(temp_dewpoint)
-        
-    # Altimeter
-    if altimeter != "Unknown":
-        report_lines.append(altimeter)
-        
-    return "\n".join(report_lines)
+        return None
+    stations_rejected.inc()
+    return error
+
+def reject_stations(station_ids):
+    """Split station IDs into those worth fetching and {station_id: error} for the rest"""
+    accepted, rejected = [], {}
+    for station_id in station_ids:
+        error = station_error(station_id)
+        if error:
+            rejected[station_id] = error
+        else:
+            accepted.append(station_id)
+    return accepted, rejected
+
+def nearby_stations(values):
+    """Return [(Station, km)] for a /metar/nearby query, closest first.
+
+    The center is lat/lon or a catalog station_id. k caps the stations
+    returned and radius (km) bounds their distance; with only a radius,
+    every station within it is returned, up to NEARBY_MAX_STATIONS.
+    Raises ValueError with a message for the client on bad parameters.
+    """
+    station_id = values.get('station_id', '').upper()
+    center = station_catalog.get(station_id) if station_id else None
+    if station_id and center is None:
+        raise ValueError(f'Unknown station ID {station_id}')
+    try:
+        lat, lon = (center.lat, center.lon) if center else (float(values.get('lat', '')), float(values.get('lon', '')))
+        radius = float(values['radius']) if values.get('radius') else None
+        k = int(values.get('k') or (NEARBY_MAX_STATIONS if radius is not None else NEARBY_DEFAULT_STATIONS))
+    except ValueError:
+        raise ValueError('Please give a lat and lon or a station_id, with a numeric k or radius') from None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat must be within -90..90 and lon within -180..180')
+    if k < 1 or (radius is not None and not radius >= 0):
+        raise ValueError('k must be positive and radius not negative')
+    return station_catalog.nearest(lat, lon, min(k, NEARBY_MAX_STATIONS), radius)
+
+def nearby_results(nearby, metars, errors, structured=False):
+    """Build the /metar/nearby body from nearby stations and their batch lookup"""
+    stale = fill_stale(metars, errors)
+    stations = []
+    results = {}
+    for station, distance in nearby:
+        stations.append({'station_id': station.station_id, 'name': station.name, 'lat': station.lat,
+                         'lon': station.lon, 'distance_km': round(distance, 1)})
+        if station.station_id in metars:
+            results[station.station_id] = metar_result(metars[station.station_id], structured)
+            if station.station_id in stale:
+                results[station.station_id]['stale'] = True
+    return {'stations': stations, 'results': results, 'errors': errors}
+
+def metar_result(metar_data, structured=False):
+    """Build the JSON result for one raw METAR"""
+    decoded = parse_metar_cached(metar_data)
+    result = {
+        'raw_metar': metar_data,
+        'decoded_report': decoded.render()
+    }
+
+    # Structured fields for API consumers
+    if structured:
+        result['decoded'] = decoded.to_dict()
+    return result
+
+# Keeps popular stations cached by refreshing them ahead of expiry
+prefetcher = PrefetchScheduler(
+    refresh=lambda station_ids: refresh_background(station_ids, prefetcher.lead),
+    ttl=metar_cache.ttl,
+    stations=normalize_station_ids(os.environ.get('METAR_PREFETCH_STATIONS', '')),
+    top_n=int(os.environ.get('METAR_PREFETCH_TOP_N', 0)),
+    lead=float(os.environ.get('METAR_PREFETCH_LEAD', 60)),
+    jitter=float(os.environ.get('METAR_PREFETCH_JITTER', 15)),
+)
+
+# Pushes new reports to /metar/stream subscribers from one shared poll
+STREAM_HEARTBEAT = float(os.environ.get('METAR_STREAM_HEARTBEAT', 15))
+stream_hub = StreamHub(
+    refresh=lambda station_ids: refresh_background(station_ids, metar_cache.ttl - stream_hub.interval),
+    interval=float(os.environ.get('METAR_STREAM_INTERVAL', 60)),
+    queue_size=int(os.environ.get('METAR_STREAM_QUEUE_SIZE', 32)),
+    max_subscribers=int(os.environ.get('METAR_STREAM_MAX_SUBSCRIBERS', 1000)),
+)
+change_listeners.append(stream_hub.publish)
+metrics.callback('metar_stream_subscribers', 'Connected /metar/stream subscribers', stream_hub.subscriber_count)
+metrics.callback('metar_stream_published_total', 'Reports queued for stream subscribers',
+                 lambda: stream_hub.published, 'counter')
+metrics.callback('metar_stream_dropped_total', 'Queued reports dropped or replaced before a slow subscriber read them',
+                 stream_hub.dropped_total, 'counter')
+
+def stream_request_error(station_ids):
+    """Return an error body and status if a /metar/stream request can't be served, or None"""
+    if serving['draining']:
+        return {'error': 'Server is shutting down, try again'}, 503
+    if not station_ids:
+        return {'error': 'Please enter at least one station ID'}, 400
+    if len(station_ids) > BATCH_MAX_STATIONS:
+        return {'error': f'At most {BATCH_MAX_STATIONS} station IDs per request'}, 400
+    return None
+
+@lru_cache(maxsize=1024)
+def stream_event(station_id, metar_data, structured):
+    """Format one report as a server-sent event, serialized once for all subscribers"""
+    result = metar_result(metar_data, structured)
+    result['station_id'] = station_id
+    return f"event: metar\ndata: {json.dumps(result)}\n\n"
+
+def stream_chunk(pending, sent, structured, errors=None):
+    """Return the events for pending (station_id, metar) pairs not sent yet.
+
+    sent maps each station to the last report sent and is updated.
+    """
+    events = []
+    for station_id, error in (errors or {}).items():
+        events.append(f"event: error\ndata: {json.dumps({'station_id': station_id, 'error': error})}\n\n")
+    for station_id, metar_data in pending:
+        if sent.get(station_id) != metar_data:
+            sent[station_id] = metar_data
+            events.append(stream_event(station_id, metar_data, structured))
+    return ''.join(events)
+
+def stream_events(subscription, metars, errors, structured):
+    """Yield server-sent events: the current reports, then each new one.
+
+    A comment is sent after STREAM_HEARTBEAT idle seconds so proxies keep
+    the connection open and a disconnected client is noticed on the write.
+    """
+    sent = {}
+    try:
+        chunk = stream_chunk(metars.items(), sent, structured, errors)
+        while not subscription.closed:
+            yield chunk or ': keepalive\n\n'
+            chunk = stream_chunk(subscription.get(STREAM_HEARTBEAT), sent, structured)
+    finally:
+        stream_hub.unsubscribe(subscription)
+
+def health_status():
+    """Return the /health body and status code from recent upstream outcomes"""
+    upstream_state = upstream_health.state()
+    upstream_state['breaker'] = upstream_breaker.snapshot()
+    if serving['draining']:
+        return {'status': 'draining', 'upstream': upstream_state}, 503
+    # An open breaker sends no requests, so reachable keeps its last value for
+    # the whole outage. Stale reports still answer /metar then, and a 503 would
+    # pull every instance out of rotation for an upstream-wide failure.
+    if upstream_breaker.state != CircuitBreaker.CLOSED or upstream_state['reachable'] is False:
+        if len(last_reports) == 0:
+            return {'status': 'unhealthy', 'upstream': upstream_state}, 503
+        return {'status': 'degraded', 'upstream': upstream_state}, 200
+    if upstream_state['error_rate'] > HEALTH_MAX_ERROR_RATE:
+        return {'status': 'degraded', 'upstream': upstream_state}, 200
+    return {'status': 'healthy', 'upstream': upstream_state}, 200
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g:
+        request_seconds.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    api_requests.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+# Optional on-disk log of every fetched report, behind /metar/history
+METAR_STORE_PATH = os.environ.get('METAR_STORE_PATH', '')
+HISTORY_MAX_LIMIT = int(os.environ.get('METAR_HISTORY_MAX_LIMIT', 1000))
+history_store = ObservationStore(METAR_STORE_PATH, parse_metar) if METAR_STORE_PATH else None
+
+def warm_cache():
+    """Cache the stored reports still within the cache TTL, returning how many"""
+    now = time.time()
+    recent = history_store.recent(now - metar_cache.ttl)
+    for station_id, metar_data, fetched_at in recent:
+        metar_cache.set(station_id, metar_data, ttl=metar_cache.ttl - (now - fetched_at))
+    return len(recent)
+
+if history_store is not None:
+    atexit.register(history_store.close)
+    warm_cache()
+
+# Production serving lifecycle, driven by the hooks in gunicorn.conf.py
+serving = {'preload_seconds': None, 'first_metar_seconds': None, 'draining': False}
+metrics.callback('metar_preload_seconds', 'Seconds spent warming decode tables before serving, 0 if not preloaded',
+                 lambda: serving['preload_seconds'] or 0)
+metrics.callback('metar_cold_start_seconds', 'Seconds from process start to the first served /metar, 0 until then',
+                 lambda: serving['first_metar_seconds'] or 0)
+
+# Samples covering every decode stage, run through the decoder by preload()
+PRELOAD_REPORTS = [
+    "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987",
+    "KJFK 141251Z 31010G22KT 1 1/2SM -SHRA BR FEW008 BKN015CB OVC030 M02/M03 A3001 RMK AO2",
+    "EGLL 141250Z 24015G25KT 9999 CAVOK 12/05 Q1021 NOSIG",
+    "LFPG 141300Z VRB02KT 0800 R27L/1000N +TSRAGR VV002 M05/M06 Q0998 RERA TEMPO 3000",
+    "SPECI PAFA 141316Z AUTO 00000MPS 1/4SM FZFG SCT001 M40/M42 A3050",
+]
+
+def preload():
+    """Build decode tables and templates once, before workers fork.
+
+    Fills the sky and weather group caches with the common groups and runs
+    sample reports through every decode stage, so forked workers share the
+    warmed state copy-on-write instead of each paying for it on their
+    first requests. Returns the seconds taken.
+    """
+    start = time.perf_counter()
+    for cover in ('FEW', 'SCT', 'BKN', 'OVC'):
+        for hundreds in list(range(31)) + list(range(35, 255, 5)):
+            parse_sky(f'{cover}{hundreds:03d}')
+    for code in SKY_CODES:
+        parse_sky(code)
+    for code in WEATHER_CODES:
+        for intensity in ('', '-', '+'):
+            group = intensity + code
+            if parse_weather(group):
+                describe_weather(group)
+    for metar_text in PRELOAD_REPORTS:
+        decoded = parse_metar(metar_text)
+        decoded.render()
+        decoded.to_dict()
+    app.jinja_env.get_template('index.html')
+    serving['preload_seconds'] = round(time.perf_counter() - start, 4)
+    return serving['preload_seconds']
+
+def after_fork():
+    """Restart the per-process state a forked worker does not inherit"""
+    if history_store is not None:
+        history_store.reopen()
+    prefetcher.start()
+
+def drain():
+    """Stop taking long-lived work so in-flight requests can finish.
+
+    /health answers 503 so load balancers stop routing here, new streams
+    are refused and open ones end, leaving the server only the short
+    requests to finish within its graceful timeout. Safe to call from a
+    signal handler.
+    """
+    serving['draining'] = True
+    stream_hub.stop(wait=False)
+
+def shutdown():
+    """Drain, stop the background threads and write out queued history"""
+    drain()
+    prefetcher.stop()
+    stream_hub.stop()
+    if history_store is not None:
+        history_store.close()
+    if shared_cache is not None:
+        shared_cache.close()
+
+def record_served():
+    """Note the time from process start to the first served /metar"""
+    if serving['first_metar_seconds'] is None:
+        serving['first_metar_seconds'] = round(time.time() - PROCESS_STARTED, 4)
+
+def parse_timestamp(value, default):
+    """Parse epoch seconds or an ISO 8601 time (UTC unless given) into epoch seconds"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def metar_history(values):
+    """Return the /metar/history body and status code for request values"""
+    if history_store is None:
+        return {'error': 'Observation history is not enabled'}, 404
+
+    station_id = values.get('station_id', '').upper()
+    if not station_id:
+        return {'error': 'Please enter a station ID'}, 400
+    try:
+        end = parse_timestamp(values.get('end'), time.time())
+        start = parse_timestamp(values.get('start'), end - 86400)
+        limit = min(int(values.get('limit', 100)), HISTORY_MAX_LIMIT)
+    except (TypeError, ValueError):
+        return {'error': 'Invalid start, end or limit'}, 400
+    # SQLite reads a negative LIMIT as no limit at all
+    if limit < 1:
+        return {'error': 'Invalid start, end or limit'}, 400
+
+    structured = values.get('format') == 'json'
+    observations = []
+    for observed_at, metar_data in history_store.history(station_id, start, end, limit):
+        observation = {'observed_at': datetime.fromtimestamp(observed_at, timezone.utc).isoformat()}
+        observation.update(metar_result(metar_data, structured))
+        observations.append(observation)
+    return {'station_id': station_id, 'observations': observations}, 200
+
+def json_payload():
+    """Return the request's JSON body, or {} when it is missing or not a JSON object"""
+    payload = request.get_json(silent=True)
+    # The ASGI app reads bodies the same way, so both answer a list or string with a 400
+    if not isinstance(payload, dict):
+        return {}
+    return payload
 
 @app.route('/')
 def index():
@@ -308,29 +1039,189 @@ def index():
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'healthy'}), 200
+    body, status = health_status()
+    return jsonify(body), status
 
-@app.route('/metar', methods=['POST'])
-def get_metar():
-    station_id = request.form.get('station_id', '').upper()
-    
+@app.route('/stats')
+def stats():
+    stats = {'cache': metar_cache.stats(), 'decode': decode_memo.stats(), 'responses': response_memo.stats(),
+             'taf': taf_cache.stats()}
+    if shared_cache is not None:
+        stats['shared_cache'] = shared_cache.stats()
+    if history_store is not None:
+        stats['history'] = history_store.stats()
+    return jsonify(stats), 200
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/prefetch')
+def prefetch_state():
+    return jsonify(prefetcher.state()), 200
+
+@app.route('/admin/stream')
+def stream_state():
+    return jsonify(stream_hub.state()), 200
+
+@app.route('/admin/decode-profile')
+def decode_profile_endpoint():
+    return jsonify(decode_profile_state(request.args.get('reset') == '1')), 200
+
+def metar_response(station_id, structured):
+    """Serve one station's report, or 304 if the client's ETag is still current"""
     if not station_id:
         return jsonify({'error': 'Please enter a station ID'}), 400
-    
+
+    error = station_error(station_id)
+    if error:
+        return jsonify({'error': error}), 404
+
     # Fetch METAR data
-    metar_data = fetch_metar(station_id)
-    
+    prefetcher.record(station_id)
+    metar_data = get_metar_cached(station_id)
+    stale = not metar_data
+    if stale:
+        metar_data = stale_metar(station_id)
+
     if not metar_data:
         return jsonify({'error': f'Unable to fetch METAR data for {station_id}'}), 404
-    
-    # Decode METAR data
-    decoded_report = decode_metar(metar_data)
-    
-    return jsonify({
-        'station_id': station_id,
-        'raw_metar': metar_data,
-        'decoded_report': decoded_report
-    })
+
+    body, etag, observed = serialized_result(station_id, metar_data, structured, stale)
+    headers = cache_headers(etag, observed, stale)
+    record_served()
+    if request.if_none_match.contains_weak(etag):
+        not_modified.inc()
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+@app.route('/metar', methods=['POST'])
+def get_metar():
+    return metar_response(request.form.get('station_id', '').upper(), request.values.get('format') == 'json')
+
+@app.route('/metar/<station_id>')
+def get_metar_station(station_id):
+    return metar_response(station_id.upper(), request.args.get('format') == 'json')
+
+@app.route('/metar/history', methods=['GET', 'POST'])
+def get_metar_history():
+    body, status = metar_history(request.values)
+    return jsonify(body), status
+
+@app.route('/metar/stream')
+def get_metar_stream():
+    station_ids = normalize_station_ids(request.values.get('station_ids', request.values.get('station_id', '')))
+    error = stream_request_error(station_ids)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Subscribe before reading the cache so no report is missed in between
+    subscription = stream_hub.subscribe(station_ids)
+    if subscription is None:
+        return jsonify({'error': 'Too many stream subscribers, try again later'}), 503
+    try:
+        metars, errors = get_metars_cached(station_ids)
+    except Exception:
+        stream_hub.unsubscribe(subscription)
+        raise
+
+    events = stream_events(subscription, metars, errors, request.values.get('format') == 'json')
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metar/batch', methods=['POST'])
+def get_metar_batch():
+    payload = json_payload()
+    station_ids = payload.get('station_ids')
+    if station_ids is None:
+        station_ids = request.form.get('station_ids', '')
+    station_ids = normalize_station_ids(station_ids)
+
+    if not station_ids:
+        return jsonify({'error': 'Please enter at least one station ID'}), 400
+    if len(station_ids) > BATCH_MAX_STATIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_STATIONS} station IDs per request'}), 400
+
+    station_ids, rejected = reject_stations(station_ids)
+    metars, errors = get_metars_cached(station_ids)
+    stale = fill_stale(metars, errors)
+    errors.update(rejected)
+    structured = request.values.get('format', payload.get('format')) == 'json'
+
+    with stage_seconds.time(stage='decode'):
+        results = {
+            station_id: metar_result(metars[station_id], structured)
+            for station_id in station_ids if station_id in metars
+        }
+        for station_id in stale:
+            results[station_id]['stale'] = True
+    with stage_seconds.time(stage='response'):
+        return jsonify({'results': results, 'errors': errors})
+
+@app.route('/metar/nearby', methods=['GET', 'POST'])
+def get_metar_nearby():
+    try:
+        nearby = nearby_stations(request.values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    station_ids = [station.station_id for station, _ in nearby]
+    metars, errors = get_metars_cached(station_ids)
+    with stage_seconds.time(stage='decode'):
+        body = nearby_results(nearby, metars, errors, request.values.get('format') == 'json')
+    with stage_seconds.time(stage='response'):
+        return jsonify(body)
+
+def taf_response(station_id, structured):
+    """Serve one station's TAF"""
+    if not station_id:
+        return jsonify({'error': 'Please enter a station ID'}), 400
+
+    error = station_error(station_id)
+    if error:
+        return jsonify({'error': error}), 404
+
+    report = get_report_cached(taf, station_id)
+    if not report:
+        return jsonify({'error': f'Unable to fetch TAF data for {station_id}'}), 404
+
+    with stage_seconds.time(stage='decode'):
+        result = report_result(taf, report, structured)
+    result['station_id'] = station_id
+    return jsonify(result), 200
+
+@app.route('/taf', methods=['POST'])
+def get_taf():
+    return taf_response(request.form.get('station_id', '').upper(), request.values.get('format') == 'json')
+
+@app.route('/taf/<station_id>')
+def get_taf_station(station_id):
+    return taf_response(station_id.upper(), request.args.get('format') == 'json')
+
+@app.route('/taf/batch', methods=['POST'])
+def get_taf_batch():
+    payload = json_payload()
+    station_ids = payload.get('station_ids')
+    if station_ids is None:
+        station_ids = request.form.get('station_ids', '')
+    station_ids = normalize_station_ids(station_ids)
+
+    if not station_ids:
+        return jsonify({'error': 'Please enter at least one station ID'}), 400
+    if len(station_ids) > BATCH_MAX_STATIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_STATIONS} station IDs per request'}), 400
+
+    station_ids, rejected = reject_stations(station_ids)
+    reports, errors = get_reports_cached(taf, station_ids)
+    errors.update(rejected)
+    structured = request.values.get('format', payload.get('format')) == 'json'
+    with stage_seconds.time(stage='decode'):
+        body = product_results(taf, station_ids, reports, errors, structured)
+    with stage_seconds.time(stage='response'):
+        return jsonify(body)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # With the debug reloader, only the serving child process should prefetch
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        prefetcher.start()
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,168 @@
+"""Memory-mapped random access to flat METAR archive files.
+
+Archives are plain text files with one raw report per line. ArchiveReader
+maps the file instead of reading it, indexes where every line starts, and
+hands out memoryview slices of the mapping, so lines are only copied into
+Python strings when a caller decodes them.
+
+    with ArchiveReader('archive-2020.txt', persist_index=True) as archive:
+        for line in archive.station('KHIO'):
+            decode_metar(bytes(line).decode())
+"""
+from array import array
+from collections import defaultdict
+import mmap
+import os
+import struct
+import sys
+
+INDEX_MAGIC = b'METARIX1'
+INDEX_HEADER = struct.Struct('<8sQQQ')
+REPORT_TYPES = (b'METAR', b'SPECI')
+
+
+def build_offsets(data):
+    """Return the start offset of every line in data, plus the end of data"""
+    offsets = array('Q', [0])
+    find = data.find
+    position = find(b'\n')
+    while position != -1:
+        offsets.append(position + 1)
+        position = find(b'\n', position + 1)
+    if offsets[-1] != len(data):
+        offsets.append(len(data))
+    return offsets
+
+
+def station_of(line):
+    """Return the station of a raw report line as bytes, or None"""
+    parts = bytes(line[:64]).split(None, 2)
+    if not parts:
+        return None
+    if parts[0] in REPORT_TYPES and len(parts) > 1:
+        return parts[1]
+    return parts[0]
+
+
+class ArchiveReader:
+    """Read-only memory-mapped archive with a line-offset index.
+
+    The index holds one 8-byte offset per line. With persist_index it is
+    saved next to the archive as <path>.idx and reused while the archive's
+    size and modification time are unchanged. Line numbers count every line
+    of the file, blank ones included, from zero. Slices are memoryviews of
+    the mapping; release them before calling close().
+    """
+
+    def __init__(self, path, persist_index=False, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._signature = (stat.st_size, stat.st_mtime_ns)
+        # Empty files cannot be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+        self._view = memoryview(self._map if self._map is not None else b'')
+        self._stations = None
+
+        self.offsets = self._load_index() if persist_index or index_path else None
+        if self.offsets is None:
+            self.offsets = build_offsets(self._map if self._map is not None else b'')
+            if persist_index or index_path:
+                self._save_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, size, mtime_ns, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or (size, mtime_ns) != self._signature:
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(f.read(count * offsets.itemsize))
+        except (OSError, struct.error, ValueError):
+            return None
+        if len(offsets) != count:
+            return None
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        return offsets
+
+    def _save_index(self):
+        offsets = self.offsets
+        if sys.byteorder == 'big':
+            offsets = array('Q', offsets)
+            offsets.byteswap()
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, *self._signature, len(offsets)))
+            offsets.tofile(f)
+        os.replace(temporary, self.index_path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def span(self, start, stop):
+        """Return the (start, end) byte offsets of lines start to stop"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(stop, start)
+        return self.offsets[start], self.offsets[stop]
+
+    def line(self, number):
+        """Return line number as a memoryview, without its line break"""
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError('archive line out of range')
+        start, end = self.offsets[number], self.offsets[number + 1]
+        view = self._view[start:end]
+        if view[-1:] == b'\n':
+            view = view[:-1]
+        if view[-1:] == b'\r':
+            view = view[:-1]
+        return view
+
+    def lines(self, start=0, stop=None):
+        """Yield lines start to stop as memoryviews"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        for number in range(start, stop):
+            yield self.line(number)
+
+    def station_index(self):
+        """Return {station: array of line numbers}, built on first use"""
+        if self._stations is None:
+            stations = defaultdict(lambda: array('L'))
+            for number in range(len(self)):
+                station = station_of(self._view[self.offsets[number]:self.offsets[number + 1]])
+                if station:
+                    stations[station.decode('ascii', 'replace')].append(number)
+            self._stations = dict(stations)
+        return self._stations
+
+    def station(self, station_id):
+        """Yield the lines reported by station_id, in file order"""
+        for number in self.station_index().get(station_id, ()):
+            yield self.line(number)
+
+    def chunks(self, lines_per_chunk):
+        """Return disjoint (start, end) byte ranges of at most lines_per_chunk whole lines"""
+        return [self.span(start, start + lines_per_chunk) for start in range(0, len(self), lines_per_chunk)]
+
+
+def read_range(path, start, end):
+    """Return the text of bytes start to end of path, read through a mapping"""
+    if end <= start:
+        return ''
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return data[start:end].decode('utf-8', 'replace')
@@ -0,0 +1,553 @@
+"""Asyncio serving path for the METAR API.
+
+Serves POST /metar, GET /metar/<station>, POST /metar/batch, /metar/nearby,
+GET /metar/stream and the /taf routes like the Flask app, but upstream
+requests go through a non-blocking HTTP client on a single event loop, so
+thousands of in-flight lookups don't each tie up an OS thread. Caching,
+batching and decoding are shared with app.py.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import io
+import json
+import time
+from collections import namedtuple
+
+import aiohttp
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_etags, parse_options_header
+
+import app
+from upstream import UpstreamClient
+
+UpstreamResponse = namedtuple('UpstreamResponse', ['status_code', 'text', 'headers'])
+
+
+class AsyncUpstreamClient:
+    """Pooled keep-alive async HTTP client with timeouts and 5xx retries.
+
+    The aiohttp session is created on first use, so the client binds to the
+    event loop that serves requests.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, pool_size=10,
+                 retries=2, backoff=0.3):
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+
+    def _ensure_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                headers={'Accept-Encoding': 'gzip, deflate'},
+            )
+        return self.session
+
+    async def get(self, url, headers=None):
+        """Send a GET request, retrying 5xx responses and connection errors"""
+        session = self._ensure_session()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                async with session.get(url, headers=headers) as response:
+                    result = UpstreamResponse(response.status, await response.text(), response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            else:
+                if result.status_code not in UpstreamClient.RETRY_STATUSES or last_attempt:
+                    return result
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def aclose(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncMetarService:
+    """Async counterpart of the fetch and cache helpers in app.py.
+
+    Entries live in the shared app.metar_cache. Concurrent misses for one
+    station are coalesced onto a single future on the event loop. With
+    app.shared_cache configured, misses are looked up there (off the event
+    loop) before going upstream and fetched reports are written back, but
+    the cross-process lease is left to the threaded workers.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._inflight = {}
+
+    async def upstream_get(self, url):
+        """Conditionally GET an upstream URL like app.conditional_get, recording metrics.
+
+        Throttled requests are shed at once rather than waiting for a
+        token, since waiting here would hold up the event loop.
+        """
+        permit = app.upstream_permit()
+        start = time.perf_counter()
+        try:
+            response = await self.client.get(url, headers=app.conditional_headers(url) or None)
+        except Exception:
+            app.record_upstream(None, time.perf_counter() - start, permit)
+            raise
+        except BaseException:
+            # Cancelled without an outcome, as on a client disconnect: give the
+            # permit back, or a half-open breaker would wait on this probe for good
+            app.upstream_breaker.release(permit)
+            raise
+        app.record_upstream(response.status_code, time.perf_counter() - start, permit)
+        return app.resolve_conditional(url, *response)
+
+    async def fetch_metar(self, station_id):
+        """Fetch METAR data for one station, or None on failure"""
+        try:
+            status_code, text = await self.upstream_get(app.upstream_url([station_id]))
+        except Exception:
+            return None
+        if status_code == 200:
+            metar_data = app.single_metar(station_id, text)
+            app.record_fetched([metar_data])
+            app.publish_changes({station_id: metar_data})
+            return metar_data
+        return None
+
+    async def fetch_reports(self, station_ids, extra=()):
+        """Fetch METARs and products riding along in one request, like app.fetch_reports"""
+        try:
+            status_code, text = await self.upstream_get(app.upstream_url(station_ids, extra))
+        except Exception:
+            return None
+        if status_code == 204:
+            text = ''
+        elif status_code != 200:
+            return None
+        reports = app.split_reports(text)
+        app.store_products(reports)
+        app.record_fetched(reports['metar'].values())
+        app.publish_changes(reports['metar'])
+        return reports
+
+    async def fetch_metar_batch(self, station_ids):
+        """Fetch several stations in one request, as {station_id: metar} or None"""
+        reports = await self.fetch_reports(station_ids)
+        return None if reports is None else reports['metar']
+
+    async def get_reports_cached(self, product, station_ids):
+        """Fetch a product's reports through its cache, like app.get_reports_cached"""
+        reports, missing = app.cached_reports(product, station_ids)
+        if not missing:
+            return reports, {}
+        chunks = app.chunk_stations(missing, app.BATCH_CHUNK_SIZE)
+        fetched_chunks = await asyncio.gather(*(self.fetch_reports(chunk, (product.name,)) for chunk in chunks))
+        fetched, errors = app.collect_reports(product, chunks, fetched_chunks)
+        reports.update(fetched)
+        return reports, errors
+
+    async def load_metar(self, station_id):
+        """Load a station missing from the local cache, from the shared cache or upstream"""
+        if app.shared_cache is not None:
+            cached = (await asyncio.to_thread(app.shared_get, [station_id])).get(station_id)
+            if cached is not None:
+                metar_data, ttl = cached
+                app.metar_cache.set(station_id, metar_data, ttl=ttl)
+                return metar_data
+        metar_data = await self.fetch_metar(station_id)
+        if metar_data:
+            app.metar_cache.set(station_id, metar_data)
+            if app.shared_cache is not None:
+                await asyncio.to_thread(app.shared_set, {station_id: metar_data})
+        return metar_data
+
+    async def get_metar_cached(self, station_id):
+        """Fetch METAR data through the cache, coalescing concurrent misses"""
+        metar_data = app.metar_cache.get(station_id)
+        if metar_data:
+            return metar_data
+
+        future = self._inflight.get(station_id)
+        if future is not None:
+            app.metar_cache.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[station_id] = future
+        try:
+            metar_data = await self.load_metar(station_id)
+            future.set_result(metar_data)
+        except BaseException:
+            # Only the leader fails; the others see a miss, as on any failed fetch
+            future.set_result(None)
+            raise
+        finally:
+            del self._inflight[station_id]
+        return metar_data
+
+    async def get_metars_cached(self, station_ids):
+        """Fetch many stations through the cache, chunks running concurrently.
+
+        Returns ({station_id: metar}, {station_id: error}) like app.get_metars_cached.
+        """
+        metars = {}
+        missing = []
+        for station_id in station_ids:
+            metar_data = app.metar_cache.get(station_id)
+            if metar_data:
+                metars[station_id] = metar_data
+            else:
+                missing.append(station_id)
+
+        if missing and app.shared_cache is not None:
+            for station_id, (metar_data, ttl) in (await asyncio.to_thread(app.shared_get, missing)).items():
+                app.metar_cache.set(station_id, metar_data, ttl=ttl)
+                metars[station_id] = metar_data
+            missing = [station_id for station_id in missing if station_id not in metars]
+
+        errors = {}
+        if not missing:
+            return metars, errors
+
+        written = {}
+        chunks = app.chunk_stations(missing, app.BATCH_CHUNK_SIZE)
+        fetched_chunks = await asyncio.gather(*(self.fetch_metar_batch(chunk) for chunk in chunks))
+        for chunk, fetched in zip(chunks, fetched_chunks):
+            for station_id in chunk:
+                if fetched is None:
+                    errors[station_id] = f'Unable to fetch METAR data for {station_id}'
+                elif station_id not in fetched:
+                    errors[station_id] = f'No METAR data found for {station_id}'
+                else:
+                    app.metar_cache.set(station_id, fetched[station_id])
+                    metars[station_id] = fetched[station_id]
+                    written[station_id] = fetched[station_id]
+        if written and app.shared_cache is not None:
+            await asyncio.to_thread(app.shared_set, written)
+        return metars, errors
+
+
+class MetarASGIApp:
+    """Minimal ASGI application exposing the METAR routes"""
+
+    def __init__(self):
+        self.service = None
+
+    def _ensure_service(self):
+        # The HTTP client must be created on the loop that serves requests
+        if self.service is None:
+            client = AsyncUpstreamClient(
+                connect_timeout=app.upstream.timeout[0],
+                read_timeout=app.upstream.timeout[1],
+                pool_size=app.upstream.pool_size,
+                retries=app.upstream.retries,
+                backoff=app.upstream.backoff,
+            )
+            self.service = AsyncMetarService(client)
+        return self.service
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        # Methods per route as Flask serves them, HEAD included with GET
+        read = ('GET', 'HEAD')
+        routes = {
+            '/metar': (self.get_metar, ('POST',)),
+            '/metar/batch': (self.get_metar_batch, ('POST',)),
+            '/metar/nearby': (self.get_metar_nearby, read + ('POST',)),
+            '/health': (self.health, read),
+            '/admin/prefetch': (self.prefetch_state, read),
+            '/admin/stream': (self.stream_state, read),
+            '/admin/decode-profile': (self.decode_profile_state, read),
+            '/metrics': (self.metrics_endpoint, read),
+            '/metar/history': (self.get_metar_history, read + ('POST',)),
+            '/metar/stream': (self.get_metar_stream, read),
+            '/taf': (self.get_taf, ('POST',)),
+            '/taf/batch': (self.get_taf_batch, ('POST',)),
+        }
+        path = scope['path']
+        handler, methods = routes.get(path, (None, ()))
+        if handler is None and path.startswith('/metar/') and path.count('/') == 2:
+            handler, methods = self.get_metar_station, read
+        if handler is None and path.startswith('/taf/') and path.count('/') == 2:
+            handler, methods = self.get_taf_station, read
+        if handler is None:
+            await self._respond(send, {'error': 'Not found'}, 404)
+            return
+        if scope['method'] not in methods:
+            await self._respond(send, {'error': 'Method not allowed'}, 405, {'Allow': ', '.join(methods)})
+            return
+
+        start = time.perf_counter()
+        body = await self._read_body(receive)
+        payload, form = self._parse_body(scope, body)
+        if handler == self.get_metar_stream:
+            status = await handler(payload, form, receive, send)
+        elif handler in (self.get_metar, self.get_metar_station, self.get_taf_station):
+            data, status, headers = await handler(payload, form, scope)
+            await self._respond(send, data, status, headers)
+        else:
+            data, status = await handler(payload, form)
+            await self._respond(send, data, status)
+        app.request_seconds.observe(time.perf_counter() - start, endpoint=handler.__name__)
+        app.api_requests.inc(endpoint=handler.__name__, status=status)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._ensure_service()
+                app.preload()
+                app.prefetcher.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                app.prefetcher.stop()
+                app.stream_hub.stop()
+                if self.service is not None:
+                    await self.service.client.aclose()
+                    self.service = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    def _parse_body(self, scope, body):
+        """Return (json payload, form fields) for a request body"""
+        headers = dict(scope['headers'])
+        content_type = headers.get(b'content-type', b'').decode('latin-1')
+        mimetype, options = parse_options_header(content_type)
+        query = FormDataParser().parse(io.BytesIO(scope.get('query_string', b'')),
+                                       'application/x-www-form-urlencoded',
+                                       len(scope.get('query_string', b'')))[1]
+        form = query.to_dict()
+        payload = {}
+        if mimetype == 'application/json':
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                payload = {}
+            if not isinstance(payload, dict):
+                payload = {}
+        elif body:
+            form.update(FormDataParser().parse(io.BytesIO(body), mimetype, len(body), options)[1].to_dict())
+        return payload, form
+
+    async def _respond(self, send, data, status=200, headers=None):
+        """Send data as JSON, as plain text if it is a string, or as is if already serialized bytes"""
+        if isinstance(data, bytes):
+            body, content_type = data, b'application/json'
+        elif isinstance(data, str):
+            body, content_type = data.encode(), b'text/plain; version=0.0.4'
+        else:
+            with app.stage_seconds.time(stage='response'):
+                body, content_type = json.dumps(data).encode(), b'application/json'
+        response_headers = [(b'content-length', str(len(body)).encode())]
+        if status != 304:
+            response_headers.append((b'content-type', content_type))
+        response_headers.extend((name.lower().encode(), value.encode()) for name, value in (headers or {}).items())
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': response_headers,
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def health(self, payload, form):
+        return app.health_status()
+
+    async def metrics_endpoint(self, payload, form):
+        return app.metrics.render(), 200
+
+    async def prefetch_state(self, payload, form):
+        return app.prefetcher.state(), 200
+
+    async def stream_state(self, payload, form):
+        return app.stream_hub.state(), 200
+
+    async def decode_profile_state(self, payload, form):
+        return app.decode_profile_state(form.get('reset') == '1'), 200
+
+    async def get_metar(self, payload, form, scope):
+        station_id = form.get('station_id', payload.get('station_id', '')).upper()
+        return await self._metar_response(station_id, form.get('format', payload.get('format')) == 'json', scope)
+
+    async def get_metar_station(self, payload, form, scope):
+        station_id = scope['path'].rsplit('/', 1)[1].upper()
+        return await self._metar_response(station_id, form.get('format') == 'json', scope)
+
+    async def _metar_response(self, station_id, structured, scope):
+        """Return (body, status, headers) for one station, with 304 if the client's ETag is current"""
+        if not station_id:
+            return {'error': 'Please enter a station ID'}, 400, {}
+        error = app.station_error(station_id)
+        if error:
+            return {'error': error}, 404, {}
+
+        app.prefetcher.record(station_id)
+        metar_data = await self._ensure_service().get_metar_cached(station_id)
+        stale = not metar_data
+        if stale:
+            metar_data = app.stale_metar(station_id)
+
+        if not metar_data:
+            return {'error': f'Unable to fetch METAR data for {station_id}'}, 404, {}
+
+        body, etag, observed = app.serialized_result(station_id, metar_data, structured, stale)
+        headers = app.cache_headers(etag, observed, stale)
+        app.record_served()
+        if_none_match = dict(scope['headers']).get(b'if-none-match')
+        if if_none_match and parse_etags(if_none_match.decode('latin-1')).contains_weak(etag):
+            app.not_modified.inc()
+            return b'', 304, headers
+        return body, 200, headers
+
+    async def get_metar_history(self, payload, form):
+        # The history query reads SQLite, so keep it off the event loop
+        return await asyncio.to_thread(app.metar_history, {**payload, **form})
+
+    async def get_metar_stream(self, payload, form, receive, send):
+        """Send server-sent events like app.stream_events until the client disconnects"""
+        station_ids = app.normalize_station_ids(form.get('station_ids', form.get('station_id', '')))
+        error = app.stream_request_error(station_ids)
+        if error:
+            await self._respond(send, *error)
+            return error[1]
+
+        # The hub publishes from other threads, so wake the loop thread-safely
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        subscription = app.stream_hub.subscribe(station_ids, on_ready=lambda: loop.call_soon_threadsafe(ready.set))
+        if subscription is None:
+            await self._respond(send, {'error': 'Too many stream subscribers, try again later'}, 503)
+            return 503
+
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            metars, errors = await self._ensure_service().get_metars_cached(station_ids)
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')],
+            })
+            structured = form.get('format', payload.get('format')) == 'json'
+            sent = {}
+            chunk = app.stream_chunk(metars.items(), sent, structured, errors)
+            while not subscription.closed and not disconnected.done():
+                await send({'type': 'http.response.body', 'body': (chunk or ': keepalive\n\n').encode(),
+                            'more_body': True})
+                ready.clear()
+                pending = subscription.get(0)
+                if not pending:
+                    waiter = asyncio.ensure_future(ready.wait())
+                    await asyncio.wait({waiter, disconnected}, timeout=app.STREAM_HEARTBEAT,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    pending = subscription.get(0)
+                chunk = app.stream_chunk(pending, sent, structured)
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            app.stream_hub.unsubscribe(subscription)
+        return 200
+
+    async def _wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def get_metar_batch(self, payload, form):
+        station_ids = payload.get('station_ids')
+        if station_ids is None:
+            station_ids = form.get('station_ids', '')
+        station_ids = app.normalize_station_ids(station_ids)
+
+        if not station_ids:
+            return {'error': 'Please enter at least one station ID'}, 400
+        if len(station_ids) > app.BATCH_MAX_STATIONS:
+            return {'error': f'At most {app.BATCH_MAX_STATIONS} station IDs per request'}, 400
+
+        station_ids, rejected = app.reject_stations(station_ids)
+        metars, errors = await self._ensure_service().get_metars_cached(station_ids)
+        stale = app.fill_stale(metars, errors)
+        errors.update(rejected)
+        structured = form.get('format', payload.get('format')) == 'json'
+
+        with app.stage_seconds.time(stage='decode'):
+            results = {
+                station_id: app.metar_result(metars[station_id], structured)
+                for station_id in station_ids if station_id in metars
+            }
+            for station_id in stale:
+                results[station_id]['stale'] = True
+        return {'results': results, 'errors': errors}, 200
+
+    async def get_metar_nearby(self, payload, form):
+        values = {**payload, **form}
+        try:
+            nearby = app.nearby_stations(values)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        station_ids = [station.station_id for station, _ in nearby]
+        metars, errors = await self._ensure_service().get_metars_cached(station_ids)
+        with app.stage_seconds.time(stage='decode'):
+            return app.nearby_results(nearby, metars, errors, values.get('format') == 'json'), 200
+
+    async def get_taf(self, payload, form):
+        station_id = form.get('station_id', payload.get('station_id', '')).upper()
+        return await self._taf_response(station_id, form.get('format', payload.get('format')) == 'json')
+
+    async def get_taf_station(self, payload, form, scope):
+        station_id = scope['path'].rsplit('/', 1)[1].upper()
+        data, status = await self._taf_response(station_id, form.get('format') == 'json')
+        return data, status, {}
+
+    async def _taf_response(self, station_id, structured):
+        if not station_id:
+            return {'error': 'Please enter a station ID'}, 400
+        error = app.station_error(station_id)
+        if error:
+            return {'error': error}, 404
+
+        reports, errors = await self._ensure_service().get_reports_cached(app.taf, [station_id])
+        if station_id not in reports:
+            return {'error': f'Unable to fetch TAF data for {station_id}'}, 404
+        with app.stage_seconds.time(stage='decode'):
+            result = app.report_result(app.taf, reports[station_id], structured)
+        result['station_id'] = station_id
+        return result, 200
+
+    async def get_taf_batch(self, payload, form):
+        station_ids = payload.get('station_ids')
+        if station_ids is None:
+            station_ids = form.get('station_ids', '')
+        station_ids = app.normalize_station_ids(station_ids)
+
+        if not station_ids:
+            return {'error': 'Please enter at least one station ID'}, 400
+        if len(station_ids) > app.BATCH_MAX_STATIONS:
+            return {'error': f'At most {app.BATCH_MAX_STATIONS} station IDs per request'}, 400
+
+        station_ids, rejected = app.reject_stations(station_ids)
+        reports, errors = await self._ensure_service().get_reports_cached(app.taf, station_ids)
+        errors.update(rejected)
+        structured = form.get('format', payload.get('format')) == 'json'
+        with app.stage_seconds.time(stage='decode'):
+            return app.product_results(app.taf, station_ids, reports, errors, structured), 200
+
+
+application = MetarASGIApp()
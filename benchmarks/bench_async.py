@@ -0,0 +1,180 @@
+"""Load test of the threaded Flask app against the asyncio ASGI app.
+
+Both apps are pointed at a local stub upstream with a fixed latency and
+driven with the same number of concurrent /metar requests for distinct
+stations, so every request is a cache miss that waits on upstream I/O.
+The stub and each app run in their own process. Reports throughput,
+latency percentiles and the peak number of server threads.
+
+    python benchmarks/bench_async.py --requests 2000 --concurrency 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import string
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+
+def station_ids(count):
+    """Return count distinct made-up station IDs"""
+    letters = itertools.product(string.ascii_uppercase, repeat=3)
+    return ['K' + ''.join(next(letters)) for _ in range(count)]
+
+
+def serve(mode, port, upstream_url, pool_size):
+    """Run one of the apps in this process against the given upstream"""
+    import app
+    from upstream import UpstreamClient
+
+    app.METAR_API_URL = upstream_url
+    # Give both modes enough upstream connections for the offered load
+    app.upstream = UpstreamClient(pool_size=pool_size)
+
+    if mode == 'flask':
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', port, app.app, threaded=True)
+        print('ready', flush=True)
+        server.serve_forever()
+    else:
+        import uvicorn
+        from asgi import application
+        config = uvicorn.Config(application, host='127.0.0.1', port=port, log_level='warning', lifespan='on')
+        server = uvicorn.Server(config)
+        threading.Thread(target=announce_when_listening, args=(port,), daemon=True).start()
+        server.run()
+
+
+def announce_when_listening(port):
+    """Print the ready line once the server accepts connections"""
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    print('ready', flush=True)
+
+
+def start_process(*args):
+    """Start a helper process and wait for its first line of output"""
+    process = subprocess.Popen([sys.executable, *args], stdout=subprocess.PIPE, cwd=ROOT)
+    process.stdout.readline()
+    return process
+
+
+class ThreadSampler(threading.Thread):
+    """Records the peak thread count of a process while running"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.path = f'/proc/{pid}/status'
+        self.peak = 0
+        self.running = True
+
+    def sample(self):
+        try:
+            with open(self.path) as status:
+                for line in status:
+                    if line.startswith('Threads:'):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, self.sample())
+            time.sleep(0.005)
+
+
+async def drive(base_url, stations, concurrency):
+    """POST /metar for every station with bounded concurrency"""
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(base_url, connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=60)) as client:
+        async def one(station_id):
+            nonlocal errors
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    async with client.post('/metar', data={'station_id': station_id}) as response:
+                        await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+                if response.status != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(station_id) for station_id in stations))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def run_mode(mode, port, upstream_url, stations, concurrency):
+    server = start_process(__file__, '--serve', mode, '--port', str(port),
+                           '--upstream', upstream_url, '--concurrency', str(concurrency))
+    sampler = ThreadSampler(server.pid)
+    sampler.start()
+    try:
+        latencies, errors, elapsed = asyncio.run(drive(f"http://127.0.0.1:{port}", stations, concurrency))
+    finally:
+        sampler.running = False
+        sampler.join()
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{mode:6} {len(stations) / elapsed:8,.0f} req/s  p50 {p50:7.1f} ms  "
+          f"p99 {p99:7.1f} ms  errors {errors}  peak threads {sampler.peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mode')
+    parser.add_argument('--concurrency', type=int, default=200, help='requests in flight')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub upstream latency in seconds')
+    parser.add_argument('--port', type=int, default=8082, help='port for the app under test')
+    parser.add_argument('--stub-port', type=int, default=8081, help='port for the stub upstream')
+    parser.add_argument('--serve', choices=['flask', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--upstream', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.upstream, args.concurrency)
+        return 0
+
+    stub = start_process(os.path.join(os.path.dirname(__file__), 'stub_upstream.py'),
+                         '--port', str(args.stub_port), '--latency', str(args.latency))
+    upstream_url = f"http://127.0.0.1:{args.stub_port}/api/data/metar"
+    stations = station_ids(args.requests)
+    try:
+        for mode in ('flask', 'asgi'):
+            run_mode(mode, args.port, upstream_url, stations, args.concurrency)
+    finally:
+        stub.terminate()
+        stub.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
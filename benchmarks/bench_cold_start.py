@@ -0,0 +1,159 @@
+"""Cold start and drain of a serving command, from launch to first /metar.
+
+Launches the server with METAR_API_URL pointing at a local stub upstream
+and polls POST /metar until it answers 200. Reports the time until the
+port accepted connections and until the first /metar was served, along
+with the server's own metar_preload_seconds and metar_cold_start_seconds
+from /metrics. It then opens a /metar/stream connection, sends SIGTERM
+and times how long the server takes to drain and exit. Each figure is
+the median of --runs launches, with the min and max.
+
+    python benchmarks/bench_cold_start.py --server gunicorn --runs 5
+    python benchmarks/bench_cold_start.py --server flask
+
+--command measures any other launcher, such as a container, where
+{port} is the port to serve on and {stub_port} the stub upstream's:
+
+    python benchmarks/bench_cold_start.py --stub-host 0.0.0.0 --command \\
+        "docker run --rm -p {port}:5000 --add-host host.docker.internal:host-gateway \\
+         -e METAR_API_URL=http://host.docker.internal:{stub_port}/api/data/metar metar-reader"
+"""
+import argparse
+import http.client
+import os
+import shlex
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from stub_upstream import StubUpstream
+
+SERVERS = {
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+    'flask': [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}'],
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def post_metar(port, station_id):
+    """POST /metar and return the status, or None if nothing is listening yet"""
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/metar', data=f'station_id={station_id}'.encode())
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def read_metric(port, name):
+    """Return a sample's value from the server's /metrics, or None"""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            for line in response.read().decode().splitlines():
+                if line.startswith(name + ' '):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def open_stream(port):
+    """Open a /metar/stream connection and wait for its first event"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request('GET', '/metar/stream?station_ids=KHIO')
+    response = connection.getresponse()
+    if response.status == 200:
+        response.readline()
+    return connection
+
+
+def launch(command, env, port, timeout):
+    """Start command and return {figure: seconds} up to draining its exit"""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    figures = {}
+    try:
+        while time.perf_counter() - start < timeout:
+            status = post_metar(port, 'KHIO')
+            if status is not None and 'listening' not in figures:
+                figures['listening'] = time.perf_counter() - start
+            if status == 200:
+                figures['first_metar'] = time.perf_counter() - start
+                break
+            if process.poll() is not None:
+                raise RuntimeError(f'server exited with status {process.returncode} before serving /metar')
+            time.sleep(0.005)
+        else:
+            raise RuntimeError(f'no /metar served within {timeout} seconds')
+
+        for figure, metric in (('server_preload', 'metar_preload_seconds'),
+                               ('server_cold_start', 'metar_cold_start_seconds')):
+            value = read_metric(port, metric)
+            if value:
+                figures[figure] = value
+
+        stream = open_stream(port)
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f'server did not exit within {timeout} seconds of SIGTERM') from None
+        figures['drain'] = time.perf_counter() - stopping
+        stream.close()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    return figures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=sorted(SERVERS), default='gunicorn', help='serving command to launch')
+    parser.add_argument('--command', help='launch this command instead; {port} and {stub_port} are filled in')
+    parser.add_argument('--runs', type=int, default=5, help='launches to measure')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for each stage')
+    parser.add_argument('--stub-host', default='127.0.0.1', help='address the stub upstream listens on')
+    args = parser.parse_args()
+
+    stub = StubUpstream(host=args.stub_host).start()
+    template = shlex.split(args.command) if args.command else SERVERS[args.server]
+    results = {}
+    try:
+        for _ in range(args.runs):
+            port = free_port()
+            command = [part.format(port=port, stub_port=stub.server_address[1]) for part in template]
+            env = dict(os.environ, METAR_API_URL=f'http://127.0.0.1:{stub.server_address[1]}/api/data/metar',
+                       METAR_BIND=f'127.0.0.1:{port}', METAR_GRACEFUL_TIMEOUT=str(int(args.timeout) + 5))
+            for figure, seconds in launch(command, env, port, args.timeout).items():
+                results.setdefault(figure, []).append(seconds)
+    finally:
+        stub.stop()
+
+    print(f"{args.command or args.server}: {args.runs} runs")
+    print(f"{'':18} {'median':>10} {'min':>10} {'max':>10}")
+    for figure, values in results.items():
+        print(f"{figure:18} {statistics.median(values) * 1000:>8.1f}ms {min(values) * 1000:>8.1f}ms "
+              f"{max(values) * 1000:>8.1f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
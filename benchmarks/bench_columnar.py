@@ -0,0 +1,86 @@
+"""Throughput of columnar batch decoding against per-report decoding.
+
+Decodes a synthetic corpus into numeric columns three ways: looping
+decode_metar (the plain English report, the only output before structured
+decoding existed), looping parse_metar and collecting its fields, and
+decode_columns() in batches. Checks that the columns match parse_metar
+and prints throughput in reports/sec.
+
+    python benchmarks/bench_columnar.py --size 200000 --batch 100000
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from decoder import decode_metar, parse_metar
+from columnar import decode_columns
+from corpus import generate_corpus
+
+FIELDS = ['wind_dir', 'wind_speed', 'wind_gust', 'visibility_sm', 'temperature', 'dewpoint', 'altimeter']
+
+
+def loop_decode_metar(corpus, batch):
+    for metar_text in corpus:
+        decode_metar(metar_text)
+
+
+def loop_parse_metar(corpus, batch):
+    columns = {name: [] for name in FIELDS}
+    for metar_text in corpus:
+        decoded = parse_metar(metar_text)
+        for name in FIELDS:
+            columns[name].append(getattr(decoded, name))
+    return columns
+
+
+def batch_decode_columns(corpus, batch):
+    for start in range(0, len(corpus), batch):
+        decode_columns(corpus[start:start + batch])
+
+
+def mismatches(corpus):
+    """Count fields where decode_columns() disagrees with parse_metar()"""
+    expected = loop_parse_metar(corpus, None)
+    columns = decode_columns(corpus)
+    count = 0
+    for name in FIELDS:
+        for want, got in zip(expected[name], columns[name].tolist()):
+            if want != got and not (want is not None and got is not None and math.isclose(want, got)):
+                count += 1
+    return count
+
+
+def measure(decoder, corpus, batch):
+    """Decode the corpus once and return reports/sec"""
+    start = time.perf_counter()
+    decoder(corpus, batch)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=200000, help='number of reports in the corpus')
+    parser.add_argument('--batch', type=int, default=100000, help='reports per decode_columns() call')
+    parser.add_argument('--seed', type=int, default=0, help='corpus random seed')
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size, args.seed)
+    bad = mismatches(corpus[:20000])
+    if bad:
+        print(f"{bad} fields decode differently")
+        return 1
+
+    print(f"corpus:         {len(corpus)} reports")
+    for label, decoder in (('decode_metar', loop_decode_metar),
+                           ('parse_metar', loop_parse_metar),
+                           ('decode_columns', batch_decode_columns)):
+        print(f"{label + ':':15} {measure(decoder, corpus, args.batch):10,.0f} reports/sec")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Upstream bandwidth of refresh polling, unconditional vs conditional.
+
+Starts a local stub METAR server and polls a set of stations for several
+rounds, as the cache refresh does, first with plain GETs and then with
+conditional requests. Before every round a share of the stations issues a
+new report. Prints the body bytes the stub served and the updated and
+unchanged poll counters.
+
+    python benchmarks/bench_conditional.py --stations 200 --rounds 12 --change 0.1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+from stub_upstream import StubUpstream
+
+
+def poll(server, stations, rounds, change, batch, seed=0):
+    """Poll stations for rounds against server and return (bytes, seconds, updated, unchanged)"""
+    # Same seed, so both modes see the same number of report changes
+    rng = random.Random(seed)
+    app.upstream_validators.clear()
+    app.last_reports.clear()
+    sent, updated, unchanged = server.bytes_sent, app.polls.value(result='updated'), app.polls.value(result='unchanged')
+    start = time.perf_counter()
+    for _ in range(rounds):
+        server.advance(rng.sample(stations, int(len(stations) * change)))
+        if batch:
+            for chunk in app.chunk_stations(stations, app.BATCH_CHUNK_SIZE):
+                app.fetch_metar_batch(chunk)
+        else:
+            for station in stations:
+                app.fetch_metar(station)
+    return (server.bytes_sent - sent, time.perf_counter() - start,
+            app.polls.value(result='updated') - updated, app.polls.value(result='unchanged') - unchanged)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=200, help='number of polled stations')
+    parser.add_argument('--rounds', type=int, default=12, help='polling rounds')
+    parser.add_argument('--change', type=float, default=0.1, help='share of stations with a new report per round')
+    parser.add_argument('--batch', action='store_true', help=f'poll in batches of {app.BATCH_CHUNK_SIZE} stations')
+    args = parser.parse_args()
+
+    stations = [f'K{index:03d}' for index in range(args.stations)]
+    server = StubUpstream().start()
+    app.METAR_API_URL = f'{server.url}/api/data/metar'
+    try:
+        results = {}
+        for conditional in (False, True):
+            app.CONDITIONAL_REQUESTS = conditional
+            results[conditional] = poll(server, stations, args.rounds, args.change, args.batch)
+    finally:
+        server.stop()
+
+    for conditional, label in ((False, 'plain'), (True, 'conditional')):
+        sent, seconds, updated, unchanged = results[conditional]
+        print(f"{label:12} {sent:>10,} bytes  {seconds:.2f} s  updated {updated}  unchanged {unchanged}")
+    saved = 1 - results[True][0] / results[False][0] if results[False][0] else 0
+    print(f"bandwidth saved: {saved:.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
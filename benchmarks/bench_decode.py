@@ -0,0 +1,52 @@
+"""Before/after throughput of decode_metar.
+
+Decodes a synthetic corpus with the old multi-pass decoder and the current
+single-pass decoder and prints throughput in reports/sec. Also counts the
+reports the two decode differently: the old decoder found weather codes
+inside other groups (VC in OVC095, PO in TEMPO) and dropped the height of
+CB/TCU layers, which the current decoder no longer does.
+
+    python benchmarks/bench_decode.py --size 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from decoder import decode_metar
+from corpus import generate_corpus
+from legacy_decode import decode_metar as legacy_decode_metar
+
+
+def measure(decoder, corpus):
+    """Decode the corpus once and return reports/sec."""
+    start = time.perf_counter()
+    for metar_text in corpus:
+        decoder(metar_text)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000, help='number of reports in the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='corpus random seed')
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size, args.seed)
+
+    mismatches = sum(1 for m in corpus if decode_metar(m) != legacy_decode_metar(m))
+
+    before = measure(legacy_decode_metar, corpus)
+    after = measure(decode_metar, corpus)
+    print(f"corpus:  {len(corpus)} reports")
+    print(f"before:  {before:,.0f} reports/sec (multi-pass)")
+    print(f"after:   {after:,.0f} reports/sec (single-pass)")
+    print(f"speedup: {after / before:.2f}x")
+    print(f"changed: {mismatches} reports decode differently from the multi-pass decoder")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
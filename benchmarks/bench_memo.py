@@ -0,0 +1,83 @@
+"""Throughput of /metar result building with and without the decode memo.
+
+Simulates the request stream of a busy deployment: requests for a set of
+stations whose reports change on average every --reissue requests per
+station, so most requests carry a text that was decoded before. Builds the
+/metar JSON result for each request with a fresh parse and through the
+decode memo, and prints throughput and the memo hit rate.
+
+    python benchmarks/bench_memo.py --requests 200000 --stations 500 --reissue 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import decode_memo, metar_result, parse_metar
+from corpus import generate_metar
+
+
+def request_stream(requests, stations, reissue, seed=0):
+    """Return raw METARs for a stream of requests spread over stations.
+
+    Each request has a 1/reissue chance of seeing a new report for its
+    station, like a station issuing a new METAR between polls.
+    """
+    rng = random.Random(seed)
+    current = [generate_metar(rng) for _ in range(stations)]
+    stream = []
+    for _ in range(requests):
+        station = rng.randrange(stations)
+        if rng.random() < 1 / reissue:
+            current[station] = generate_metar(rng)
+        stream.append(current[station])
+    return stream
+
+
+def uncached_result(metar_data, structured=False):
+    """metar_result() as it was before the decode memo"""
+    decoded = parse_metar(metar_data)
+    result = {'raw_metar': metar_data, 'decoded_report': decoded.render()}
+    if structured:
+        result['decoded'] = decoded.to_dict()
+    return result
+
+
+def measure(build, stream):
+    """Build a structured result for every request and return requests/sec"""
+    start = time.perf_counter()
+    for metar_text in stream:
+        build(metar_text, True)
+    return len(stream) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200000, help='number of simulated requests')
+    parser.add_argument('--stations', type=int, default=500, help='number of distinct stations')
+    parser.add_argument('--reissue', type=float, default=20,
+                        help='average requests per station between new reports')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    stream = request_stream(args.requests, args.stations, args.reissue, args.seed)
+    unique = len(set(stream))
+
+    decode_memo.clear()
+    before = measure(uncached_result, stream)
+    after = measure(metar_result, stream)
+    stats = decode_memo.stats()
+
+    print(f"requests:  {len(stream)} ({unique} distinct reports, {1 - unique / len(stream):.1%} repeats)")
+    print(f"before:    {before:,.0f} requests/sec (parse every time)")
+    print(f"after:     {after:,.0f} requests/sec (decode memo, maxsize {stats['maxsize']})")
+    print(f"hit rate:  {stats['hit_rate']:.1%} ({stats['evictions']} evictions)")
+    print(f"speedup:   {after / before:.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""Memory footprint of decoded reports.
+
+Parses a synthetic corpus into DecodedMetar objects and prints the average
+number of bytes each one keeps alive, not counting the raw METAR text.
+
+    python benchmarks/bench_memory.py --size 100000
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from decoder import parse_metar
+from corpus import generate_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000, help='number of reports in the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='corpus random seed')
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size, args.seed)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    history = [parse_metar(metar_text) for metar_text in corpus]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"corpus:     {len(history)} reports")
+    print(f"per report: {(after - before) / len(history):,.0f} bytes (DecodedMetar)")
+    print(f"as text:    {sum(sys.getsizeof(m.render()) for m in history[:1000]) / 1000:,.0f} bytes (rendered report)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""Replay recorded or generated traffic against the METAR API at a target rate.
+
+Requests are sent open loop: request i is due --rps times a second after
+the start, whether or not earlier requests have been answered, so a server
+that falls behind builds a queue instead of slowing the generator down.
+Latency is measured from when a request was due, so time spent queued
+counts. Reports throughput, p50/p95/p99 latency and error rate (no answer
+or a 4xx/5xx status), overall and per route.
+
+--traffic replays a file with one request per line, cycling through it
+for --duration seconds. A line is either a JSON object such as
+{"method": "POST", "path": "/metar/batch", "json": {"station_ids": [...]}}
+(or "form": {...} for form fields), an access log line whose quoted
+request line is replayed, or a bare "GET /metar/KHIO". Access logs carry
+no request bodies, so record POST traffic as JSON. Without --traffic a
+mix of POST /metar, GET /metar/<station> and POST /metar/batch over
+--stations stations of Zipf-like popularity is generated; --record saves
+it for later replays.
+
+By default --server is launched against a local stub upstream with the
+given --latency, --jitter and --error-rate, serving --corpus if given;
+--target replays against a server that is already running.
+
+    python benchmarks/bench_replay.py --server gunicorn --rps 200 --duration 30 --latency 0.05 --error-rate 0.01
+    python benchmarks/bench_replay.py --target http://127.0.0.1:5000 --traffic requests.jsonl --rps 500
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import signal
+import string
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from bench_cold_start import SERVERS, free_port
+from corpus import STATIONS, load_corpus, station_of
+from stub_upstream import StubUpstream
+
+Request = namedtuple('Request', ['method', 'path', 'body', 'content_type'])
+
+FORM = 'application/x-www-form-urlencoded'
+
+# The quoted request line of an access log entry, or a bare "GET /path"
+REQUEST_LINE = re.compile(r'"?\b(GET|POST|HEAD) (/\S*)(?: HTTP/[\d.]+)?"?')
+
+# Paths that are routes of their own rather than a station
+ROUTES = frozenset(['/metar', '/metar/batch', '/metar/nearby', '/metar/history', '/metar/stream',
+                    '/taf', '/taf/batch'])
+
+
+def parse_traffic(lines):
+    """Yield a Request for each line of recorded traffic, skipping lines that hold none"""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            record = json.loads(line)
+            method = record.get('method', 'GET').upper()
+            if 'json' in record:
+                yield Request(method, record['path'], json.dumps(record['json']).encode(), 'application/json')
+            elif 'form' in record:
+                yield Request(method, record['path'], urlencode(record['form']).encode(), FORM)
+            else:
+                yield Request(method, record['path'], None, None)
+            continue
+        match = REQUEST_LINE.search(line)
+        if match:
+            yield Request(match.group(1), match.group(2), None, None)
+
+
+def record_line(request):
+    """Return the JSON traffic line that replays request"""
+    record = {'method': request.method, 'path': request.path}
+    if request.content_type == 'application/json':
+        record['json'] = json.loads(request.body)
+    elif request.content_type == FORM:
+        record['form'] = dict(parse_qsl(request.body.decode()))
+    return json.dumps(record)
+
+
+def station_ids(count, known=STATIONS):
+    """Return count ICAO-shaped station IDs, the known ones first"""
+    ids = list(known[:count])
+    digits = string.digits + string.ascii_uppercase
+    number = 0
+    while len(ids) < count:
+        ids.append('K' + ''.join(digits[number // 36 ** power % 36] for power in (2, 1, 0)))
+        number += 1
+    return ids
+
+
+def generate_traffic(count, stations, batch_share=0.1, get_share=0.3, batch_size=10, seed=0):
+    """Return count requests over stations, the n-th most popular station asked for 1/n as often"""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(stations) + 1)]
+    requests = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < batch_share:
+            chosen = list(dict.fromkeys(rng.choices(stations, weights, k=batch_size)))
+            requests.append(Request('POST', '/metar/batch', json.dumps({'station_ids': chosen}).encode(),
+                                    'application/json'))
+        elif roll < batch_share + get_share:
+            requests.append(Request('GET', f'/metar/{rng.choices(stations, weights)[0]}', None, None))
+        else:
+            requests.append(Request('POST', '/metar', urlencode({'station_id': rng.choices(stations, weights)[0]})
+                                    .encode(), FORM))
+    return requests
+
+
+def route_of(request):
+    """Group a request by method and route, with station paths folded together"""
+    path = request.path.split('?', 1)[0]
+    if path not in ROUTES and path.count('/') == 2:
+        path = path.rsplit('/', 1)[0] + '/<station>'
+    return f'{request.method} {path}'
+
+
+class Sender:
+    """Sends requests over one keep-alive connection per thread"""
+
+    def __init__(self, base_url, timeout=10):
+        url = urlparse(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port,
+                                                                            timeout=self.timeout)
+        return connection
+
+    def send(self, request):
+        """Send a request and return its status, or None if no answer came"""
+        headers = {'Content-Type': request.content_type} if request.content_type else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(request.method, request.path, body=request.body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                self._local.connection = None
+                # A kept-alive connection the server closed is retried once on a new one
+                if attempt:
+                    return None
+
+
+def replay(base_url, requests, rps, duration=None, concurrency=64, timeout=10):
+    """Send requests open loop at rps, cycling through them for duration seconds (once through if None).
+
+    Returns ([(route, status or None, seconds from due to answer)], seconds elapsed).
+    """
+    sender = Sender(base_url, timeout)
+    total = int(rps * duration) if duration is not None else len(requests)
+    results = []
+
+    def run(request, due):
+        status = sender.send(request)
+        results.append((route_of(request), status, time.perf_counter() - due))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix='replay') as pool:
+        for index in range(total):
+            due = start + index / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, requests[index % len(requests)], due)
+    return results, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(results, elapsed):
+    """Return throughput, latency percentiles in ms and error rate, overall and per route"""
+    def figures(samples):
+        latencies = sorted(seconds for _, _, seconds in samples)
+        errors = sum(1 for _, status, _ in samples if status is None or status >= 400)
+        return {
+            'requests': len(samples),
+            'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'error_rate': round(errors / len(samples), 4),
+        }
+
+    if not results:
+        return {'all': None, 'routes': {}, 'statuses': {}}
+    routes = {}
+    for result in results:
+        routes.setdefault(result[0], []).append(result)
+    statuses = Counter('none' if status is None else str(status) for _, status, _ in results)
+    return {'all': figures(results), 'routes': {route: figures(samples) for route, samples in sorted(routes.items())},
+            'statuses': dict(sorted(statuses.items()))}
+
+
+def print_summary(summary):
+    print(f"{'route':28} {'requests':>9} {'rps':>8} {'p50':>10} {'p95':>10} {'p99':>10} {'errors':>8}")
+    for route, row in [*summary['routes'].items(), ('all', summary['all'])]:
+        print(f"{route:28} {row['requests']:>9} {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.1f}ms "
+              f"{row['p95_ms']:>8.1f}ms {row['p99_ms']:>8.1f}ms {row['error_rate']:>7.1%}")
+    print('statuses: ' + ', '.join(f'{status} x{count}' for status, count in summary['statuses'].items()))
+
+
+def launch_server(name, stub_url, extra_env=None):
+    """Start a serving command against the stub and return (process, base URL) once it answers"""
+    from bench_shared_cache import wait_until_serving
+    port = free_port()
+    env = dict(os.environ, METAR_UPSTREAM_URL=stub_url, METAR_BIND=f'127.0.0.1:{port}', METAR_LOG_LEVEL='warning',
+               **(extra_env or {}))
+    env.pop('METAR_API_URL', None)
+    command = [part.format(port=port) for part in SERVERS[name]]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_serving(port, process)
+    except Exception:
+        process.kill()
+        raise
+    return process, f'http://127.0.0.1:{port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', help='base URL of a running server; by default --server is launched')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='gunicorn', help='serving command to launch')
+    parser.add_argument('--rps', type=float, default=100, help='requests sent per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to send for')
+    parser.add_argument('--concurrency', type=int, default=64, help='requests in flight at most')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds to wait for each answer')
+    parser.add_argument('--traffic', help='recorded traffic to replay, one request per line')
+    parser.add_argument('--record', help='write the generated traffic here as JSON lines')
+    parser.add_argument('--stations', type=int, default=200, help='distinct stations in generated traffic')
+    parser.add_argument('--batch-share', type=float, default=0.1, help='share of generated /metar/batch requests')
+    parser.add_argument('--get-share', type=float, default=0.3, help='share of generated GET /metar/<station>')
+    parser.add_argument('--batch-size', type=int, default=10, help='stations per generated batch request')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0, help='extra random stub latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of stub upstream requests failing with 503')
+    parser.add_argument('--corpus', help='METAR archive for the stub to serve, one report per line')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else None
+    if args.traffic:
+        with open(args.traffic, encoding='utf-8') as f:
+            requests = list(parse_traffic(f))
+        if not requests:
+            parser.error(f'no requests found in {args.traffic}')
+    else:
+        known = sorted(set(map(station_of, corpus))) if corpus else STATIONS
+        requests = generate_traffic(max(1, int(args.rps * args.duration)), station_ids(args.stations, known),
+                                    args.batch_share, args.get_share, args.batch_size, args.seed)
+        if args.record:
+            with open(args.record, 'w', encoding='utf-8') as f:
+                f.writelines(record_line(request) + '\n' for request in requests)
+
+    stub = process = None
+    target = args.target
+    if target is None:
+        stub = StubUpstream(seed=args.seed, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            corpus=corpus).start()
+    try:
+        if target is None:
+            process, target = launch_server(args.server, stub.url)
+        results, elapsed = replay(target, requests, args.rps, args.duration, args.concurrency, args.timeout)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            process.wait(30)
+        if stub is not None:
+            stub.stop()
+
+    if not results:
+        parser.error('no requests sent; raise --rps or --duration')
+    summary = summarize(results, elapsed)
+    if stub is not None:
+        summary['upstream'] = {'requests': stub.requests, 'injected_errors': stub.errors}
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    print(f"{target if args.target else args.server}: {len(results)} requests at {args.rps:g} rps target "
+          f"over {elapsed:.1f}s")
+    print_summary(summary)
+    if stub is not None:
+        print(f"upstream: {stub.requests} requests, {stub.errors} answered 503 by the stub")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
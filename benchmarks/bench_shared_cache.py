@@ -0,0 +1,153 @@
+"""Upstream calls made by several gunicorn workers, with and without a shared cache.
+
+Launches gunicorn with --workers workers against a stub upstream with a
+fixed latency, then sends --clients concurrent POST /metar requests for
+each of --stations stations, which the kernel spreads over the workers.
+With only per-process caches every worker that gets a station fetches it;
+with a shared cache (SQLite on /dev/shm, or the Redis-protocol backend
+against a local CacheServer) one worker fetches it and the others read
+its result. Reports upstream requests per station and client latency.
+
+Then every worker's prefetcher is left to keep the same stations warm on
+a short TTL for --prefetch-seconds, and the upstream requests per refresh
+cycle are counted. Without a shared cache each worker refreshes them
+every cycle; with one, a cycle costs a single refresh for all workers.
+
+    python benchmarks/bench_shared_cache.py --workers 4 --stations 50 --clients 8
+"""
+import argparse
+import math
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from bench_cold_start import free_port, post_metar
+from shared_cache import CacheServer
+from stub_upstream import StubUpstream
+
+
+def wait_until_serving(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).close()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+            time.sleep(0.05)
+    raise RuntimeError(f'gunicorn did not start within {timeout} seconds')
+
+
+def timed_post(port, station_id):
+    start = time.perf_counter()
+    status = post_metar(port, station_id)
+    return status, time.perf_counter() - start
+
+
+def start_server(port, shared_url, stub, args, **settings):
+    env = dict(os.environ, METAR_API_URL=f'{stub.url}/api/data/metar', METAR_BIND=f'127.0.0.1:{port}',
+               METAR_WORKERS=str(args.workers), METAR_THREADS=str(args.clients),
+               METAR_SHARED_CACHE=shared_url, METAR_LOG_LEVEL='warning', **settings)
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                            cwd=ROOT, env=env)
+
+
+def run_mode(label, shared_url, stub, args):
+    port = free_port()
+    process = start_server(port, shared_url, stub, args)
+    try:
+        wait_until_serving(port, process)
+        before = stub.requests
+        stations = [f'K{index:03d}' for index in range(args.stations)]
+        with ThreadPoolExecutor(args.clients) as pool:
+            results = list(pool.map(lambda station_id: timed_post(port, station_id),
+                                    [station_id for station_id in stations for _ in range(args.clients)]))
+        upstream = stub.requests - before
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(30)
+
+    latencies = sorted(seconds for _, seconds in results)
+    errors = sum(1 for status, _ in results if status != 200)
+    print(f"{label:10} {upstream:>9} {upstream / args.stations:>12.2f} "
+          f"{statistics.median(latencies) * 1000:>8.1f}ms {latencies[int(len(latencies) * 0.99)] * 1000:>8.1f}ms "
+          f"{errors:>7}")
+
+
+def run_prefetch(label, shared_url, stub, args):
+    """Count upstream requests per cycle while every worker prefetches the stations"""
+    port = free_port()
+    stations = [f'K{index:03d}' for index in range(args.stations)]
+    lead = args.prefetch_ttl / 2
+    before = stub.requests
+    process = start_server(port, shared_url, stub, args, METAR_PREFETCH_STATIONS=','.join(stations),
+                           METAR_CACHE_TTL=str(args.prefetch_ttl), METAR_PREFETCH_LEAD=str(lead),
+                           METAR_PREFETCH_JITTER='0')
+    try:
+        wait_until_serving(port, process)
+        time.sleep(args.prefetch_seconds)
+        upstream = stub.requests - before
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(30)
+
+    # One cycle as each worker starts, then one per interval; each request covers a chunk of stations
+    cycles = 1 + int(args.prefetch_seconds // (args.prefetch_ttl - lead))
+    per_cycle = math.ceil(args.stations / 100)
+    print(f"{label:10} {upstream:>9} {cycles:>7} {upstream / cycles:>10.2f} {upstream / cycles / per_cycle:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--stations', type=int, default=50, help='distinct stations requested')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent requests per station')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub upstream latency in seconds')
+    parser.add_argument('--prefetch-seconds', type=float, default=10,
+                        help='how long the prefetchers run; 0 skips the prefetch check')
+    parser.add_argument('--prefetch-ttl', type=float, default=4, help='cache TTL in seconds while prefetching')
+    args = parser.parse_args()
+
+    stub = StubUpstream(latency=args.latency).start()
+    cache_server = CacheServer().start()
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        print(f"{args.workers} workers, {args.stations} stations x {args.clients} concurrent requests")
+        print(f"{'cache':10} {'upstream':>9} {'per station':>12} {'p50':>10} {'p99':>10} {'errors':>7}")
+        try:
+            run_mode('local', '', stub, args)
+            run_mode('sqlite', f'sqlite://{tmp}/metar-cache.db', stub, args)
+            run_mode('redis', 'redis://%s:%d' % cache_server.server_address, stub, args)
+            if args.prefetch_seconds > 0:
+                print(f"\nprefetching {args.stations} stations for {args.prefetch_seconds:g}s, "
+                      f"TTL {args.prefetch_ttl:g}s")
+                print(f"{'cache':10} {'upstream':>9} {'cycles':>7} {'per cycle':>10} {'per station':>11}")
+                run_prefetch('local', '', stub, args)
+                run_prefetch('sqlite', f'sqlite://{tmp}/metar-prefetch.db', stub, args)
+                # A fresh server, so no entry cached by the /metar runs with the default TTL is left
+                prefetch_server = CacheServer().start()
+                try:
+                    run_prefetch('redis', 'redis://%s:%d' % prefetch_server.server_address, stub, args)
+                finally:
+                    prefetch_server.stop()
+        finally:
+            cache_server.stop()
+            stub.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
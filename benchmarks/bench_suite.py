@@ -0,0 +1,249 @@
+"""Benchmark suite for the decode and fetch paths, with a regression gate.
+
+Runs a fixed set of measurements and compares them with a stored JSON
+baseline:
+
+- decode_reports_per_sec: decode_metar throughput over a synthetic corpus,
+  with the decode memo cleared before each run
+- metar_miss_p50_ms / metar_miss_p99_ms: latency of POST /metar through
+  the Flask test client when the station is not cached, against a local
+  stub upstream (benchmarks/stub_upstream.py)
+- metar_hit_p50_ms / metar_hit_p99_ms: the same requests again, served
+  from the cache
+
+- decode_peak_bytes_per_report: peak traced memory while decoding and
+  keeping --memory-size reports, per report
+
+Every timed measurement is repeated and keeps its best run, so a single
+scheduling hiccup does not read as a regression. When something still
+looks regressed, the suite runs once more and only fails on metrics that
+regress both times (--no-confirm fails on the first run).
+
+A metric regresses when it is worse than the baseline by more than
+--threshold (a fraction), or twice that for p99 latencies. The exit status is 1 if anything regressed, so
+the suite can gate a change. --save writes the results as the new
+baseline instead. Baselines are only comparable on the same machine and
+Python version, which are recorded alongside the metrics.
+
+    python benchmarks/bench_suite.py --save
+    python benchmarks/bench_suite.py --threshold 0.15
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+import decoder
+from corpus import generate_corpus
+from stub_upstream import StubUpstream
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Whether a larger value of each metric is better
+HIGHER_IS_BETTER = {
+    'decode_reports_per_sec': True,
+    'metar_miss_p50_ms': False,
+    'metar_miss_p99_ms': False,
+    'metar_hit_p50_ms': False,
+    'metar_hit_p99_ms': False,
+    'decode_peak_bytes_per_report': False,
+}
+
+# Tail latencies swing more than medians, so they get this multiple of the threshold
+TAIL_TOLERANCE = 2
+
+# Report features the corpus has to cover for the numbers to mean anything
+CORPUS_FEATURES = {
+    'cavok': re.compile(r' CAVOK '),
+    'fractional_sm': re.compile(r' (?:\d )?\d/\dSM '),
+    'gusts': re.compile(r' \d{5}G\d{2}(?:KT|MPS) '),
+    'multi_layer_clouds': re.compile(r' (?:FEW|SCT|BKN|OVC)\d{3}\S* (?:FEW|SCT|BKN|OVC)\d{3}'),
+    'negative_temperatures': re.compile(r' M\d{2}/'),
+}
+
+
+def corpus_coverage(corpus):
+    """Return {feature: number of reports showing it}"""
+    return {name: sum(1 for metar_text in corpus if pattern.search(f' {metar_text} '))
+            for name, pattern in CORPUS_FEATURES.items()}
+
+
+def percentile(values, fraction):
+    """Return the value below which fraction of the sorted values fall"""
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure_decode(corpus, repeat):
+    """Return the best decode_metar throughput in reports/sec"""
+    best = 0
+    for _ in range(repeat):
+        decoder.decode_memo.clear()
+        gc.collect()
+        start = time.perf_counter()
+        for metar_text in corpus:
+            decoder.decode_metar(metar_text)
+        best = max(best, len(corpus) / (time.perf_counter() - start))
+    return best
+
+
+def nth_station_id(number):
+    """Return the number-th ICAO-shaped station ID: K and three base-36 digits"""
+    digits = string.digits + string.ascii_uppercase
+    return 'K' + ''.join(digits[number // 36 ** power % 36] for power in (2, 1, 0))
+
+
+def measure_route(requests, repeat):
+    """Return the best /metar latency percentiles in ms, for cache misses and hits"""
+    server = StubUpstream().start()
+    original_url = app.METAR_API_URL
+    app.METAR_API_URL = f'{server.url}/api/data/metar'
+    client = app.app.test_client()
+    app.metar_cache.clear()
+    app.upstream_validators.clear()
+    best = {}
+    try:
+        for run in range(repeat):
+            # Fresh stations every run, so the first pass always misses
+            stations = [nth_station_id(run * requests + index) for index in range(requests)]
+            for label in ('miss', 'hit'):
+                gc.collect()
+                samples = []
+                for station_id in stations:
+                    start = time.perf_counter()
+                    response = client.post('/metar', data={'station_id': station_id})
+                    samples.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'/metar answered {response.status_code} for {station_id}')
+                for name, value in ((f'metar_{label}_p50_ms', statistics.median(samples)),
+                                    (f'metar_{label}_p99_ms', percentile(samples, 0.99))):
+                    best[name] = min(best.get(name, value), value)
+    finally:
+        app.METAR_API_URL = original_url
+        app.metar_cache.clear()
+        server.stop()
+    return {name: round(value, 4) for name, value in best.items()}
+
+
+def measure_memory(corpus):
+    """Return peak traced bytes per report while decoding and keeping corpus"""
+    decoder.decode_memo.clear()
+    tracemalloc.start()
+    decoded = [decoder.parse_metar(metar_text) for metar_text in corpus]
+    for report in decoded:
+        report.render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / len(decoded)
+
+
+def run(size=20000, requests=500, memory_size=20000, repeat=5, seed=0):
+    """Run every measurement and return the results document"""
+    corpus = generate_corpus(size, seed)
+    coverage = corpus_coverage(corpus)
+    missing = [name for name, count in coverage.items() if not count]
+    if missing:
+        raise RuntimeError(f'corpus does not cover {", ".join(missing)}')
+
+    metrics = {'decode_reports_per_sec': round(measure_decode(corpus, repeat), 1)}
+    metrics.update(measure_route(requests, repeat))
+    metrics['decode_peak_bytes_per_report'] = round(measure_memory(generate_corpus(memory_size, seed + 1)), 1)
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'parameters': {'size': size, 'requests': requests, 'memory_size': memory_size,
+                       'repeat': repeat, 'seed': seed},
+        'coverage': coverage,
+        'metrics': metrics,
+    }
+
+
+def compare(metrics, baseline, threshold):
+    """Return [(name, baseline, current, change, regressed)] for metrics in both.
+
+    change is the relative difference from the baseline, positive when
+    the metric got worse.
+    """
+    rows = []
+    for name, current in metrics.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        change = (current - previous) / previous
+        if HIGHER_IS_BETTER.get(name, False):
+            change = -change
+        limit = threshold * TAIL_TOLERANCE if '_p99_' in name else threshold
+        rows.append((name, previous, current, change, change > limit))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative change past which a metric counts as regressed')
+    parser.add_argument('--no-confirm', action='store_true',
+                        help='fail on the first run instead of confirming regressions with a second')
+    parser.add_argument('--size', type=int, default=20000, help='reports in the decode corpus')
+    parser.add_argument('--requests', type=int, default=500, help='/metar requests per latency run')
+    parser.add_argument('--memory-size', type=int, default=20000, help='reports kept for the memory measurement')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each measurement, best one counts')
+    parser.add_argument('--seed', type=int, default=0, help='corpus random seed')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.requests, args.memory_size, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        for name, value in results['metrics'].items():
+            print(f"{name:30} {value:>14,}")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != results['environment']:
+        print(f"warning: baseline was recorded on {baseline.get('environment')}", file=sys.stderr)
+
+    rows = compare(results['metrics'], baseline['metrics'], args.threshold)
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions and not args.no_confirm:
+        print(f"confirming {', '.join(regressions)} with a second run", file=sys.stderr)
+        again = run(args.size, args.requests, args.memory_size, args.repeat, args.seed)
+        confirmed = {row[0] for row in compare(again['metrics'], baseline['metrics'], args.threshold) if row[4]}
+        rows = [row[:4] + (row[4] and row[0] in confirmed,) for row in rows]
+        regressions = [row[0] for row in rows if row[4]]
+
+    for name, previous, current, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else 'ok'
+        print(f"{name:30} {previous:>14,} {current:>14,} {-change:>+8.1%}  {flag}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"no regressions past {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
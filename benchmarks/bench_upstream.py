@@ -0,0 +1,67 @@
+"""Per-request latency of upstream fetches, unpooled vs pooled.
+
+Starts a local stub METAR server and fetches from it sequentially, first
+with a bare requests.get per call (a new connection every time) and then
+through the pooled keep-alive UpstreamClient.
+
+    python benchmarks/bench_upstream.py --requests 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from stub_upstream import StubUpstream
+from upstream import UpstreamClient
+
+
+def measure(get, url, count):
+    """Fetch url count times and return per-request latencies in ms"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = get(url)
+        response.content
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label, latencies, connections):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:9} mean {statistics.mean(latencies):.3f} ms  "
+          f"p50 {statistics.median(latencies):.3f} ms  p99 {p99:.3f} ms  "
+          f"connections {connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mode')
+    args = parser.parse_args()
+
+    server = StubUpstream().start()
+    url = f"{server.url}/api/data/metar?ids=KHIO"
+    try:
+        unpooled = measure(requests.get, url, args.requests)
+        unpooled_connections = server.connections
+
+        client = UpstreamClient()
+        pooled = measure(client.get, url, args.requests)
+        pooled_connections = server.connections - unpooled_connections
+        client.close()
+    finally:
+        server.stop()
+
+    summarize('unpooled', unpooled, unpooled_connections)
+    summarize('pooled', pooled, pooled_connections)
+    print(f"mean improvement: {statistics.mean(unpooled) - statistics.mean(pooled):.3f} ms/request")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
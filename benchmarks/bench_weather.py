@@ -0,0 +1,107 @@
+"""Throughput of weather and sky group decoding on weather-heavy reports.
+
+Generates reports with two to four present weather groups, recent weather
+and multi-layer clouds, then times the weather and sky group parsers on
+their tokens: the previous substring scan and prefix probes, the compiled
+WMO grammar without its lru_cache, and the cached parsers the decoder
+uses. Also prints parse_metar throughput over the reports.
+
+    python benchmarks/bench_weather.py --size 50000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from decoder import SKY_CODES, WEATHER_CODES, parse_metar, parse_sky, parse_weather
+from corpus import generate_metar
+
+HEAVY_WEATHER = [
+    '-RA', '+RA', '-SHRA', '+SHRASN', 'TSRA', '+TSRAGR', '-TSRASN', 'VCTS', 'VCSH', 'VCFG',
+    'FZFG', '-FZDZ', '+FZRA', 'BLSN', 'DRSN', 'BR', 'HZ', 'FU', 'MIFG', 'BCFG', 'PRFG',
+    '-SNPL', 'SG', 'GS', '+SS', 'DS', 'PO', 'SQ', '+FC', 'UP', 'VA', 'DU', 'SA', 'PY',
+]
+RECENT_WEATHER = ['RERA', 'RESN', 'RETSRA', 'RESHRA', 'REFZRA', 'REDZ']
+
+OLD_WEATHER_PATTERN = re.compile('|'.join(re.escape(code) for code in WEATHER_CODES if len(code) == 2))
+
+
+def old_parse_weather(part):
+    """parse_weather as it was: scan for any two-letter code in the group"""
+    intensity = ''
+    codes = part
+    if part[0] in '-+':
+        intensity = part[0]
+        codes = part[1:]
+    matched = OLD_WEATHER_PATTERN.findall(codes)
+    if not intensity and not matched:
+        return None
+    group = intensity + ''.join(matched)
+    return part if group == part else group
+
+
+def old_parse_sky(part):
+    """parse_sky as it was, without its cache"""
+    code = part[:3]
+    if code not in SKY_CODES:
+        code = part[:2]
+        if code != 'VV':
+            return None
+    height = part[len(code):]
+    if code in ['FEW', 'SCT', 'BKN', 'OVC', 'VV'] and height.isdigit():
+        return (code, int(height) * 100)
+    return (code, None)
+
+
+def weather_heavy_metar(rng):
+    """Return a synthetic report with several weather groups inserted before the clouds"""
+    groups = generate_metar(rng).split()
+    weather = rng.sample(HEAVY_WEATHER, rng.randint(2, 4))
+    position = next((i for i, group in enumerate(groups) if group[:3] in ('FEW', 'SCT', 'BKN', 'OVC')), len(groups) - 2)
+    groups[position:position] = weather
+    if rng.random() < 0.5:
+        groups.insert(len(groups) - 1, rng.choice(RECENT_WEATHER))
+    if rng.random() < 0.1:
+        groups.append('NSW')
+    return ' '.join(groups)
+
+
+def measure(function, items, repeat=1):
+    """Call function on every item repeat times and return calls/sec"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    return len(items) * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=50000, help='number of reports')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reports = [weather_heavy_metar(rng) for _ in range(args.size)]
+    # Tokens that reach the weather and sky parsers in parse_metar
+    tokens = [part for report in reports for part in report.split()[2:]
+              if '/' not in part and part[0] not in 'AQ' and not part[0].isdigit()]
+
+    print(f"reports: {len(reports)} ({len(tokens)} weather/sky candidate tokens)")
+    for label, weather, sky in (
+        ('previous', old_parse_weather, old_parse_sky),
+        ('grammar', parse_weather.__wrapped__, parse_sky.__wrapped__),
+        ('cached', parse_weather, parse_sky),
+    ):
+        print(f"{label:9} weather {measure(weather, tokens):>12,.0f} tokens/sec   "
+              f"sky {measure(sky, tokens):>12,.0f} tokens/sec")
+    print(f"parse_metar: {measure(parse_metar, reports):,.0f} reports/sec")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Synthetic METAR corpus for benchmarks.
+
+Reports are generated from a seeded random source so that runs are
+repeatable. The mix covers the formats decode_metar has to deal with:
+US and ICAO style reports, gusts, fractional and metric visibility,
+CAVOK, present weather, multi-layer clouds, negative temperatures and
+remark tails. load_corpus() reads recorded reports instead, one per line.
+"""
+import gzip
+import random
+
+STATIONS = [
+    'KHIO', 'KJFK', 'KLAX', 'KORD', 'KSFO', 'KDEN', 'KSEA', 'KMIA',
+    'KBOS', 'KATL', 'KDFW', 'KPHX', 'EGLL', 'LFPG', 'EDDF', 'EHAM',
+    'LEMD', 'LIRF', 'ESSA', 'ENGM', 'RJTT', 'YSSY', 'CYYZ', 'CYVR',
+]
+
+WEATHER = [
+    '-RA', 'RA', '+RA', '-SHRA', 'TSRA', '+TSRA', 'VCTS', 'BR', 'FG',
+    'HZ', '-SN', 'SN', 'BLSN', '-FZDZ', 'FZRA', '-SHSN', 'MIFG', 'BCFG',
+    'DZ', '-RASN', 'VCSH', 'FU', 'SQ',
+]
+
+COVERS = ['FEW', 'SCT', 'BKN', 'OVC']
+
+US_VISIBILITY = [
+    '10SM', '10SM', '10SM', '7SM', '5SM', '3SM', '2SM', '1SM', '1/2SM',
+    '1/4SM', '3/4SM', '1 1/2SM', '2 1/2SM',
+]
+
+METRIC_VISIBILITY = ['9999', '9999', '8000', '6000', '4000', '3000', '1500', '0800', '0400']
+
+
+def _wind(rng, metric):
+    unit = 'MPS' if metric and rng.random() < 0.2 else 'KT'
+    roll = rng.random()
+    if roll < 0.05:
+        return f'00000{unit}'
+    if roll < 0.12:
+        return f'VRB{rng.randint(1, 5):02d}{unit}'
+    direction = rng.randrange(10, 370, 10)
+    speed = rng.randint(2, 30)
+    if rng.random() < 0.2:
+        return f'{direction:03d}{speed:02d}G{speed + rng.randint(5, 20):02d}{unit}'
+    return f'{direction:03d}{speed:02d}{unit}'
+
+
+def _clouds(rng):
+    roll = rng.random()
+    if roll < 0.1:
+        return ['CLR']
+    if roll < 0.15:
+        return ['SKC']
+    if roll < 0.2:
+        return ['NSC']
+    if roll < 0.25:
+        return [f'VV{rng.randint(1, 5):03d}']
+    layers = []
+    height = rng.randint(3, 40)
+    for cover in sorted(rng.sample(COVERS, rng.randint(1, 3)), key=COVERS.index):
+        suffix = rng.choice(['', '', '', '', 'CB', 'TCU'])
+        layers.append(f'{cover}{height:03d}{suffix}')
+        height += rng.randint(5, 60)
+    return layers
+
+
+def _temperature(value):
+    return f'M{-value:02d}' if value < 0 else f'{value:02d}'
+
+
+def generate_metar(rng):
+    """Return one synthetic METAR report."""
+    station = rng.choice(STATIONS)
+    metric = not station.startswith('K')
+    groups = []
+    if rng.random() < 0.7:
+        groups.append(rng.choice(['METAR', 'METAR', 'SPECI']))
+    groups.append(station)
+    groups.append(f'{rng.randint(1, 28):02d}{rng.randint(0, 23):02d}{rng.choice([0, 20, 50, 53]):02d}Z')
+    if rng.random() < 0.3:
+        groups.append('AUTO')
+    groups.append(_wind(rng, metric))
+    if rng.random() < 0.1:
+        start = rng.randrange(0, 360, 10)
+        groups.append(f'{start:03d}V{(start + 60) % 360:03d}')
+
+    cavok = metric and rng.random() < 0.2
+    if cavok:
+        groups.append('CAVOK')
+    else:
+        groups.append(rng.choice(METRIC_VISIBILITY if metric else US_VISIBILITY))
+        if rng.random() < 0.05:
+            groups.append(f'R{rng.randint(1, 36):02d}L/{rng.randint(6, 60) * 100:04d}FT')
+        if rng.random() < 0.35:
+            groups.extend(rng.sample(WEATHER, rng.randint(1, 2)))
+        groups.extend(_clouds(rng))
+
+    temp = rng.randint(-25, 35)
+    dew = temp - rng.randint(0, 10)
+    groups.append(f'{_temperature(temp)}/{_temperature(dew)}')
+    if metric:
+        groups.append(f'Q{rng.randint(980, 1040)}')
+        if rng.random() < 0.3:
+            groups.append(rng.choice(['NOSIG', 'BECMG', 'TEMPO']))
+    else:
+        groups.append(f'A{rng.randint(2900, 3080)}')
+        if rng.random() < 0.5:
+            groups.extend(['RMK', 'AO2', f'SLP{rng.randint(0, 999):03d}', f'T{rng.randint(0, 1)}{rng.randint(0, 350):03d}{rng.randint(0, 1)}{rng.randint(0, 300):03d}'])
+    return ' '.join(groups)
+
+
+def generate_corpus(size, seed=0):
+    """Return a list of ``size`` synthetic METAR reports."""
+    rng = random.Random(seed)
+    return [generate_metar(rng) for _ in range(size)]
+
+
+def generate_taf(rng, station):
+    """Return one synthetic TAF for station, change groups on indented lines like the upstream's."""
+    metric = not station.startswith('K')
+    day, hour = rng.randint(1, 28), rng.choice([0, 6, 12, 18])
+    lines = [' '.join([f'TAF {station} {day:02d}{hour:02d}00Z {day:02d}{hour:02d}/{day + 1:02d}{hour:02d}',
+                       _wind(rng, metric), '9999' if metric else 'P6SM', *_clouds(rng)])]
+    for offset in sorted(rng.sample(range(2, 24), rng.randint(0, 3))):
+        start = f'{day + (hour + offset) // 24:02d}{(hour + offset) % 24:02d}'
+        roll = rng.random()
+        if roll < 0.5:
+            groups = [f'FM{start}00', _wind(rng, metric), rng.choice(METRIC_VISIBILITY if metric else US_VISIBILITY)]
+        else:
+            change = 'TEMPO' if roll < 0.8 else 'PROB30 TEMPO'
+            end = f'{day + (hour + offset + 4) // 24:02d}{(hour + offset + 4) % 24:02d}'
+            groups = [change, f'{start}/{end}', rng.choice(WEATHER)]
+        lines.append('  ' + ' '.join(groups + _clouds(rng)))
+    return '\n'.join(lines)
+
+
+def station_of(metar_text):
+    """Return the station of a raw METAR, after any METAR or SPECI prefix"""
+    groups = metar_text.split(None, 2)
+    if groups and groups[0] in ('METAR', 'SPECI') and len(groups) > 1:
+        return groups[1]
+    return groups[0] if groups else None
+
+
+def load_corpus(path):
+    """Return the reports of a METAR archive, one per line, gzipped if it ends in .gz"""
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rt', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
@@ -0,0 +1,196 @@
+"""Local stand-in for the aviationweather.gov METAR API.
+
+Serves /api/data/metar?ids=... over HTTP/1.1 with keep-alive, answering
+each requested station with a synthetic report, or with the station's
+reports from a recorded corpus when one is given. taf=true adds a
+synthetic TAF per station. Used by the benchmarks and load tests so they
+never touch the real upstream.
+
+Each answer waits latency seconds plus up to jitter more, and a share of
+requests (error_rate) gets an empty 503 instead. Answers carry an ETag
+and Last-Modified and conditional requests that match get an empty 304.
+advance() issues new reports for some stations, like a new observation
+cycle. requests counts the METAR requests answered, errors the injected
+503s and bytes_sent the body bytes served.
+
+    python benchmarks/stub_upstream.py --port 8081 --latency 0.05 --jitter 0.1 --error-rate 0.01
+    METAR_UPSTREAM_URL=http://127.0.0.1:8081 gunicorn -c gunicorn.conf.py app:app
+"""
+import argparse
+import gzip
+import random
+import threading
+import time
+import zlib
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from corpus import generate_metar, generate_taf, load_corpus, station_of
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/api/data/metar':
+            self.send_error(404)
+            return
+        self.server.count_request()
+        delay, failed = self.server.draw()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        query = parse_qs(url.query)
+        ids = query.get('ids', [''])[0]
+        stations = [station for station in ids.split(',') if station]
+        with_taf = query.get('taf', [''])[0] == 'true'
+        body = '\n'.join(self.server.report(station) + ('\n' + self.server.taf(station) if with_taf else '')
+                         for station in stations)
+        payload = body.encode()
+        etag = '"%08x"' % zlib.crc32(payload)
+        last_modified = formatdate(self.server.last_modified(stations), usegmt=True)
+        if self.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        # Counted before writing, so a client that got the body sees the count
+        self.server.count_sent(len(payload))
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubUpstream(ThreadingHTTPServer):
+    """Stub METAR server running in a background thread"""
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, seed=0, latency=0, jitter=0, error_rate=0, corpus=None):
+        super().__init__((host, port), StubHandler)
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.corpus = {}
+        for metar_text in corpus or ():
+            self.corpus.setdefault(station_of(metar_text), []).append(metar_text)
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._cycles = {}
+        self._updated = {}
+        self._started = int(time.time())
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def draw(self):
+        """Return (seconds to wait, whether to fail) for one request"""
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def report(self, station):
+        """Return the current METAR for station, stable until advanced.
+
+        Stations in the corpus cycle through their recorded reports; the
+        others get synthetic ones.
+        """
+        cycle = self._cycles.get(station, 0)
+        recorded = self.corpus.get(station)
+        if recorded:
+            return recorded[cycle % len(recorded)]
+        rng = random.Random(f'{self.seed}:{station}:{cycle}' if cycle else f'{self.seed}:{station}')
+        metar_text = generate_metar(rng)
+        groups = metar_text.split()
+        index = 1 if groups[0] in ('METAR', 'SPECI') else 0
+        groups[index] = station
+        return ' '.join(groups)
+
+    def taf(self, station):
+        """Return a synthetic TAF for station, stable until advanced"""
+        cycle = self._cycles.get(station, 0)
+        return generate_taf(random.Random(f'{self.seed}:{station}:taf:{cycle}'), station)
+
+    def advance(self, stations):
+        """Issue a new report for each of stations"""
+        now = int(time.time())
+        with self._lock:
+            for station in stations:
+                self._cycles[station] = self._cycles.get(station, 0) + 1
+                self._updated[station] = now
+
+    def last_modified(self, stations):
+        """Return when the newest report of stations was issued, in epoch seconds"""
+        return max([self._updated.get(station, self._started) for station in stations], default=self._started)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_sent(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before answering')
+    parser.add_argument('--jitter', type=float, default=0, help='up to this many more seconds, at random')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered 503')
+    parser.add_argument('--corpus', help='serve the reports in this METAR archive, one per line, .gz supported')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic reports, delays and errors')
+    args = parser.parse_args()
+
+    server = StubUpstream(args.host, args.port, seed=args.seed, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, corpus=load_corpus(args.corpus) if args.corpus else None)
+    print(f'Serving stub METAR API on {server.url}', flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
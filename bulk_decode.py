@@ -0,0 +1,246 @@
+"""Bulk offline METAR decoder.
+
+Streams raw METAR lines from files or stdin, decodes them in chunks across
+a process pool and writes one JSON object or CSV row per report. Only a
+bounded number of chunks is in flight at any time, so memory use does not
+grow with the size of the input.
+
+    python bulk_decode.py archive-2019.txt archive-2020.txt.gz -o decoded.jsonl
+    zcat archive.gz | python bulk_decode.py --format csv --unordered > decoded.csv
+    python bulk_decode.py --mmap --index archive-2020.txt -o decoded.jsonl
+
+With --mmap, uncompressed files are memory-mapped and workers are handed
+byte ranges of whole lines rather than the lines themselves. With --profile,
+every worker times the decoder by group kind and the merged profile, with
+the slowest reports, is printed to stderr or written as JSON.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections import deque
+from functools import partial
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+
+from decoder import DECODE_PROFILE_SLOWEST, DecodedMetar, DecodedRemarks, enable_decode_profile, parse_metar_cached
+from archive import ArchiveReader, read_range
+from metrics import DecodeProfile
+
+CSV_FIELDS = ([name for name in DecodedMetar.FIELDS if name != 'remarks']
+              + [f'remarks_{name}' for name in DecodedRemarks.FIELDS] + ['decoded_report'])
+
+
+def read_lines(paths):
+    """Yield stripped, non-empty lines from the given files ('-' is stdin)"""
+    for path in paths or ['-']:
+        if path == '-':
+            stream = sys.stdin
+        elif path.endswith('.gz'):
+            stream = gzip.open(path, 'rt')
+        else:
+            stream = open(path)
+        try:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield line
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def chunked(lines, size):
+    """Group an iterable of lines into lists of at most size lines"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def decode_chunk(chunk, with_text=False):
+    """Decode a list of raw METARs into JSON-serializable records"""
+    records = []
+    for metar_text in chunk:
+        decoded = parse_metar_cached(metar_text)
+        record = decoded.to_dict()
+        if with_text:
+            record['decoded_report'] = decoded.render()
+        records.append(record)
+    return records
+
+
+def archive_ranges(paths, lines_per_chunk, persist_index=False):
+    """Yield (path, start, end) byte ranges of whole lines from memory-mapped files"""
+    for path in paths:
+        with ArchiveReader(path, persist_index=persist_index) as archive:
+            for start, end in archive.chunks(lines_per_chunk):
+                yield path, start, end
+
+
+def decode_range(task, with_text=False):
+    """Decode the lines in a (path, start, end) byte range of an archive"""
+    lines = (line.strip() for line in read_range(*task).splitlines())
+    return decode_chunk([line for line in lines if line], with_text)
+
+
+def profile_chunk(decoder, task, with_text=False):
+    """Run decoder on one task with the decode profile on; return (records, profile state).
+
+    Reports already in this process's decode memo are not decoded again,
+    so they are not in the profile either.
+    """
+    profile = enable_decode_profile()
+    profile.reset()
+    records = decoder(task, with_text)
+    return records, profile.state()
+
+
+def print_profile(state, stream):
+    """Print a merged decode profile as a table of group kinds and the slowest reports"""
+    print(f"Decode profile: {state['reports']} reports, {state['mean_us']:.1f} us/report", file=stream)
+    print(f"  {'group':<12} {'tokens':>10} {'total ms':>10} {'us/token':>9}", file=stream)
+    for kind, counts in sorted(state['groups'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"  {kind:<12} {counts['tokens']:>10} {counts['seconds'] * 1000:>10.1f} {counts['mean_us']:>9.2f}",
+              file=stream)
+    if state['slowest']:
+        print("Slowest reports:", file=stream)
+    for report in state['slowest']:
+        parts = sorted(report['groups'].items(), key=lambda item: -item[1])[:3]
+        slowest = ', '.join(f"{kind} {seconds * 1e6:.0f} us" for kind, seconds in parts)
+        print(f"  {report['seconds'] * 1e6:>8.0f} us  {report['raw']}  ({slowest})", file=stream)
+
+
+def decode_stream(chunks, workers, ordered=True, with_text=False, decoder=decode_chunk):
+    """Decode chunks on a process pool, yielding lists of records.
+
+    At most two chunks per worker are queued at once. With ordered=False
+    results are yielded as soon as any chunk finishes.
+    """
+    if workers <= 0:
+        for chunk in chunks:
+            yield decoder(chunk, with_text)
+        return
+
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(decoder, chunk, with_text))
+            while len(pending) >= max_pending:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield future.result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class JSONLWriter:
+    """Writes one JSON object per line"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record))
+        self.stream.write('\n')
+
+
+class CSVWriter:
+    """Writes one CSV row per record, flattening weather, cloud layers and remarks"""
+
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, record):
+        row = dict(record)
+        row['weather'] = ' '.join(record['weather'])
+        row['recent_weather'] = ' '.join(record['recent_weather'])
+        row['clouds'] = ' '.join(
+            layer['cover'] if layer['height_ft'] is None else f"{layer['cover']}:{layer['height_ft']}"
+            for layer in record['clouds']
+        )
+        for name, value in (record['remarks'] or {}).items():
+            row[f'remarks_{name}'] = value
+        self.writer.writerow(row)
+
+
+WRITERS = {'jsonl': JSONLWriter, 'csv': CSVWriter}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decode archived METAR reports in bulk.')
+    parser.add_argument('inputs', nargs='*', help="input files, '.gz' supported; '-' or none for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl', help='output format')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='decoder processes; 0 decodes in this process')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='reports per worker task')
+    parser.add_argument('--unordered', action='store_true',
+                        help='write results as chunks finish instead of in input order')
+    parser.add_argument('--text', action='store_true', help='include the plain English report')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory-map uncompressed input files and hand workers byte ranges')
+    parser.add_argument('--index', action='store_true',
+                        help='with --mmap, keep the line index beside each file for reuse')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='PATH',
+                        help="time the decoder by group kind; print to stderr, or write JSON to PATH")
+    args = parser.parse_args(argv)
+
+    if args.mmap:
+        if not args.inputs or any(path == '-' or path.endswith('.gz') for path in args.inputs):
+            parser.error('--mmap needs uncompressed input files')
+        chunks = archive_ranges(args.inputs, args.chunk_size, args.index)
+        decoder = decode_range
+    else:
+        chunks = chunked(read_lines(args.inputs), args.chunk_size)
+        decoder = decode_chunk
+
+    profile = None
+    if args.profile:
+        # Workers profile each chunk on their own; the totals add up here
+        profile = DecodeProfile(slowest=DECODE_PROFILE_SLOWEST, window=float('inf'))
+        decoder = partial(profile_chunk, decoder)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    writer = WRITERS[args.format](output)
+
+    start = time.perf_counter()
+    count = 0
+    try:
+        for records in decode_stream(chunks, args.workers, not args.unordered, args.text, decoder):
+            if profile is not None:
+                records, state = records
+                profile.merge(state)
+            for record in records:
+                writer.write(record)
+            count += len(records)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    print(f"Decoded {count} reports in {elapsed:.2f}s ({rate:,.0f} lines/sec)", file=sys.stderr)
+    if profile is not None:
+        if args.profile == '-':
+            print_profile(profile.state(), sys.stderr)
+        else:
+            with open(args.profile, 'w') as f:
+                json.dump(profile.state(), f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
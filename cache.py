@@ -0,0 +1,127 @@
+"""In-process cache for upstream METAR lookups."""
+from collections import OrderedDict
+import threading
+import time
+
+
+class _Call:
+    """An in-flight load that concurrent callers wait on"""
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a fixed time to live.
+
+    get_or_load() coalesces concurrent misses for the same key, so only one
+    caller runs the loader while the others wait for its result. Loaders
+    returning None are not cached, and a loader that caches its value
+    itself (say with a shorter ttl) keeps that entry. With ttl=None entries never expire and
+    the cache is a plain bounded LRU memo.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or self.clock() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return None
+
+    def _store(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else self.clock() + ttl
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            return self._lookup(key)
+
+    def set(self, key, value, ttl=None):
+        """Cache value under key for ttl seconds, by default the cache's time to live"""
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader(key) on a miss"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = loader(key)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if call.value is not None and key not in self._entries:
+                    self._store(key, call.value)
+                del self._inflight[key]
+            call.done.set()
+        return call.value
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = self.coalesced = 0
+
+    def stats(self):
+        """Return cache counters as a dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'coalesced': self.coalesced,
+            }
@@ -0,0 +1,857 @@
+"""Decoding of METAR and TAF reports into structured fields and plain English.
+
+Kept apart from app so batch tools can decode without building the web
+app, its upstream session and caches.
+"""
+from fractions import Fraction
+from functools import lru_cache
+import os
+import re
+import sys
+import time
+
+from cache import TTLCache
+from metrics import DecodeProfile
+
+# Stations repeat one report for 30-60 minutes, so decode each raw text once
+decode_memo = TTLCache(maxsize=int(os.environ.get('METAR_DECODE_MEMO_SIZE', 4096)), ttl=None)
+
+# Opt-in decoder profile: time and tokens per group kind and the slowest
+# reports, kept over two rolling windows. While it is None the decoder only
+# pays for that check; see enable_decode_profile.
+DECODE_PROFILE_SLOWEST = int(os.environ.get('METAR_DECODE_PROFILE_SLOWEST', 20))
+DECODE_PROFILE_WINDOW = float(os.environ.get('METAR_DECODE_PROFILE_WINDOW', 300))
+decode_profile = None
+
+# Weather phenomenon codes
+WEATHER_CODES = {
+    '-': 'Light',
+    '+': 'Heavy',
+    'VC': 'In the vicinity',
+    'MI': 'Shallow',
+    'PR': 'Partial',
+    'BC': 'Patches',
+    'DR': 'Low drifting',
+    'BL': 'Blowing',
+    'SH': 'Showers',
+    'TS': 'Thunderstorm',
+    'FZ': 'Freezing',
+    'DZ': 'Drizzle',
+    'RA': 'Rain',
+    'SN': 'Snow',
+    'SG': 'Snow grains',
+    'IC': 'Ice crystals',
+    'PL': 'Ice pellets',
+    'GR': 'Hail',
+    'GS': 'Small hail',
+    'UP': 'Unknown precipitation',
+    'BR': 'Mist',
+    'FG': 'Fog',
+    'FU': 'Smoke',
+    'VA': 'Volcanic ash',
+    'DU': 'Dust',
+    'SA': 'Sand',
+    'HZ': 'Haze',
+    'PY': 'Spray',
+    'PO': 'Dust whirls',
+    'SQ': 'Squalls',
+    'FC': 'Funnel cloud/tornado',
+    'SS': 'Sandstorm',
+    'DS': 'Duststorm',
+    'NSW': 'No significant weather'
+}
+
+# Present weather groups follow the WMO grammar: intensity or proximity, an
+# optional descriptor, then any run of phenomena (precipitation types may
+# combine, as in -SHRASN). RE marks recent weather, without intensity.
+WEATHER_DESCRIPTORS = ('MI', 'PR', 'BC', 'DR', 'BL', 'SH', 'TS', 'FZ')
+WEATHER_PHENOMENA = (
+    'DZ', 'RA', 'SN', 'SG', 'IC', 'PL', 'GR', 'GS', 'UP',
+    'BR', 'FG', 'FU', 'VA', 'DU', 'SA', 'HZ', 'PY',
+    'PO', 'SQ', 'FC', 'SS', 'DS',
+)
+_WEATHER_BODY = '(?:(?:{0})(?:{1})*|(?:{1})+)'.format('|'.join(WEATHER_DESCRIPTORS), '|'.join(WEATHER_PHENOMENA))
+WEATHER_PATTERN = re.compile(rf'(?P<present>(?:[-+]|VC)?{_WEATHER_BODY}|NSW)|RE(?P<recent>{_WEATHER_BODY})')
+
+# Sky cover codes
+SKY_CODES = {
+    'SKC': 'Sky clear',
+    'NCD': 'No clouds detected',
+    'CLR': 'Clear',
+    'NSC': 'No significant clouds',
+    'FEW': 'Few clouds',
+    'SCT': 'Scattered clouds',
+    'BKN': 'Broken clouds',
+    'VV': 'Vertical visibility',
+    'OVC': 'Overcast'
+}
+
+# Precompiled token classes, in the order the groups appear in a report
+WIND_PATTERN = re.compile(r'\d{3}\d{2}(?:G\d{2})?(?:KT|MPS|KMH)')
+VISIBILITY_METERS_PATTERN = re.compile(r'\d{4}')
+VISIBILITY_MILES_PATTERN = re.compile(r'\d+SM')
+VISIBILITY_FRACTION_PATTERN = re.compile(r'\d/\d(?:SM)?')
+
+# Remarks groups: SLPppp sea level pressure, TsTTTsDDD temperature and
+# dewpoint in tenths (s is 1 below zero), and PK WND dddff(f)/(hh)mm
+SEA_LEVEL_PRESSURE_PATTERN = re.compile(r'SLP(\d{3})')
+PRECISE_TEMPERATURE_PATTERN = re.compile(r'T([01])(\d{3})(?:([01])(\d{3}))?')
+PEAK_WIND_PATTERN = re.compile(r'(\d{3})(\d{2,3})/(\d{2})?(\d{2})')
+
+# TAF header and change groups. Amended, corrected or retarded reports
+# carry AMD, COR or RTD before the station.
+REPORT_MODIFIERS = frozenset(['AMD', 'COR', 'RTD'])
+TAF_ISSUED_PATTERN = re.compile(r'\d{6}Z')
+TAF_VALIDITY_PATTERN = re.compile(r'\d{4}/\d{4}')
+TAF_FROM_PATTERN = re.compile(r'FM\d{6}')
+TAF_PROBABILITY_PATTERN = re.compile(r'PROB\d{2}')
+TAF_CONTINUATION_PATTERN = re.compile(r'(?:FM\d{6}|TEMPO|BECMG|PROB\d{2})$')
+TAF_CHANGES = {'TEMPO': 'Temporarily', 'BECMG': 'Becoming'}
+
+# Sky cover by the first three characters of a group; VV takes only two
+SKY_PREFIXES = {code: code for code in SKY_CODES if len(code) == 3}
+SKY_LAYER_COVERS = frozenset(['FEW', 'SCT', 'BKN', 'OVC', 'VV'])
+
+# Compass points as (upper bound in degrees, name), checked in order
+COMPASS_POINTS = [
+    (22, 'North'),
+    (67, 'Northeast'),
+    (112, 'East'),
+    (157, 'Southeast'),
+    (202, 'South'),
+    (247, 'Southwest'),
+    (292, 'West'),
+    (337, 'Northwest'),
+    (360, 'North'),
+]
+
+class DecodedMetar:
+    """Structured fields of a decoded METAR report.
+
+    Only numbers and short codes are stored; the plain English report is
+    rendered on the first call to render() and kept. Missing groups are
+    left as None. Instances are shared through the decode memo, so treat
+    them as read-only.
+    """
+    FIELDS = (
+        'raw', 'station', 'day', 'time',
+        'wind_dir', 'wind_speed', 'wind_gust', 'wind_unit',
+        'visibility_sm', 'visibility_m', 'cavok',
+        'weather', 'recent_weather', 'clouds',
+        'temperature', 'dewpoint',
+        'altimeter', 'altimeter_unit', 'remarks',
+    )
+    __slots__ = FIELDS + ('_report',)
+
+    def __init__(self, raw, station, day, time):
+        self.raw = raw
+        self.station = station
+        self.day = day
+        self.time = time
+        self.wind_dir = None
+        self.wind_speed = None
+        self.wind_gust = None
+        self.wind_unit = None
+        self.visibility_sm = None
+        self.visibility_m = None
+        self.cavok = False
+        self.weather = ()
+        self.recent_weather = ()
+        self.clouds = ()
+        self.temperature = None
+        self.dewpoint = None
+        self.altimeter = None
+        self.altimeter_unit = None
+        self.remarks = None
+        self._report = None
+
+    def to_dict(self):
+        """Return the decoded fields as a JSON-serializable dict"""
+        fields = {name: getattr(self, name) for name in self.FIELDS}
+        fields['weather'] = list(self.weather)
+        fields['recent_weather'] = list(self.recent_weather)
+        fields['clouds'] = [{'cover': cover, 'height_ft': height} for cover, height in self.clouds]
+        if self.remarks is not None:
+            fields['remarks'] = self.remarks.to_dict()
+        return fields
+
+    def render(self):
+        """Render the decoded fields as a plain English report"""
+        if self._report is None:
+            profile = decode_profile
+            if profile is None:
+                self._report = render_report(self)
+            else:
+                started = time.perf_counter()
+                self._report = render_report(self)
+                profile.record_render(self.raw, time.perf_counter() - started)
+        return self._report
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return f"DecodedMetar({self.raw!r})"
+
+class DecodedRemarks:
+    """Decoded groups of a METAR's remarks (RMK) section.
+
+    station_type is AO1 or AO2, sea_level_pressure is in hectopascals,
+    temperature and dewpoint are in tenths of a degree Celsius precision
+    and peak_wind_time is HHMM. Groups not reported are left as None.
+    """
+    FIELDS = (
+        'station_type', 'sea_level_pressure', 'temperature', 'dewpoint',
+        'peak_wind_dir', 'peak_wind_speed', 'peak_wind_time',
+    )
+    __slots__ = FIELDS
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, None)
+
+    def to_dict(self):
+        """Return the decoded remarks as a JSON-serializable dict"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+def compass_direction(wind_deg):
+    """Convert a wind direction in degrees to a compass direction"""
+    for upper, name in COMPASS_POINTS:
+        if wind_deg <= upper:
+            return name
+    return f"{wind_deg} degrees"
+
+@lru_cache(maxsize=1024)
+def parse_weather(part):
+    """Return (present, recent) for a weather group, one of them None, or None.
+
+    present is the whole group, such as -SHRA or NSW; recent is a recent
+    weather group without its RE prefix, such as TSRA for RETSRA.
+    """
+    match = WEATHER_PATTERN.fullmatch(part)
+    if match is None:
+        return None
+    return match.group('present'), match.group('recent')
+
+@lru_cache(maxsize=1024)
+def parse_sky(part):
+    """Return a (cover, height in feet) layer for a sky condition group, or None"""
+    code = SKY_PREFIXES.get(part[:3])
+    if code is None:
+        if part[:2] != 'VV':
+            return None
+        code = 'VV'
+
+    # Layers may end in a convective cloud type, as in SCT012CB or BKN030TCU
+    height = part[len(code):].rstrip('CBTU')
+    if code in SKY_LAYER_COVERS and height.isdigit():
+        return (code, int(height) * 100)
+    return (code, None)
+
+def parse_temperature(part):
+    """Return (temperature, dewpoint) for a group such as M05/M10, or None"""
+    if not 3 <= len(part) <= 7:
+        return None
+    if 'M' not in part and not part.replace('/', '').replace('M', '').isdigit():
+        return None
+    halves = part.split('/')
+    if len(halves) != 2:
+        return None
+    temp_part, dew_part = halves
+    try:
+        # Handle negative temperatures (M prefix)
+        temp = int(temp_part.replace('M', '-')) if temp_part else 0
+        dew = int(dew_part.replace('M', '-')) if dew_part else 0
+    except ValueError:
+        return None
+    return temp, dew
+
+def tenths(sign, digits):
+    return (-1 if sign == '1' else 1) * int(digits) / 10
+
+def parse_remarks(groups, observed="Unknown"):
+    """Decode the groups after RMK into DecodedRemarks, or None if none is known.
+
+    observed is the report's HHMM time, which gives the hour of a peak
+    wind reported in minutes only.
+    """
+    remarks = DecodedRemarks()
+    found = False
+    for index, part in enumerate(groups):
+        if part in ('AO1', 'AO2'):
+            remarks.station_type = part
+        elif part.startswith('SLP'):
+            match = SEA_LEVEL_PRESSURE_PATTERN.fullmatch(part)
+            if match is None or remarks.sea_level_pressure is not None:
+                continue
+            # Tenths of a hectopascal without the leading 10 or 9
+            value = int(match.group(1))
+            remarks.sea_level_pressure = (value + (10000 if value < 500 else 9000)) / 10
+        elif part[0] == 'T':
+            match = PRECISE_TEMPERATURE_PATTERN.fullmatch(part)
+            if match is None or remarks.temperature is not None:
+                continue
+            remarks.temperature = tenths(match.group(1), match.group(2))
+            if match.group(3):
+                remarks.dewpoint = tenths(match.group(3), match.group(4))
+        elif part == 'WND' and index and groups[index - 1] == 'PK' and index + 1 < len(groups):
+            match = PEAK_WIND_PATTERN.fullmatch(groups[index + 1])
+            if match is None or remarks.peak_wind_speed is not None:
+                continue
+            remarks.peak_wind_dir = int(match.group(1))
+            remarks.peak_wind_speed = int(match.group(2))
+            hour, minute = match.group(3), match.group(4)
+            if hour is None and observed[:2].isdigit():
+                # Within the hour before the observation
+                hour = int(observed[:2]) - (int(minute) > int(observed[2:4] or 0))
+                hour = f"{hour % 24:02d}"
+            remarks.peak_wind_time = hour + minute if hour is not None else None
+        else:
+            continue
+        found = True
+    return remarks if found else None
+
+def read_header(metar_text):
+    """Return (DecodedMetar with the station and time, body groups, remark groups), or None"""
+    if not metar_text:
+        return None
+
+    # Parse basic elements
+    parts = metar_text.split()
+    if not parts:
+        return None
+
+    # Extract station ID (first element should be station code)
+    station_id = "Unknown"
+    start_index = 0
+
+    # Check if first element is METAR or SPECI (report type)
+    if parts[0] in ["METAR", "SPECI"] and len(parts) > 1:
+        station_id = parts[1]
+        start_index = 1
+    elif parts[0] not in ["METAR", "SPECI"]:
+        station_id = parts[0]
+        start_index = 0
+
+    # Extract date/time (element after station ID)
+    datetime = parts[start_index + 1] if len(parts) > start_index + 1 else "Unknown"
+    day = datetime[:2] if len(datetime) >= 2 else "Unknown"
+    time = datetime[2:6] if len(datetime) >= 6 else "Unknown"
+
+    # Station and time strings repeat across reports, so share one copy
+    decoded = DecodedMetar(metar_text, sys.intern(station_id), sys.intern(day), sys.intern(time))
+
+    # Remarks follow RMK and are decoded on their own
+    groups = parts[start_index + 2:]
+    if 'RMK' in groups:
+        split = groups.index('RMK')
+        return decoded, groups[:split], groups[split + 1:]
+    return decoded, groups, ()
+
+def read_groups(decoded, groups, weather, recent_weather, clouds):
+    """Decode body groups into decoded, adding weather groups and sky layers to the lists.
+
+    The first group of each kind wins; weather and sky groups accumulate.
+    Groups may be read in several calls, as the decode profile does.
+    """
+    has_visibility = decoded.visibility_sm is not None or decoded.cavok
+    sky_done = bool(clouds) and clouds[-1][0] == 'CLR'
+
+    # Classify every group in a single walk
+    for part in groups:
+        if WIND_PATTERN.fullmatch(part):
+            if decoded.wind_speed is None:
+                decoded.wind_dir = int(part[:3])
+                decoded.wind_speed = int(part[3:5])
+                gust_start = part.find('G')
+                if gust_start != -1:
+                    decoded.wind_gust = int(part[gust_start+1:gust_start+3])
+                decoded.wind_unit = part[-3:] if part.endswith(('MPS', 'KMH')) else 'KT'
+            continue
+
+        # Visibility in meters, 9999 meaning 10 km or more
+        if VISIBILITY_METERS_PATTERN.fullmatch(part):
+            if not has_visibility and int(part) < 9999:
+                decoded.visibility_m = int(part)
+                decoded.visibility_sm = decoded.visibility_m / 1609.34
+                has_visibility = True
+            continue
+
+        # Whole statute miles
+        if VISIBILITY_MILES_PATTERN.fullmatch(part):
+            if not has_visibility:
+                decoded.visibility_sm = float(part[:-2])
+                has_visibility = True
+            continue
+
+        if part == "CAVOK":
+            if not has_visibility:
+                decoded.cavok = True
+                has_visibility = True
+            continue
+
+        if '/' in part:
+            # Fractional statute miles, or temperature/dewpoint
+            if not has_visibility and VISIBILITY_FRACTION_PATTERN.fullmatch(part) and part[2] != '0':
+                decoded.visibility_sm = int(part[0]) / int(part[2])
+                has_visibility = True
+            if decoded.temperature is None:
+                temp_dewpoint = parse_temperature(part)
+                if temp_dewpoint:
+                    decoded.temperature, decoded.dewpoint = temp_dewpoint
+        elif part[0] in 'AQ':
+            if decoded.altimeter is None and len(part) == 5 and part[1:].isdigit():
+                if part[0] == 'A':
+                    # Inches of mercury
+                    decoded.altimeter = int(part[1:]) / 100
+                    decoded.altimeter_unit = 'inHg'
+                else:
+                    # Hectopascals
+                    decoded.altimeter = int(part[1:])
+                    decoded.altimeter_unit = 'hPa'
+        else:
+            weather_groups = parse_weather(part)
+            if weather_groups:
+                present, recent = weather_groups
+                if present:
+                    weather.append(present)
+                else:
+                    recent_weather.append(recent)
+                continue
+
+        # Sky layers are read up to the first clear-sky report
+        if not sky_done:
+            if 'CLR' in part:
+                clouds.append(('CLR', None))
+                sky_done = True
+            else:
+                layer = parse_sky(part)
+                if layer:
+                    clouds.append(layer)
+
+def finish_groups(decoded, weather, recent_weather, clouds):
+    if weather:
+        decoded.weather = tuple(weather)
+    if recent_weather:
+        decoded.recent_weather = tuple(recent_weather)
+    if clouds:
+        decoded.clouds = tuple(clouds)
+    return decoded
+
+def parse_metar(metar_text):
+    """Parse METAR text into a DecodedMetar, or None if there is no report"""
+    if decode_profile is not None:
+        return parse_metar_profiled(metar_text, decode_profile)
+    header = read_header(metar_text)
+    if header is None:
+        return None
+    decoded, groups, remarks = header
+    if remarks:
+        decoded.remarks = parse_remarks(remarks, decoded.time)
+    weather, recent_weather, clouds = [], [], []
+    read_groups(decoded, groups, weather, recent_weather, clouds)
+    return finish_groups(decoded, weather, recent_weather, clouds)
+
+def group_kind(part):
+    """Name the kind of a body group the way read_groups would take it"""
+    if WIND_PATTERN.fullmatch(part):
+        return 'wind'
+    if (VISIBILITY_METERS_PATTERN.fullmatch(part) or VISIBILITY_MILES_PATTERN.fullmatch(part)
+            or part == "CAVOK" or VISIBILITY_FRACTION_PATTERN.fullmatch(part)):
+        return 'visibility'
+    if '/' in part:
+        return 'temperature' if parse_temperature(part) else 'other'
+    if part[0] in 'AQ' and len(part) == 5 and part[1:].isdigit():
+        return 'altimeter'
+    if parse_weather(part):
+        return 'weather'
+    if 'CLR' in part or parse_sky(part):
+        return 'sky'
+    return 'other'
+
+def parse_metar_profiled(metar_text, profile):
+    """Parse METAR text like parse_metar, timing each group into profile.
+
+    Groups go through read_groups one at a time, so the timings are of the
+    decoder itself; naming a group's kind is left out of its time.
+    """
+    clock = time.perf_counter
+    started = clock()
+    header = read_header(metar_text)
+    if header is None:
+        return None
+    decoded, groups, remarks = header
+    steps = [('header', 1, clock() - started)]
+    if remarks:
+        started = clock()
+        decoded.remarks = parse_remarks(remarks, decoded.time)
+        steps.append(('remarks', len(remarks), clock() - started))
+    weather, recent_weather, clouds = [], [], []
+    for part in groups:
+        started = clock()
+        read_groups(decoded, (part,), weather, recent_weather, clouds)
+        steps.append((group_kind(part), 1, clock() - started))
+    finish_groups(decoded, weather, recent_weather, clouds)
+    profile.record(metar_text, steps)
+    return decoded
+
+def enable_decode_profile(enabled=True):
+    """Start profiling every decode in this process, or stop; return the profile or None"""
+    global decode_profile
+    if not enabled:
+        decode_profile = None
+    elif decode_profile is None:
+        decode_profile = DecodeProfile(slowest=DECODE_PROFILE_SLOWEST, window=DECODE_PROFILE_WINDOW)
+    return decode_profile
+
+def decode_profile_state(reset=False):
+    """Return the decode profile as a JSON-serializable dict, optionally starting it over"""
+    profile = decode_profile
+    if profile is None:
+        return {'enabled': False}
+    state = profile.state()
+    if reset:
+        profile.reset()
+    return {'enabled': True, 'window_seconds': profile.window, **state}
+
+enable_decode_profile(os.environ.get('METAR_DECODE_PROFILE', '0') != '0')
+
+def format_miles(value):
+    """Format statute miles as a whole number or a fraction such as 1/2 or 1 1/2"""
+    if value == int(value):
+        return str(int(value))
+    whole = int(value)
+    fraction = Fraction(value - whole).limit_denominator(9)
+    return f"{f'{whole} ' if whole else ''}{fraction.numerator}/{fraction.denominator}"
+
+def describe_wind(decoded):
+    """Describe the wind of a decoded report"""
+    if decoded.wind_speed is None:
+        return "Calm"
+    if decoded.wind_dir == 0:
+        direction = "Calm"
+    else:
+        direction = compass_direction(decoded.wind_dir)
+    gust = ""
+    if decoded.wind_gust is not None:
+        gust = f" gusting to {decoded.wind_gust:02d} knots"
+    return f"{direction} at {decoded.wind_speed} knots{gust}"
+
+def describe_visibility(decoded):
+    """Describe the visibility of a decoded report, or None if not reported"""
+    if decoded.visibility_m is not None:
+        return f"{decoded.visibility_m / 1609.34:.1f} miles"
+    if decoded.cavok:
+        return "Greater than 6 statute miles (Cloud and Visibility OK)"
+    if decoded.visibility_sm is not None:
+        return f"{format_miles(decoded.visibility_sm)} statute miles"
+    return None
+
+@lru_cache(maxsize=1024)
+def describe_weather(group):
+    """Describe a weather group such as -SHRA"""
+    if group in WEATHER_CODES:
+        return WEATHER_CODES[group]
+    conditions = []
+    start = 0
+    if group[0] in '-+':
+        conditions.append(WEATHER_CODES[group[0]])
+        start = 1
+    for i in range(start, len(group), 2):
+        conditions.append(WEATHER_CODES[group[i:i+2]])
+    return ' '.join(conditions)
+
+def describe_sky(layer):
+    """Describe a (cover, height in feet) sky layer"""
+    cover, height = layer
+    if height is None:
+        return SKY_CODES[cover]
+    if cover == 'VV':
+        return f"Vertical visibility {height} feet"
+    return f"{SKY_CODES[cover]} at {height} feet"
+
+def render_report(decoded):
+    """Render a DecodedMetar as a friendly readable report"""
+    report_lines = []
+    report_lines.append(f"Weather report for {decoded.station}")
+    report_lines.append(f"Day {decoded.day} at {decoded.time[:2]}:{decoded.time[2:]} UTC")
+
+    # Wind information
+    report_lines.append(f"Wind: {describe_wind(decoded)}")
+
+    # Visibility
+    visibility = describe_visibility(decoded)
+    if visibility:
+        report_lines.append(f"Visibility: {visibility}")
+
+    # Weather conditions
+    if decoded.weather:
+        report_lines.append(f"Weather: {', '.join(describe_weather(group) for group in decoded.weather)}")
+    elif decoded.clouds:
+        report_lines.append(f"Sky: {', '.join(describe_sky(layer) for layer in decoded.clouds)}")
+    else:
+        report_lines.append("Sky: Clear")
+    if decoded.recent_weather:
+        report_lines.append(f"Recent weather: {', '.join(describe_weather(group) for group in decoded.recent_weather)}")
+
+    # Temperature/Dewpoint
+    if decoded.temperature is not None:
+        report_lines.append(f"Temperature {decoded.temperature}°C, Dewpoint {decoded.dewpoint}°C")
+
+    # Altimeter
+    if decoded.altimeter_unit == 'inHg':
+        report_lines.append(f"Altimeter {decoded.altimeter:.2f} inches of mercury")
+    elif decoded.altimeter_unit == 'hPa':
+        report_lines.append(f"Altimeter {decoded.altimeter} hectopascals")
+
+    # Remarks
+    remarks = decoded.remarks
+    if remarks is not None:
+        if remarks.sea_level_pressure is not None:
+            report_lines.append(f"Sea level pressure {remarks.sea_level_pressure:.1f} hectopascals")
+        if remarks.temperature is not None:
+            dewpoint = f", Dewpoint {remarks.dewpoint:.1f}°C" if remarks.dewpoint is not None else ""
+            report_lines.append(f"Precise temperature {remarks.temperature:.1f}°C{dewpoint}")
+        if remarks.peak_wind_speed is not None:
+            at = f" at {remarks.peak_wind_time[:2]}:{remarks.peak_wind_time[2:]} UTC" if remarks.peak_wind_time else ""
+            report_lines.append(f"Peak wind {compass_direction(remarks.peak_wind_dir)} "
+                                f"at {remarks.peak_wind_speed} knots{at}")
+
+    return "\n".join(report_lines)
+
+def parse_metar_cached(metar_text):
+    """Parse METAR text through the decode memo"""
+    decoded = decode_memo.get(metar_text)
+    if decoded is None:
+        decoded = parse_metar(metar_text)
+        if decoded is not None:
+            decode_memo.set(metar_text, decoded)
+    return decoded
+
+def decode_metar(metar_text):
+    """Decode METAR text into plain English"""
+    decoded = parse_metar_cached(metar_text)
+    if decoded is None:
+        return "Unable to fetch METAR data"
+    return decoded.render()
+
+class TafPeriod:
+    """Forecast conditions for one period of a TAF.
+
+    change is None for the base forecast, or FM, BECMG or TEMPO, with a
+    percent probability for PROB groups. start and end are DDHHMM. Groups
+    a change does not forecast are left as None, meaning unchanged.
+    """
+    FIELDS = (
+        'change', 'probability', 'start', 'end',
+        'wind_dir', 'wind_speed', 'wind_gust', 'wind_unit',
+        'visibility_sm', 'visibility_m', 'visibility_above', 'cavok',
+        'weather', 'clouds',
+    )
+    __slots__ = FIELDS
+
+    def __init__(self, change, probability=None, start=None, end=None):
+        self.change = change
+        self.probability = probability
+        self.start = start
+        self.end = end
+        self.wind_dir = None
+        self.wind_speed = None
+        self.wind_gust = None
+        self.wind_unit = None
+        self.visibility_sm = None
+        self.visibility_m = None
+        self.visibility_above = False
+        self.cavok = False
+        self.weather = ()
+        self.clouds = ()
+
+    def to_dict(self):
+        fields = {name: getattr(self, name) for name in self.FIELDS}
+        fields['weather'] = list(self.weather)
+        fields['clouds'] = [{'cover': cover, 'height_ft': height} for cover, height in self.clouds]
+        return fields
+
+class DecodedTaf:
+    """Structured fields of a decoded TAF: its header and forecast periods.
+
+    issued is DDHHMM and the validity runs from valid_from to valid_to,
+    also DDHHMM. The first period is the base forecast. Instances are
+    shared through the product memo, so treat them as read-only.
+    """
+    FIELDS = ('raw', 'station', 'modifier', 'issued', 'valid_from', 'valid_to', 'periods')
+    __slots__ = FIELDS + ('_report',)
+
+    def __init__(self, raw, station, modifier=None, issued=None, valid_from=None, valid_to=None):
+        self.raw = raw
+        self.station = station
+        self.modifier = modifier
+        self.issued = issued
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        self.periods = ()
+        self._report = None
+
+    def to_dict(self):
+        """Return the decoded fields as a JSON-serializable dict"""
+        fields = {name: getattr(self, name) for name in self.FIELDS}
+        fields['periods'] = [period.to_dict() for period in self.periods]
+        return fields
+
+    def render(self):
+        """Render the forecast as a plain English report"""
+        if self._report is None:
+            self._report = render_taf(self)
+        return self._report
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return f"DecodedTaf({self.raw!r})"
+
+def taf_period(part):
+    """Return (start, end) as DDHHMM for a DDHH/DDHH validity group"""
+    return part[:4] + '00', part[5:] + '00'
+
+def read_forecast_group(period, part, whole_miles):
+    """Read one group of a TAF period into it; returns whether the group was known"""
+    if WIND_PATTERN.fullmatch(part):
+        if period.wind_speed is None:
+            period.wind_dir = int(part[:3])
+            period.wind_speed = int(part[3:5])
+            gust_start = part.find('G')
+            if gust_start != -1:
+                period.wind_gust = int(part[gust_start+1:gust_start+3])
+            period.wind_unit = part[-3:] if part.endswith(('MPS', 'KMH')) else 'KT'
+    elif part == 'CAVOK':
+        period.cavok = True
+    elif VISIBILITY_METERS_PATTERN.fullmatch(part):
+        # 9999 means 10 km or more
+        period.visibility_m = int(part)
+        period.visibility_above = part == '9999'
+    elif part[0] == 'P' and VISIBILITY_MILES_PATTERN.fullmatch(part[1:]):
+        period.visibility_sm = float(part[1:-2])
+        period.visibility_above = True
+    elif VISIBILITY_MILES_PATTERN.fullmatch(part):
+        period.visibility_sm = float(part[:-2])
+    elif VISIBILITY_FRACTION_PATTERN.fullmatch(part) and part.endswith('SM') and part[2] != '0':
+        period.visibility_sm = whole_miles + int(part[0]) / int(part[2])
+    elif part in SKY_CODES:
+        period.clouds += ((part, None),)
+    else:
+        weather_groups = parse_weather(part)
+        if weather_groups and weather_groups[0]:
+            period.weather += (weather_groups[0],)
+            return True
+        layer = parse_sky(part)
+        if layer is None:
+            return False
+        period.clouds += (layer,)
+    return True
+
+def parse_taf(taf_text):
+    """Parse TAF text into a DecodedTaf, or None if it is not a TAF"""
+    parts = taf_text.split() if taf_text else []
+    if not parts or parts[0] != 'TAF':
+        return None
+    index = 1
+    modifier = None
+    while index < len(parts) and parts[index] in REPORT_MODIFIERS:
+        modifier = parts[index]
+        index += 1
+    if index == len(parts):
+        return None
+
+    decoded = DecodedTaf(taf_text, sys.intern(parts[index]), modifier)
+    index += 1
+    if index < len(parts) and TAF_ISSUED_PATTERN.fullmatch(parts[index]):
+        decoded.issued = parts[index][:6]
+        index += 1
+    if index < len(parts) and TAF_VALIDITY_PATTERN.fullmatch(parts[index]):
+        decoded.valid_from, decoded.valid_to = taf_period(parts[index])
+        index += 1
+
+    period = TafPeriod(None, start=decoded.valid_from, end=decoded.valid_to)
+    periods = [period]
+    whole_miles = 0
+    for part in parts[index:]:
+        if part == 'RMK':
+            break
+        if TAF_FROM_PATTERN.fullmatch(part):
+            period = TafPeriod('FM', start=part[2:8])
+            periods.append(period)
+        elif TAF_PROBABILITY_PATTERN.fullmatch(part):
+            period = TafPeriod(None, probability=int(part[4:]))
+            periods.append(period)
+        elif part in ('TEMPO', 'BECMG'):
+            # PROB30 TEMPO is one change group
+            if period.probability is None or period.change is not None or period.start is not None:
+                period = TafPeriod(None)
+                periods.append(period)
+            period.change = part
+        elif TAF_VALIDITY_PATTERN.fullmatch(part) and period.start is None:
+            period.start, period.end = taf_period(part)
+        elif part.isdigit() and len(part) == 1:
+            # The whole miles of a visibility such as 1 1/2SM
+            whole_miles = int(part)
+            continue
+        else:
+            read_forecast_group(period, part, whole_miles)
+        whole_miles = 0
+
+    # A base or FM forecast holds until the next FM group
+    prevailing = [period for period in periods if period.change in (None, 'FM') and period.probability is None]
+    for current, following in zip(prevailing, prevailing[1:] + [None]):
+        current.end = following.start if following is not None else decoded.valid_to
+    for period in periods:
+        if period.change is None and period.probability is not None:
+            period.change = 'PROB'
+    decoded.periods = tuple(periods)
+    return decoded
+
+def describe_taf_time(value):
+    """Describe a DDHHMM time of a TAF"""
+    if not value:
+        return "unknown time"
+    return f"day {value[:2]} {value[2:4]}:{value[4:6]}"
+
+def describe_period(period):
+    """Describe the forecast conditions of one TAF period"""
+    conditions = []
+    if period.wind_speed is not None:
+        conditions.append(f"Wind: {describe_wind(period)}")
+    visibility = describe_visibility(period) if not period.visibility_above else (
+        f"More than {format_miles(period.visibility_sm)} statute miles" if period.visibility_sm is not None
+        else "10 km or more")
+    if visibility:
+        conditions.append(f"Visibility: {visibility}")
+    if period.weather:
+        conditions.append(f"Weather: {', '.join(describe_weather(group) for group in period.weather)}")
+    if period.clouds:
+        conditions.append(f"Sky: {', '.join(describe_sky(layer) for layer in period.clouds)}")
+    return '; '.join(conditions) or "No change"
+
+def render_taf(decoded):
+    """Render a DecodedTaf as a friendly readable forecast"""
+    report_lines = [f"Forecast for {decoded.station}"]
+    if decoded.issued:
+        report_lines.append(f"Issued {describe_taf_time(decoded.issued)} UTC"
+                            + (" (amended)" if decoded.modifier == 'AMD' else ""))
+    if decoded.valid_from:
+        report_lines.append(f"Valid from {describe_taf_time(decoded.valid_from)} "
+                            f"to {describe_taf_time(decoded.valid_to)} UTC")
+    for period in decoded.periods:
+        span = f"{describe_taf_time(period.start)} to {describe_taf_time(period.end)}"
+        if period.change is None:
+            label = span[0].upper() + span[1:]
+        elif period.change == 'FM':
+            label = f"From {span}"
+        elif period.change == 'PROB':
+            label = f"{period.probability}% chance {span}"
+        else:
+            label = f"{TAF_CHANGES[period.change]} {span}"
+            if period.probability is not None:
+                label = f"{period.probability}% chance, {label.lower()}"
+        report_lines.append(f"{label}: {describe_period(period)}")
+    return "\n".join(report_lines)
@@ -0,0 +1,63 @@
+"""Gunicorn settings for serving the METAR reader in production.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is preloaded in the master, which warms the decode tables and the
+cache from the history store once; workers fork from it and share that
+state copy-on-write. Caches are per process unless METAR_SHARED_CACHE is
+set, so a few workers with several threads each keep the hit rate higher
+than many single-threaded workers.
+
+On SIGTERM each worker drains: /health turns 503, open /metar/stream
+connections end and new ones are refused, and in-flight requests get
+graceful_timeout seconds to finish. Keep the container's stop timeout
+above graceful_timeout (docker run --stop-timeout).
+"""
+import os
+import signal
+
+bind = os.environ.get('METAR_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('METAR_WORKERS', min(os.cpu_count() or 1, 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('METAR_THREADS', 8))
+preload_app = True
+
+# Worker timeouts, in seconds
+timeout = int(os.environ.get('METAR_WORKER_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('METAR_GRACEFUL_TIMEOUT', 25))
+keepalive = int(os.environ.get('METAR_KEEPALIVE', 5))
+
+# Recycle workers after this many requests (0 keeps them for good)
+max_requests = int(os.environ.get('METAR_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('METAR_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.environ.get('METAR_ACCESS_LOG') or None
+loglevel = os.environ.get('METAR_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """Warm the decode tables in the master, before any worker forks"""
+    import app
+    server.log.info("Preloaded decode tables in %.1f ms", app.preload() * 1000)
+
+
+def post_fork(server, worker):
+    import app
+    app.after_fork()
+
+
+def post_worker_init(worker):
+    """Drain the worker as soon as it is asked to stop, then let gunicorn finish"""
+    import app
+    handle_exit = worker.handle_exit
+
+    def drain_and_exit(signum, frame):
+        app.drain()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain_and_exit)
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown()
@@ -0,0 +1,330 @@
+"""Counters, histograms and Prometheus text exposition for the METAR API."""
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import heapq
+import threading
+import time
+
+# Upper bounds in seconds, from a decode (tens of microseconds) to a slow upstream
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative bucketed histogram of observed values, optionally split by labels"""
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = (('le', format_value(bound)),)
+                yield self.name + '_bucket', format_labels(self.labelnames, key, le), cumulative
+            yield self.name + '_sum', format_labels(self.labelnames, key), series[-1]
+            yield self.name + '_count', format_labels(self.labelnames, key), cumulative
+
+
+class CallbackMetric:
+    """Metric whose value is read from a function at scrape time"""
+
+    def __init__(self, name, help, function, type='gauge'):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.type = type
+
+    def samples(self):
+        yield self.name, '', self.function()
+
+
+class Registry:
+    """Collection of metrics rendered together in the text exposition format"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, function, type='gauge'):
+        return self.register(CallbackMetric(name, help, function, type))
+
+    def render(self):
+        """Return all metrics in Prometheus text format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class UpstreamHealth:
+    """Outcome of the most recent upstream requests.
+
+    An outcome is an error when the request raised or the upstream answered
+    with a 5xx status. The upstream counts as unreachable while the latest
+    request could not get any response at all.
+    """
+
+    def __init__(self, window=100, clock=time.monotonic):
+        self.clock = clock
+        self._outcomes = deque(maxlen=window)
+        self.reachable = None
+        self.last_success = None
+        self.last_error = None
+
+    def record(self, status_code=None):
+        """Record one upstream response status, or None if the request raised"""
+        now = self.clock()
+        error = status_code is None or status_code >= 500
+        self._outcomes.append(error)
+        self.reachable = status_code is not None
+        if error:
+            self.last_error = now
+        else:
+            self.last_success = now
+
+    def error_rate(self):
+        outcomes = list(self._outcomes)
+        return sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+    def state(self):
+        now = self.clock()
+
+        def age(moment):
+            return None if moment is None else round(now - moment, 3)
+
+        return {
+            'reachable': self.reachable,
+            'error_rate': round(self.error_rate(), 4),
+            'requests': len(self._outcomes),
+            'last_success_ago': age(self.last_success),
+            'last_error_ago': age(self.last_error),
+        }
+
+
+class DecodeProfile:
+    """Decode time and token counts by group kind, and the slowest reports.
+
+    record() takes the (kind, tokens, seconds) steps of one decode.
+    Totals add up from the start or the last reset. The slowest reports
+    are kept per window: a sample holds the current window and the one
+    before it, so old outliers age out. A report's render time counts
+    toward its total when render() follows the parse while the report
+    is still among the recent ones.
+    """
+
+    def __init__(self, slowest=20, window=300, recent=256, clock=time.monotonic):
+        self.slowest = slowest
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Entries parsed lately by raw text, so render time can join them
+        self._recent = OrderedDict()
+        self._recent_size = recent
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.reports = 0
+            self.seconds = 0.0
+            self.groups = {}
+            self._recent.clear()
+            # Min-heaps of [seconds, sequence, raw, {kind: seconds}, sampled]
+            self._current = []
+            self._previous = []
+            self._window_start = self.clock()
+            self._sequence = 0
+
+    def _add_steps(self, steps, timings):
+        total = 0.0
+        for kind, tokens, seconds in steps:
+            counts = self.groups.get(kind)
+            if counts is None:
+                counts = self.groups[kind] = [0, 0.0]
+            counts[0] += tokens
+            counts[1] += seconds
+            timings[kind] = timings.get(kind, 0.0) + seconds
+            total += seconds
+        self.seconds += total
+        return total
+
+    def _rotate(self):
+        now = self.clock()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        dropped = self._previous
+        if elapsed < 2 * self.window:
+            self._previous = self._current
+        else:
+            dropped = dropped + self._current
+            self._previous = []
+        for entry in dropped:
+            entry[4] = False
+        self._current = []
+        self._window_start = now
+
+    def _offer(self, entry):
+        """Keep entry in the current window's sample if it is among the slowest"""
+        if entry[4]:
+            heapq.heapify(self._current)
+            return
+        if len(self._current) < self.slowest:
+            heapq.heappush(self._current, entry)
+        elif self._current and entry[0] > self._current[0][0]:
+            heapq.heapreplace(self._current, entry)[4] = False
+        else:
+            return
+        entry[4] = True
+
+    def record(self, raw, steps):
+        """Add one decoded report, given its (kind, tokens, seconds) steps"""
+        with self._lock:
+            self._rotate()
+            entry = [0.0, self._sequence, raw, {}, False]
+            self._sequence += 1
+            entry[0] = self._add_steps(steps, entry[3])
+            self.reports += 1
+            self._recent[raw] = entry
+            if len(self._recent) > self._recent_size:
+                self._recent.popitem(last=False)
+            self._offer(entry)
+
+    def record_render(self, raw, seconds):
+        """Add the time spent rendering a report"""
+        with self._lock:
+            self._rotate()
+            entry = self._recent.pop(raw, None)
+            if entry is None:
+                self._add_steps([('render', 1, seconds)], {})
+                return
+            entry[0] += self._add_steps([('render', 1, seconds)], entry[3])
+            if entry[4] and entry not in self._current:
+                # Sampled in a window that has since rotated
+                heapq.heapify(self._previous)
+                return
+            self._offer(entry)
+
+    def merge(self, snapshot):
+        """Add the totals and slowest reports of another profile's snapshot"""
+        with self._lock:
+            self._rotate()
+            self.reports += snapshot['reports']
+            self.seconds += snapshot['seconds']
+            for kind, counts in snapshot['groups'].items():
+                own = self.groups.get(kind)
+                if own is None:
+                    own = self.groups[kind] = [0, 0.0]
+                own[0] += counts['tokens']
+                own[1] += counts['seconds']
+            for report in snapshot['slowest']:
+                entry = [report['seconds'], self._sequence, report['raw'], dict(report['groups']), False]
+                self._sequence += 1
+                self._offer(entry)
+
+    def state(self):
+        with self._lock:
+            self._rotate()
+            sample = sorted(self._current + self._previous, reverse=True)[:self.slowest]
+            groups = {
+                kind: {'tokens': tokens, 'seconds': round(seconds, 6),
+                       'mean_us': round(seconds / tokens * 1e6, 2) if tokens else 0.0}
+                for kind, (tokens, seconds) in sorted(self.groups.items())
+            }
+            return {
+                'reports': self.reports,
+                'seconds': round(self.seconds, 6),
+                'mean_us': round(self.seconds / self.reports * 1e6, 2) if self.reports else 0.0,
+                'groups': groups,
+                'slowest': [
+                    {'raw': raw, 'seconds': round(seconds, 6),
+                     'groups': {kind: round(value, 6) for kind, value in sorted(timings.items())}}
+                    for seconds, _, raw, timings, _ in sample
+                ],
+            }
@@ -0,0 +1,133 @@
+"""Background refresh of frequently requested stations."""
+from collections import Counter
+import random
+import threading
+import time
+
+
+class PrefetchScheduler:
+    """Re-fetches hot stations shortly before their cache entries expire.
+
+    Hot stations are the configured list plus the top_n stations by recent
+    request count. Each cycle refreshes them all through refresh(station_ids),
+    which must fetch and cache them and return ({station_id: metar},
+    {station_id: error}). The next cycle is scheduled lead seconds (minus up
+    to jitter seconds) before the entries just cached expire, so callers keep
+    hitting the cache. Request counts are halved every cycle so the top_n
+    set follows recent traffic.
+    """
+
+    def __init__(self, refresh, ttl, stations=(), top_n=0, lead=60, jitter=15,
+                 clock=time.monotonic, rng=None):
+        self.refresh = refresh
+        self.ttl = ttl
+        self.stations = list(stations)
+        self.top_n = top_n
+        self.lead = lead
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.next_refresh = clock()
+        self.last_run = None
+        self.last_success = None
+        self.last_lag = None
+        self.last_errors = {}
+        self.cycles = 0
+        self.failures = 0
+
+    @property
+    def enabled(self):
+        return bool(self.stations or self.top_n)
+
+    def record(self, station_id):
+        """Count a request for station_id towards the top_n set"""
+        if self.top_n:
+            with self._lock:
+                self.requests[station_id] += 1
+
+    def hot_stations(self):
+        """Return the configured stations followed by the most requested ones"""
+        with self._lock:
+            top = [station_id for station_id, _ in self.requests.most_common(self.top_n)]
+        return list(dict.fromkeys(self.stations + top))
+
+    def _decay(self):
+        with self._lock:
+            self.requests = Counter({
+                station_id: count // 2 for station_id, count in self.requests.items() if count > 1
+            })
+
+    def interval(self):
+        """Seconds until the next cycle: before expiry, with jitter"""
+        return max(self.ttl - self.lead - self.rng.uniform(0, self.jitter), 1)
+
+    def run_once(self):
+        """Refresh the hot stations now and schedule the next cycle"""
+        now = self.clock()
+        self.last_run = now
+        self.last_lag = max(now - self.next_refresh, 0)
+        stations = self.hot_stations()
+        self.cycles += 1
+        try:
+            metars, errors = self.refresh(stations) if stations else ({}, {})
+        except Exception as e:
+            metars, errors = {}, {station_id: str(e) for station_id in stations}
+        self.last_errors = errors
+        if metars or not errors:
+            self.last_success = self.clock()
+        else:
+            self.failures += 1
+        self._decay()
+        self.next_refresh = self.clock() + self.interval()
+        return metars, errors
+
+    def run_pending(self):
+        """Run a cycle if one is due, returning whether it ran"""
+        if self.clock() < self.next_refresh:
+            return False
+        self.run_once()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(max(self.next_refresh - self.clock(), 0))
+
+    def start(self):
+        """Start refreshing in a daemon thread, if any stations are configured"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metar-prefetch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the refresh thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def state(self):
+        """Return the scheduler state as a dict, with times in seconds from now"""
+        now = self.clock()
+
+        def age(moment):
+            return None if moment is None else round(now - moment, 3)
+
+        return {
+            'enabled': self.enabled,
+            'running': self._thread is not None,
+            'stations': self.hot_stations(),
+            'next_refresh_in': round(self.next_refresh - now, 3),
+            'last_run_ago': age(self.last_run),
+            'last_success_ago': age(self.last_success),
+            'lag': self.last_lag,
+            'cycles': self.cycles,
+            'failures': self.failures,
+            'errors': self.last_errors,
+        }
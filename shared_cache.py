@@ -0,0 +1,543 @@
+"""Cache tier shared by every worker process, behind a small backend interface."""
+from contextlib import contextmanager
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class CacheBackendError(Exception):
+    """The shared cache could not be read or written"""
+
+
+class CacheBackend:
+    """Interface of a cache of string values shared across processes.
+
+    Subclasses implement _get_many, _set_many, _acquire, _release and
+    _clear; this class adds the counters and the lock() helper. Entries
+    carry their expiry time, so get_many() also returns how long each one
+    has left and callers can cache it locally for no longer than that.
+    Backend failures surface as CacheBackendError so callers can fall back
+    to the upstream.
+
+    lock() is the cross-process single-flight: a lease on a key that one
+    process holds while it refreshes the entry. Others wait for it, then
+    find the refreshed entry. A lease expires on its own after lease
+    seconds, so a crashed holder does not block the key for good.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.lock_waits = 0
+        self.lock_timeouts = 0
+
+    def get_many(self, keys):
+        """Return {key: (value, seconds left)} for the keys that are cached"""
+        try:
+            found = self._get_many(list(keys))
+        except CacheBackendError:
+            self.errors += 1
+            raise
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        """Return (value, seconds left) for key, or None"""
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items, ttl):
+        """Cache each {key: value} for ttl seconds"""
+        if not items:
+            return
+        try:
+            self._set_many(items, self.clock() + ttl)
+        except CacheBackendError:
+            self.errors += 1
+            raise
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    @contextmanager
+    def lock(self, key, lease=30, wait=10):
+        """Hold the lease on key while the block runs.
+
+        Yields True once acquired, or False if another holder kept it for
+        wait seconds (the caller then proceeds without it).
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        delay = 0.002
+        try:
+            acquired = self._acquire(key, token, lease)
+            if not acquired:
+                self.lock_waits += 1
+            while not acquired and time.monotonic() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+                acquired = self._acquire(key, token, lease)
+        except CacheBackendError:
+            self.errors += 1
+            raise
+        if not acquired:
+            self.lock_timeouts += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    self._release(key, token)
+                except CacheBackendError:
+                    self.errors += 1
+
+    def clear(self):
+        """Drop every entry and lease and reset the counters"""
+        self._clear()
+        self.hits = self.misses = self.errors = self.lock_waits = self.lock_timeouts = 0
+
+    def close(self):
+        pass
+
+    def stats(self):
+        """Return the counters of this process as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'errors': self.errors,
+            'lock_waits': self.lock_waits,
+            'lock_timeouts': self.lock_timeouts,
+        }
+
+
+class MemoryBackend(CacheBackend):
+    """Backend kept in this process's memory.
+
+    Not shared across processes; it serves single-process deployments,
+    tests, and as the storage behind CacheServer.
+    """
+
+    def __init__(self, purge_every=1000, clock=time.time):
+        super().__init__(clock)
+        self.purge_every = purge_every
+        self._writes = 0
+        self._entries = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _get_many(self, keys):
+        now = self.clock()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    found[key] = (entry[0], entry[1] - now)
+        return found
+
+    def _set_many(self, items, expires_at):
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (value, expires_at)
+            self._writes += len(items)
+            if self._writes >= self.purge_every:
+                self._writes = 0
+                now = self.clock()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+
+    def _acquire(self, key, token, lease):
+        now = self.clock()
+        with self._lock:
+            holder = self._leases.get(key)
+            if holder is not None and holder[1] > now:
+                return False
+            self._leases[key] = (token, now + lease)
+            return True
+
+    def _release(self, key, token):
+        with self._lock:
+            if self._leases.get(key, (None,))[0] == token:
+                del self._leases[key]
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._leases.clear()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteBackend(CacheBackend):
+    """Backend in a SQLite file that every process on the host opens.
+
+    Put the file on a tmpfs such as /dev/shm and it is shared memory with
+    SQLite's locking on top. Entries are an upsert away from any worker;
+    leases are rows claimed with a conditional upsert, so exactly one
+    process gets an unexpired lease. Each process (and each fork of one)
+    opens its own connection on first use. Expired entries are purged and
+    the table trimmed to maxsize every purge_every writes.
+    """
+
+    def __init__(self, path, maxsize=100000, purge_every=1000, clock=time.time):
+        super().__init__(clock)
+        self.path = path
+        self.maxsize = maxsize
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            # A cache can lose its last writes on a crash, so skip the fsyncs
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.executescript(SQLITE_SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _execute(self, sql, params=()):
+        try:
+            with self._lock:
+                cursor = self._connect().execute(sql, params)
+                return cursor.fetchall(), cursor.rowcount
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+
+    def _get_many(self, keys):
+        now = self.clock()
+        rows, _ = self._execute(
+            f"SELECT key, value, expires_at FROM entries WHERE key IN ({', '.join('?' * len(keys))}) "
+            "AND expires_at > ?", (*keys, now))
+        return {key: (value, expires_at - now) for key, value, expires_at in rows}
+
+    def _set_many(self, items, expires_at):
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute('BEGIN')
+                    connection.executemany(
+                        'INSERT INTO entries (key, value, expires_at) VALUES (?, ?, ?) '
+                        'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+                        [(key, value, expires_at) for key, value in items.items()])
+                self._writes += len(items)
+                if self._writes >= self.purge_every:
+                    self._writes = 0
+                    self._purge(connection)
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+
+    def _purge(self, connection):
+        now = self.clock()
+        connection.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+        connection.execute('DELETE FROM leases WHERE expires_at <= ?', (now,))
+        connection.execute(
+            'DELETE FROM entries WHERE key IN '
+            '(SELECT key FROM entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def _acquire(self, key, token, lease):
+        now = self.clock()
+        _, claimed = self._execute(
+            'INSERT INTO leases (key, token, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET token = excluded.token, expires_at = excluded.expires_at '
+            'WHERE leases.expires_at <= ?', (key, token, now + lease, now))
+        return claimed == 1
+
+    def _release(self, key, token):
+        self._execute('DELETE FROM leases WHERE key = ? AND token = ?', (key, token))
+
+    def _clear(self):
+        self._execute('DELETE FROM entries')
+        self._execute('DELETE FROM leases')
+
+    def __len__(self):
+        rows, _ = self._execute('SELECT COUNT(*) FROM entries WHERE expires_at > ?', (self.clock(),))
+        return rows[0][0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = self._pid = None
+
+
+def encode_command(*args):
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [f'*{len(args)}\r\n'.encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """Read one RESP reply from a buffered binary stream"""
+    line = stream.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('connection closed')
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest.decode()
+    if kind == b'-':
+        raise CacheBackendError(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        size = int(rest)
+        if size < 0:
+            return None
+        data = stream.read(size + 2)
+        return data[:-2].decode()
+    if kind == b'*':
+        size = int(rest)
+        return None if size < 0 else [read_reply(stream) for _ in range(size)]
+    raise ConnectionError(f'unexpected reply {line!r}')
+
+
+class RedisBackend(CacheBackend):
+    """Backend on a networked key-value server speaking the Redis protocol.
+
+    Works with Redis, Valkey and the like, and with CacheServer as a local
+    stand-in. Values are stored as 'expires_at|value' so a lookup returns
+    the time left without a second round trip, and the server's own
+    expiry (PX) removes them. Leases are SET NX PX keys. Release compares
+    the token before deleting, which leaves a window where a lease that
+    just expired and was re-taken gets deleted; the lease is a
+    single-flight hint, not a mutex, so that only costs an extra fetch.
+    Connections are pooled per process.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, prefix='metar:', timeout=1.0, clock=time.time):
+        super().__init__(clock)
+        self.host = host
+        self.port = port
+        self.db = db
+        self.prefix = prefix
+        self.timeout = timeout
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _checkout(self):
+        with self._pool_lock:
+            if self._pid != os.getpid():
+                self._pool, self._pid = [], os.getpid()
+            if self._pool:
+                return self._pool.pop()
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        stream = sock.makefile('rb')
+        if self.db:
+            sock.sendall(encode_command('SELECT', self.db))
+            read_reply(stream)
+        return sock, stream
+
+    def _pipeline(self, *commands):
+        """Send commands in one write and return their replies"""
+        try:
+            sock, stream = self._checkout()
+            try:
+                sock.sendall(b''.join(encode_command(*command) for command in commands))
+                replies = [read_reply(stream) for _ in commands]
+            except BaseException:
+                sock.close()
+                raise
+        except (OSError, ConnectionError) as e:
+            raise CacheBackendError(f'{self.host}:{self.port}: {e}') from e
+        with self._pool_lock:
+            if self._pid == os.getpid():
+                self._pool.append((sock, stream))
+        return replies
+
+    def _get_many(self, keys):
+        now = self.clock()
+        values, = self._pipeline(('MGET', *(self.prefix + key for key in keys)))
+        found = {}
+        for key, value in zip(keys, values):
+            if value is not None:
+                expires_at, _, value = value.partition('|')
+                if float(expires_at) > now:
+                    found[key] = (value, float(expires_at) - now)
+        return found
+
+    def _set_many(self, items, expires_at):
+        milliseconds = max(int((expires_at - self.clock()) * 1000), 1)
+        self._pipeline(*(('SET', self.prefix + key, f'{expires_at}|{value}', 'PX', milliseconds)
+                         for key, value in items.items()))
+
+    def _acquire(self, key, token, lease):
+        reply, = self._pipeline(('SET', f'{self.prefix}lease:{key}', token, 'NX', 'PX', int(lease * 1000)))
+        return reply == 'OK'
+
+    def _release(self, key, token):
+        holder, = self._pipeline(('GET', f'{self.prefix}lease:{key}'))
+        if holder == token:
+            self._pipeline(('DEL', f'{self.prefix}lease:{key}'))
+
+    def _clear(self):
+        keys, = self._pipeline(('KEYS', self.prefix + '*'))
+        if keys:
+            self._pipeline(('DEL', *keys))
+
+    def close(self):
+        with self._pool_lock:
+            for sock, _ in self._pool:
+                sock.close()
+            self._pool = []
+
+
+class _CacheRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, CacheBackendError, ValueError):
+                return
+            try:
+                reply = self.server.execute([str(part) for part in command])
+            except Exception as e:
+                self.wfile.write(f'-ERR {e}\r\n'.encode())
+                continue
+            self.wfile.write(self.encode(reply))
+
+    @staticmethod
+    def encode(reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, bool):
+            return b'+OK\r\n' if reply else b'$-1\r\n'
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, list):
+            return b'*%d\r\n' % len(reply) + b''.join(_CacheRequestHandler.encode(item) for item in reply)
+        data = reply.encode()
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+class CacheServer(socketserver.ThreadingTCPServer):
+    """Local stand-in for a Redis server, with just what RedisBackend uses.
+
+    Supports PING, SELECT, GET, MGET, SET with PX and NX, DEL, KEYS with a
+    trailing * and FLUSHDB, keeping everything in one dict. Meant for
+    tests, benchmarks and trying the networked tier on one machine.
+
+        server = CacheServer().start()
+        backend = RedisBackend(*server.server_address)
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, clock=time.time):
+        super().__init__((host, port), _CacheRequestHandler)
+        self.clock = clock
+        self.data = {}
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _live(self, key, now):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, command):
+        name, args = command[0].upper(), command[1:]
+        now = self.clock()
+        with self._lock:
+            self.commands += 1
+            if name == 'PING':
+                return 'PONG'
+            if name == 'SELECT':
+                return True
+            if name == 'FLUSHDB':
+                self.data.clear()
+                return True
+            if name == 'GET':
+                entry = self._live(args[0], now)
+                return entry and entry[0]
+            if name == 'MGET':
+                return [(self._live(key, now) or (None,))[0] for key in args]
+            if name == 'SET':
+                key, value, options = args[0], args[1], [option.upper() for option in args[2:]]
+                if 'NX' in options and self._live(key, now) is not None:
+                    return None
+                expires_at = None
+                if 'PX' in options:
+                    expires_at = now + int(args[2 + options.index('PX') + 1]) / 1000
+                self.data[key] = (value, expires_at)
+                return True
+            if name == 'DEL':
+                return sum(1 for key in args if self.data.pop(key, None) is not None)
+            if name == 'KEYS':
+                prefix = args[0].rstrip('*')
+                return [key for key in list(self.data) if key.startswith(prefix) and self._live(key, now)]
+        raise CacheBackendError(f"unknown command '{name}'")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='metar-cache-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# Backend factories by URL scheme; register_backend() adds more
+BACKENDS = {}
+
+
+def register_backend(scheme, factory):
+    """Make open_backend() build factory(url) for scheme:// URLs"""
+    BACKENDS[scheme] = factory
+
+
+def _sqlite_backend(url):
+    path = url.split(':', 1)[1]
+    return SQLiteBackend(path[2:] if path.startswith('//') else path)
+
+
+def _redis_backend(url):
+    address, _, db = url.split('://', 1)[1].partition('/')
+    host, _, port = address.partition(':')
+    return RedisBackend(host or '127.0.0.1', int(port or 6379), int(db or 0))
+
+
+register_backend('memory', lambda url: MemoryBackend())
+register_backend('sqlite', _sqlite_backend)
+register_backend('redis', _redis_backend)
+
+
+def open_backend(url):
+    """Return the backend for a URL such as sqlite:///dev/shm/metar.db or redis://host:6379/0, or None if empty"""
+    if not url:
+        return None
+    scheme = url.split(':', 1)[0]
+    if scheme not in BACKENDS:
+        raise ValueError(f"unknown shared cache backend '{scheme}' (known: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[scheme](url)
@@ -0,0 +1,192 @@
+"""Station catalog with O(1) lookup by ICAO ID and nearest-station search.
+
+The catalog is loaded once from a local file, so station IDs can be
+checked and nearby stations found without asking the upstream API.
+Positions are kept in flat arrays and indexed by a k-d tree over unit
+vectors on the sphere, where straight-line (chord) distance orders
+stations exactly like great-circle distance and there is no seam at the
+poles or the antimeridian.
+
+    catalog = load_catalog('stations.csv')
+    'KHIO' in catalog
+    catalog.nearest(45.52, -122.68, k=5)
+    catalog.within(45.52, -122.68, radius_km=50)
+"""
+import csv
+import gzip
+import heapq
+import io
+import json
+import math
+import os
+import re
+from array import array
+from collections import namedtuple
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stations.csv')
+
+# ICAO location indicators: a letter, then three letters or digits
+STATION_ID_PATTERN = re.compile(r'[A-Z][A-Z0-9]{3}')
+
+# Accepted column names, so the aviationweather.gov station list loads as is
+COLUMNS = {
+    'station_id': ('icao', 'icaoId', 'station_id', 'id'),
+    'lat': ('lat', 'latitude'),
+    'lon': ('lon', 'longitude'),
+    'name': ('name', 'site'),
+}
+
+Station = namedtuple('Station', ['station_id', 'lat', 'lon', 'name'])
+
+
+def valid_station_id(station_id):
+    """Return whether station_id has the form of an ICAO location indicator"""
+    return STATION_ID_PATTERN.fullmatch(station_id) is not None
+
+
+def unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_squared(radius_km):
+    """Squared chord length on the unit sphere spanning radius_km of great circle"""
+    angle = radius_km / EARTH_RADIUS_KM
+    if angle >= math.pi:
+        return 4.0
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+def great_circle_km(distance_squared):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(distance_squared) / 2))
+
+
+class StationCatalog:
+    """Known stations, indexed by ID and by position.
+
+    IDs map to row numbers in a dict; latitude, longitude and the unit
+    vector of each row live in arrays of doubles, so a catalog of every
+    reporting station takes a few megabytes. The k-d tree is implicit:
+    rows are ordered so each subtree is a slice whose middle row splits
+    it on x, y or z in turn, and searches skip any slice whose splitting
+    plane is further away than the worst station kept so far.
+    """
+
+    def __init__(self, stations):
+        self.ids = []
+        self.names = []
+        self.lats = array('d')
+        self.lons = array('d')
+        self._axes = (array('d'), array('d'), array('d'))
+        self._rows = {}
+        for station_id, lat, lon, name in stations:
+            station_id = station_id.strip().upper()
+            if not station_id or station_id in self._rows:
+                continue
+            self._rows[station_id] = len(self.ids)
+            self.ids.append(station_id)
+            self.names.append(name)
+            self.lats.append(float(lat))
+            self.lons.append(float(lon))
+            for axis, value in zip(self._axes, unit_vector(float(lat), float(lon))):
+                axis.append(value)
+        self._order = self._build()
+
+    def _build(self):
+        order = array('i', range(len(self.ids)))
+        pending = [(0, len(order), 0)]
+        while pending:
+            lo, hi, axis = pending.pop()
+            if hi - lo < 2:
+                continue
+            order[lo:hi] = array('i', sorted(order[lo:hi], key=self._axes[axis].__getitem__))
+            mid = (lo + hi) // 2
+            pending.append((lo, mid, (axis + 1) % 3))
+            pending.append((mid + 1, hi, (axis + 1) % 3))
+        return order
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, station_id):
+        return station_id in self._rows
+
+    def get(self, station_id):
+        """Return the Station for an ID, or None if it is not in the catalog"""
+        row = self._rows.get(station_id)
+        if row is None:
+            return None
+        return self._station(row)
+
+    def _station(self, row):
+        return Station(self.ids[row], self.lats[row], self.lons[row], self.names[row])
+
+    def _search(self, lat, lon, k, limit_squared):
+        """Return [(distance squared, row)] of the k closest rows within the limit, closest first"""
+        target = unit_vector(lat, lon)
+        x, y, z = target
+        xs, ys, zs = self._axes
+        order = self._order
+        # Max-heap of (-distance squared, row) while k is bounded
+        kept = []
+        pending = [(0, len(order), 0, 0.0)]
+        while pending:
+            lo, hi, axis, plane_squared = pending.pop()
+            bound = -kept[0][0] if k is not None and len(kept) == k else limit_squared
+            if lo >= hi or plane_squared > bound:
+                continue
+            mid = (lo + hi) // 2
+            row = order[mid]
+            distance_squared = (xs[row] - x) ** 2 + (ys[row] - y) ** 2 + (zs[row] - z) ** 2
+            if distance_squared <= bound:
+                if k is not None and len(kept) == k:
+                    heapq.heapreplace(kept, (-distance_squared, row))
+                else:
+                    heapq.heappush(kept, (-distance_squared, row))
+            offset = target[axis] - self._axes[axis][row]
+            lower, upper = (lo, mid), (mid + 1, hi)
+            near, far = (lower, upper) if offset < 0 else (upper, lower)
+            following = (axis + 1) % 3
+            # The near side is searched first, so the far side is checked against a tighter bound
+            pending.append((far[0], far[1], following, offset * offset))
+            pending.append((near[0], near[1], following, 0.0))
+        return sorted((-negated, row) for negated, row in kept)
+
+    def nearest(self, lat, lon, k=1, radius_km=None):
+        """Return [(Station, km)] for the k stations closest to a position, closest first"""
+        if k < 1 or not self.ids:
+            return []
+        limit = chord_squared(radius_km) if radius_km is not None else 4.0
+        return [(self._station(row), great_circle_km(distance_squared))
+                for distance_squared, row in self._search(lat, lon, k, limit)]
+
+    def within(self, lat, lon, radius_km, limit=None):
+        """Return [(Station, km)] for the stations within radius_km, closest first"""
+        if radius_km < 0 or not self.ids:
+            return []
+        found = self._search(lat, lon, limit, chord_squared(radius_km))
+        return [(self._station(row), great_circle_km(distance_squared)) for distance_squared, row in found]
+
+
+def read_rows(path):
+    """Yield (station_id, lat, lon, name) from a CSV or JSON station list, gzipped or not"""
+    compressed = path.endswith('.gz')
+    with (gzip.open if compressed else open)(path, 'rt', encoding='utf-8') as f:
+        text = f.read()
+    if (path[:-3] if compressed else path).endswith('.json') or text.lstrip().startswith('['):
+        records = json.loads(text)
+    else:
+        records = csv.DictReader(io.StringIO(text))
+    for record in records:
+        values = {}
+        for field, names in COLUMNS.items():
+            values[field] = next((record[name] for name in names if record.get(name) not in (None, '')), None)
+        if values['station_id'] is None or values['lat'] is None or values['lon'] is None:
+            continue
+        yield (str(values['station_id']), float(values['lat']), float(values['lon']), values['name'] or '')
+
+
+def load_catalog(path=DEFAULT_CATALOG):
+    """Build a StationCatalog from a station list file"""
+    return StationCatalog(read_rows(path))
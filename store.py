@@ -0,0 +1,179 @@
+"""Persistent SQLite log of fetched METAR observations."""
+from datetime import datetime, timedelta, timezone
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    station TEXT NOT NULL,
+    observed_at INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (station, observed_at)
+) WITHOUT ROWID
+"""
+
+
+def observation_time(day, hhmm, reference):
+    """Return the UTC datetime of a report's DDHHMM time, or None if invalid.
+
+    Reports only carry the day of month, so the month and year are those of
+    the latest such time not after reference (allowing an hour of skew).
+    """
+    try:
+        day, hour, minute = int(day), int(hhmm[:2]), int(hhmm[2:4])
+    except ValueError:
+        return None
+    year, month = reference.year, reference.month
+    for _ in range(3):
+        try:
+            candidate = datetime(year, month, day, hour, minute, tzinfo=timezone.utc)
+        except ValueError:
+            candidate = None
+        if candidate is not None and candidate <= reference + timedelta(hours=1):
+            return candidate
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return None
+
+
+class ObservationStore:
+    """Append-only SQLite store of raw METARs keyed by (station, observation time).
+
+    append() only queues the report; a background thread decodes the
+    observation time and writes queued reports in batches, so callers on
+    the request path never wait on disk. The primary key doubles as the
+    per-station time index behind latest() and history(). A report fetched
+    again keeps its row and only updates fetched_at.
+    """
+
+    def __init__(self, path, parse, queue_size=10000, batch_size=500, clock=time.time):
+        self.path = path
+        self.parse = parse
+        self.batch_size = batch_size
+        self.clock = clock
+        self.written = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+        self.queue_size = queue_size
+        self._open()
+
+    def _open(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.execute(SCHEMA)
+        self._reader.commit()
+        self._writer = threading.Thread(target=self._run, name='metar-store', daemon=True)
+        self._writer.start()
+
+    def reopen(self):
+        """Start a fresh connection, queue and writer thread in a forked child.
+
+        Threads do not survive fork and SQLite connections must not be used
+        on both sides of one, so a worker forked after the store was opened
+        calls this before touching it. Reports the parent had queued stay
+        with the parent.
+        """
+        self._open()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # Readers see committed rows while the writer appends
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def append(self, metar_text, fetched_at=None):
+        """Queue a fetched report for writing; never blocks"""
+        try:
+            self._queue.put_nowait((metar_text, self.clock() if fetched_at is None else fetched_at))
+        except queue.Full:
+            self.dropped += 1
+
+    def _rows(self, items):
+        for metar_text, fetched_at in items:
+            decoded = self.parse(metar_text)
+            observed = decoded and observation_time(
+                decoded.day, decoded.time, datetime.fromtimestamp(fetched_at, timezone.utc))
+            if not observed:
+                self.skipped += 1
+                continue
+            yield decoded.station, int(observed.timestamp()), fetched_at, metar_text
+
+    def _run(self):
+        connection = self._connect()
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in items
+            rows = list(self._rows(item for item in items if item is not None))
+            try:
+                if rows:
+                    with connection:
+                        connection.execute('BEGIN')
+                        connection.executemany(
+                            'INSERT INTO observations (station, observed_at, fetched_at, raw) VALUES (?, ?, ?, ?) '
+                            'ON CONFLICT (station, observed_at) DO UPDATE SET fetched_at = excluded.fetched_at',
+                            rows)
+                    self.written += len(rows)
+            except sqlite3.Error:
+                self.errors += len(rows)
+            for _ in items:
+                self._queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    def flush(self):
+        """Wait until every queued report has been written"""
+        self._queue.join()
+
+    def close(self):
+        """Write what is queued, then stop the writer and close the store"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._reader.close()
+
+    def _query(self, sql, params):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def latest(self, station):
+        """Return the newest (observed_at, raw) for station, or None"""
+        rows = self._query(
+            'SELECT observed_at, raw FROM observations WHERE station = ? ORDER BY observed_at DESC LIMIT 1',
+            (station,))
+        return rows[0] if rows else None
+
+    def history(self, station, start, end, limit=100):
+        """Return (observed_at, raw) for station between start and end, newest first"""
+        return self._query(
+            'SELECT observed_at, raw FROM observations WHERE station = ? AND observed_at BETWEEN ? AND ? '
+            'ORDER BY observed_at DESC LIMIT ?',
+            (station, start, end, limit))
+
+    def recent(self, since):
+        """Return (station, raw, fetched_at) for each station whose newest report was fetched since a time"""
+        # SQLite takes the bare columns from the row holding the MAX()
+        rows = self._query(
+            'SELECT station, raw, fetched_at, MAX(observed_at) FROM observations GROUP BY station '
+            'HAVING fetched_at >= ?',
+            (since,))
+        return [row[:3] for row in rows]
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
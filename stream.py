@@ -0,0 +1,187 @@
+"""Fan-out of new METAR reports to streaming subscribers."""
+from collections import Counter, OrderedDict
+import threading
+import time
+
+
+class Subscription:
+    """Bounded queue of pending reports for one stream subscriber.
+
+    Pending reports are kept per station, so a newer report replaces one
+    the subscriber has not read yet. At most maxsize stations are pending;
+    when a slow reader lets the queue fill up, the oldest pending report is
+    dropped. Both are counted in dropped. Publishers never block on a
+    subscriber.
+
+    on_ready, if given, is called after every put() and close(), for
+    readers that wait on something other than get(), such as an event loop.
+    """
+
+    def __init__(self, stations, maxsize=32, on_ready=None):
+        self.stations = frozenset(stations)
+        self.maxsize = maxsize
+        self.on_ready = on_ready
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._pending = OrderedDict()
+        self._ready = threading.Condition()
+
+    def put(self, station_id, metar_data):
+        """Queue a report for station_id, dropping the oldest if full"""
+        with self._ready:
+            if station_id in self._pending:
+                del self._pending[station_id]
+                self.dropped += 1
+            elif len(self._pending) >= self.maxsize:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[station_id] = metar_data
+            self._ready.notify()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def get(self, timeout=None):
+        """Return the pending (station_id, metar) pairs, oldest first.
+
+        Waits up to timeout seconds for one to arrive; returns an empty list
+        on timeout or once the subscription is closed.
+        """
+        with self._ready:
+            if not self._pending and not self.closed and timeout != 0:
+                self._ready.wait(timeout)
+            items = list(self._pending.items())
+            self._pending.clear()
+        self.delivered += len(items)
+        return items
+
+    def close(self):
+        """Wake up the reader and stop accepting reports"""
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+        if self.on_ready is not None:
+            self.on_ready()
+
+
+class StreamHub:
+    """Shares one upstream poll of the subscribed stations among all subscribers.
+
+    While anyone is subscribed, a daemon thread calls refresh(station_ids)
+    with every station any subscriber wants, once per interval seconds, so a
+    station is fetched once however many clients follow it. New reports
+    reach subscribers through publish(), which is registered as a change
+    listener of the fetch path: a report fetched for any reason, by this
+    poller, a /metar request or the prefetcher, is fanned out once.
+    """
+
+    def __init__(self, refresh, interval=60, queue_size=32, max_subscribers=1000,
+                 clock=time.monotonic):
+        self.refresh = refresh
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.clock = clock
+        self.published = 0
+        self.dropped = 0
+        self.polls = 0
+        self.last_poll = None
+        self.last_errors = {}
+        self._subscribers = set()
+        self._stations = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, stations, on_ready=None):
+        """Return a new Subscription to stations, or None if the hub is full"""
+        subscription = Subscription(stations, self.queue_size, on_ready)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscription)
+            self._stations.update(subscription.stations)
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='metar-stream', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription and close it"""
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                self._stations.subtract(subscription.stations)
+                self._stations = +self._stations
+                self.dropped += subscription.dropped
+        subscription.close()
+
+    def stations(self):
+        """Return every station at least one subscriber follows"""
+        with self._lock:
+            return sorted(self._stations)
+
+    def publish(self, metars):
+        """Queue new {station_id: metar} reports for the subscribers that follow them"""
+        with self._lock:
+            subscribers = [subscription for subscription in self._subscribers
+                           if not subscription.stations.isdisjoint(metars)]
+        for subscription in subscribers:
+            for station_id in subscription.stations.intersection(metars):
+                subscription.put(station_id, metars[station_id])
+                self.published += 1
+
+    def poll_once(self):
+        """Refresh the subscribed stations now"""
+        stations = self.stations()
+        if not stations:
+            return {}, {}
+        self.polls += 1
+        self.last_poll = self.clock()
+        try:
+            metars, errors = self.refresh(stations)
+        except Exception as e:
+            metars, errors = {}, {station_id: str(e) for station_id in stations}
+        self.last_errors = errors
+        return metars, errors
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll_once()
+
+    def stop(self, wait=True):
+        """Stop polling and close every subscription.
+
+        With wait=False a poll already in progress finishes in the
+        background, so this can run from a signal handler.
+        """
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            self.unsubscribe(subscription)
+        if thread is not None and wait:
+            thread.join()
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def dropped_total(self):
+        """Return the reports dropped for slow subscribers, past and present"""
+        with self._lock:
+            return self.dropped + sum(subscription.dropped for subscription in self._subscribers)
+
+    def state(self):
+        """Return the hub state as a dict"""
+        return {
+            'subscribers': self.subscriber_count(),
+            'stations': self.stations(),
+            'interval': self.interval,
+            'polls': self.polls,
+            'last_poll_ago': None if self.last_poll is None else round(self.clock() - self.last_poll, 3),
+            'published': self.published,
+            'dropped': self.dropped_total(),
+            'errors': self.last_errors,
+        }
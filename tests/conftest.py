@@ -0,0 +1,30 @@
+import pytest
+import sys
+import os
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+
+@pytest.fixture(autouse=True)
+def clear_app_state():
+    """Start and end every test with empty report, decode and response caches and a closed breaker.
+
+    Module-level state in app outlives a test, so anything a request can
+    leave behind for the next one is cleared here rather than per module.
+    """
+    def clear():
+        app_module.metar_cache.clear()
+        app_module.decode_memo.clear()
+        app_module.response_memo.clear()
+        app_module.last_reports.clear()
+        app_module.upstream_validators.clear()
+        for product in app_module.products.values():
+            product.cache.clear()
+            product.memo.clear()
+        app_module.upstream_breaker.reset()
+
+    clear()
+    yield
+    clear()
@@ -0,0 +1,23 @@
+from unittest.mock import Mock
+
+class FakeClock:
+    """Manually advanced clock; sleep() advances it instead of waiting"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def metar_for(station_id):
+    return f"METAR {station_id} 141253Z 18005KT 10SM CLR 16/15 A2987"
+
+def upstream_response(status_code=200, text='', headers=None):
+    """Mock of a response from the upstream API"""
+    response = Mock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    return response
@@ -6,7 +6,8 @@ from unittest.mock import patch, Mock
 # Add the app directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import decode_metar, fetch_metar
+from app import app, fetch_metar, parse_metar
+from decoder import DecodedMetar, decode_metar
 
 def test_decode_metar_basic():
     """Test basic METAR decoding functionality"""
@@ -164,6 +165,25 @@ def test_decode_metar_weather_conditions():
     result = decode_metar(metar_text)
     assert "Weather: Light Showers Rain" in result
 
+def test_parse_metar_weather_grammar():
+    """Test present and recent weather groups against the WMO grammar"""
+    decoded = parse_metar(
+        "METAR EGLL 141250Z 24012KT 4000 +TSRAGR VCSH -FZDZSG SCT012CB OVC095 12/09 Q1013 RETSRA RESN NOSIG")
+    assert decoded.weather == ("+TSRAGR", "VCSH", "-FZDZSG")
+    assert decoded.recent_weather == ("TSRA", "SN")
+    assert decoded.clouds == (("SCT", 1200), ("OVC", 9500))
+    assert decoded.to_dict()['recent_weather'] == ["TSRA", "SN"]
+
+    result = decoded.render()
+    assert "Weather: Heavy Thunderstorm Rain Hail, In the vicinity Showers, Light Freezing Drizzle Snow grains" in result
+    assert "Recent weather: Thunderstorm Rain, Snow" in result
+
+    # Words that only contain weather codes are not weather groups
+    decoded = parse_metar("METAR KHIO 141253Z 18005KT 10SM FEW020 16/15 A2987 TEMPO NSW RMK AO2 PRESFR RAB15")
+    assert decoded.weather == ("NSW",)
+    assert decoded.recent_weather == ()
+    assert "Weather: No significant weather" in decoded.render()
+
 def test_decode_metar_sky_conditions():
     """Test sky condition decoding with different cloud types"""
     # Test scattered clouds with altitude
@@ -179,9 +199,8 @@ def test_decode_metar_sky_conditions():
     # Test overcast with altitude
     metar_text = "METAR KHIO 141253Z 18005KT 10SM OVC095 16/15 A2987"
     result = decode_metar(metar_text)
-    # Current implementation has a bug where "VC" from "OVC" is detected as weather condition
-    # So we'll check that weather conditions include "In the vicinity" instead
-    assert "Weather: In the vicinity" in result
+    assert "Sky: Overcast at 9500 feet" in result
+    assert "In the vicinity" not in result
     
     # Test few clouds
     metar_text = "METAR KHIO 141253Z 18005KT 10SM FEW005 16/15 A2987"
@@ -196,13 +215,10 @@ def test_decode_metar_sky_conditions():
     assert "Visibility: 1/4 statute miles" in result
     assert "Weather: Fog" in result
     
-    # Test multiple sky layers - Note: This has a bug in the current implementation
-    # The presence of OVC095 causes "VC" to be detected as weather condition "In the vicinity"
-    # before the sky conditions are properly parsed
+    # Test multiple sky layers
     metar_text = "METAR KHIO 141253Z 18005KT 10SM SCT012 BKN022 OVC095 16/15 A2987"
     result = decode_metar(metar_text)
-    # Due to the bug, we get "In the vicinity" instead of sky conditions
-    assert "Weather: In the vicinity" in result
+    assert "Sky: Scattered clouds at 1200 feet, Broken clouds at 2200 feet, Overcast at 9500 feet" in result
 
 def test_decode_metar_temperature_dewpoint():
     """Test temperature/dewpoint decoding with negative values"""
@@ -263,7 +279,7 @@ def test_fetch_metar_returns_string_or_none():
     result = fetch_metar("INVALID")
     assert result is None or isinstance(result, str)
 
-@patch('app.requests.get')
+@patch('app.upstream.get')
 def test_fetch_metar_success(mock_get):
     """Test fetch_metar function with successful response"""
     # Create a mock response
@@ -276,7 +292,7 @@ def test_fetch_metar_success(mock_get):
     assert result == "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
     mock_get.assert_called_once_with("https://aviationweather.gov/api/data/metar?ids=KHIO")
 
-@patch('app.requests.get')
+@patch('app.upstream.get')
 def test_fetch_metar_http_error(mock_get):
     """Test fetch_metar function with HTTP error"""
     # Create a mock response with error status
@@ -287,11 +303,95 @@ def test_fetch_metar_http_error(mock_get):
     result = fetch_metar("INVALID")
     assert result is None
 
-@patch('app.requests.get')
+@patch('app.upstream.get')
 def test_fetch_metar_exception(mock_get):
     """Test fetch_metar function with exception"""
     # Configure mock to raise an exception
     mock_get.side_effect = Exception("Network error")
     
     result = fetch_metar("KHIO")
-    assert result is None
\ No newline at end of file
+    assert result is None
+
+def test_parse_metar_structured_fields():
+    """Test that parse_metar exposes numeric fields"""
+    decoded = parse_metar("METAR KLAX 141253Z 23006G12KT 1/2SM -SHRA SCT012 OVC095 M05/M10 A2987")
+
+    assert isinstance(decoded, DecodedMetar)
+    assert decoded.station == "KLAX"
+    assert decoded.day == "14"
+    assert decoded.time == "1253"
+    assert decoded.wind_dir == 230
+    assert decoded.wind_speed == 6
+    assert decoded.wind_gust == 12
+    assert decoded.wind_unit == "KT"
+    assert decoded.visibility_sm == 0.5
+    assert decoded.visibility_m is None
+    assert decoded.weather[0] == "-SHRA"
+    assert decoded.clouds == (("SCT", 1200), ("OVC", 9500))
+    assert decoded.temperature == -5
+    assert decoded.dewpoint == -10
+    assert decoded.altimeter == 29.87
+    assert decoded.altimeter_unit == "inHg"
+
+def test_parse_metar_metric_report():
+    """Test parse_metar with meters visibility and hectopascals"""
+    decoded = parse_metar("EGLL 141250Z 27010MPS 3000 BKN008 VV002 08/06 Q1013")
+
+    assert decoded.wind_unit == "MPS"
+    assert decoded.visibility_m == 3000
+    assert round(decoded.visibility_sm, 2) == 1.86
+    assert decoded.clouds == (("BKN", 800), ("VV", 200))
+    assert decoded.altimeter == 1013
+    assert decoded.altimeter_unit == "hPa"
+
+def test_parse_metar_missing_groups():
+    """Test that missing groups are left unset"""
+    assert parse_metar(None) is None
+    assert parse_metar("   ") is None
+
+    decoded = parse_metar("METAR KHIO 141253Z")
+    assert decoded.wind_speed is None
+    assert decoded.visibility_sm is None
+    assert decoded.cavok is False
+    assert decoded.weather == ()
+    assert decoded.clouds == ()
+    assert decoded.temperature is None
+    assert decoded.altimeter is None
+
+def test_decoded_metar_is_slotted():
+    """Test that decoded reports carry no per-instance dict"""
+    decoded = parse_metar("METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987")
+    assert not hasattr(decoded, '__dict__')
+    with pytest.raises(AttributeError):
+        decoded.extra = 1
+
+def test_decoded_metar_renders_report():
+    """Test that the structured result renders the plain English report"""
+    metar_text = "SPECI KHIO 141311Z 17004KT 10SM -RA SCT012 BKN022 OVC095 16/15 A2987"
+    decoded = parse_metar(metar_text)
+    assert decoded.render() == decode_metar(metar_text)
+    assert str(decoded) == decode_metar(metar_text)
+
+    decoded = parse_metar("METAR KHIO 141253Z 18005KT CAVOK 16/15 A2987")
+    assert decoded.cavok is True
+    assert "Visibility: Greater than 6 statute miles (Cloud and Visibility OK)" in decoded.render()
+
+@patch('app.fetch_metar')
+def test_metar_route_json_option(mock_fetch):
+    """Test that /metar returns structured fields when asked for JSON"""
+    mock_fetch.return_value = "METAR KHIO 141253Z 18005KT 10SM SCT012 16/15 A2987"
+    client = app.test_client()
+
+    response = client.post('/metar', data={'station_id': 'khio'})
+    assert response.status_code == 200
+    assert 'decoded' not in response.get_json()
+
+    response = client.post('/metar', data={'station_id': 'khio', 'format': 'json'})
+    data = response.get_json()
+    assert data['station_id'] == 'KHIO'
+    assert "Wind: South at 5 knots" in data['decoded_report']
+    assert data['decoded']['wind_dir'] == 180
+    assert data['decoded']['wind_speed'] == 5
+    assert data['decoded']['clouds'] == [{'cover': 'SCT', 'height_ft': 1200}]
+    assert data['decoded']['temperature'] == 16
+    assert data['decoded']['altimeter'] == 29.87
@@ -0,0 +1,91 @@
+import pytest
+import sys
+import os
+import json
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from archive import ArchiveReader, read_range
+from bulk_decode import main
+
+LINES = [
+    "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987",
+    "",
+    "KJFK 141251Z 31010KT 1/2SM FG BKN004 M02/M03 A3001",
+    "SPECI KHIO 141311Z 17004KT 10SM -RA SCT012 16/15 A2987",
+]
+
+@pytest.fixture
+def archive_path(tmp_path):
+    """An archive with a blank line, a CRLF line end and no final newline"""
+    path = tmp_path / 'archive.txt'
+    path.write_bytes(b'\n'.join([LINES[0].encode() + b'\r'] + [line.encode() for line in LINES[1:]]))
+    return str(path)
+
+def test_lines_and_random_access(archive_path):
+    """Test that lines are indexed and returned as views without line breaks"""
+    with ArchiveReader(archive_path) as archive:
+        assert len(archive) == 4
+        line = archive.line(2)
+        assert isinstance(line, memoryview)
+        assert bytes(line).decode() == LINES[2]
+        assert bytes(archive.line(0)).decode() == LINES[0]
+        assert bytes(archive.line(-1)).decode() == LINES[3]
+        assert [bytes(view).decode() for view in archive.lines(1, 3)] == LINES[1:3]
+        with pytest.raises(IndexError):
+            archive.line(4)
+        del line
+
+def test_station_slices(archive_path):
+    """Test that lines are found by station, in file order"""
+    with ArchiveReader(archive_path) as archive:
+        assert [bytes(view).decode() for view in archive.station('KHIO')] == [LINES[0], LINES[3]]
+        assert list(archive.station('XXXX')) == []
+        assert sorted(archive.station_index()) == ['KHIO', 'KJFK']
+
+def test_chunks_are_disjoint_whole_lines(archive_path):
+    """Test that byte ranges cover the file once and split at line breaks"""
+    with ArchiveReader(archive_path) as archive:
+        chunks = archive.chunks(3)
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == os.path.getsize(archive_path)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(chunks, chunks[1:]))
+    assert read_range(archive_path, *chunks[0]).endswith('\n')
+    assert read_range(archive_path, *chunks[1]) == LINES[3]
+
+def test_persisted_index_is_reused_and_invalidated(archive_path):
+    """Test that the saved index is loaded while the archive is unchanged"""
+    with ArchiveReader(archive_path, persist_index=True) as archive:
+        offsets = list(archive.offsets)
+    assert os.path.exists(archive_path + '.idx')
+
+    with open(archive_path + '.idx', 'r+b') as f:
+        f.seek(-8, os.SEEK_END)
+        f.write((12345).to_bytes(8, 'little'))
+    with ArchiveReader(archive_path, persist_index=True) as archive:
+        assert archive.offsets[-1] == 12345
+
+    with open(archive_path, 'ab') as f:
+        f.write(b'\nKLAX 141253Z 25008KT 10SM CLR 20/10 A2990')
+    with ArchiveReader(archive_path, persist_index=True) as archive:
+        assert len(archive) == 5
+        assert list(archive.offsets)[:4] == offsets[:4]
+
+def test_empty_archive(tmp_path):
+    """Test that an empty file has no lines"""
+    path = tmp_path / 'empty.txt'
+    path.write_bytes(b'')
+    with ArchiveReader(str(path)) as archive:
+        assert len(archive) == 0
+        assert archive.chunks(10) == []
+
+@pytest.mark.parametrize('workers', ['0', '2'])
+def test_bulk_decode_mmap_matches_streaming(archive_path, tmp_path, workers):
+    """Test that bulk decoding over byte ranges gives the streaming output"""
+    streamed, mapped = tmp_path / 'streamed.jsonl', tmp_path / 'mapped.jsonl'
+    main([archive_path, '-o', str(streamed), '--workers', '0'])
+    main(['--mmap', '--index', archive_path, '-o', str(mapped), '--workers', workers, '--chunk-size', '2'])
+
+    assert mapped.read_text() == streamed.read_text()
+    assert [json.loads(line)['station'] for line in mapped.read_text().splitlines()] == ['KHIO', 'KJFK', 'KHIO']
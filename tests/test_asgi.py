@@ -0,0 +1,243 @@
+import pytest
+import sys
+import os
+import asyncio
+import json
+import threading
+from unittest.mock import patch, Mock
+from urllib.parse import urlencode
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from asgi import AsyncMetarService, AsyncUpstreamClient, MetarASGIApp
+from metrics import UpstreamHealth
+from upstream import CircuitBreaker
+from helpers import metar_for
+
+class FakeUpstream:
+    """aiohttp handler answering for the known stations"""
+    def __init__(self, known, statuses=(), delay=0):
+        self.known = known
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+
+    async def handle(self, request):
+        self.requests.append(str(request.url))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.statuses:
+            return web.Response(status=self.statuses.pop(0))
+        ids = request.query['ids'].split(',')
+        lines = [metar_for(station_id) for station_id in ids if station_id in self.known]
+        if not lines:
+            return web.Response(status=204)
+        return web.Response(text='\n'.join(lines))
+
+async def call_asgi(application, path, form=None, json_body=None, method='POST'):
+    """Send one request, POST by default, to an ASGI app and return (status, JSON body)"""
+    if json_body is not None:
+        body, content_type = json.dumps(json_body).encode(), b'application/json'
+    else:
+        body, content_type = urlencode(form or {}).encode(), b'application/x-www-form-urlencoded'
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'content-type', content_type)],
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+def run_requests(upstream, *requests):
+    """Send requests to a fresh ASGI app concurrently, against a fake upstream"""
+    async def send_all():
+        web_app = web.Application()
+        web_app.router.add_get('/api/data/metar', upstream.handle)
+        server = TestServer(web_app)
+        await server.start_server()
+        application = MetarASGIApp()
+        try:
+            with patch('app.METAR_API_URL', str(server.make_url('/api/data/metar'))):
+                return await asyncio.gather(*(call_asgi(application, path, **kwargs) for path, kwargs in requests))
+        finally:
+            await application.service.client.aclose()
+            await server.close()
+    return asyncio.run(send_all())
+
+def test_async_metar_route():
+    """Test that the async /metar route fetches and decodes a station"""
+    upstream = FakeUpstream({"KHIO"})
+    (status, data), = run_requests(upstream, ('/metar', {'form': {'station_id': 'khio', 'format': 'json'}}))
+
+    assert status == 200
+    assert data['station_id'] == 'KHIO'
+    assert data['raw_metar'] == metar_for("KHIO")
+    assert "Wind: South at 5 knots" in data['decoded_report']
+    assert data['decoded']['wind_speed'] == 5
+
+def test_async_metar_route_errors():
+    """Test missing station IDs and unknown stations on the async route"""
+    upstream = FakeUpstream(set())
+    missing, unknown = run_requests(
+        upstream,
+        ('/metar', {'form': {}}),
+        ('/metar', {'form': {'station_id': 'XXXX'}}),
+    )
+    assert missing[0] == 400
+    assert unknown[0] == 404
+
+def test_async_metar_route_coalesces_concurrent_misses():
+    """Test that concurrent lookups for one station share one upstream request"""
+    upstream = FakeUpstream({"KHIO"}, delay=0.05)
+    responses = run_requests(upstream, *[('/metar', {'form': {'station_id': 'KHIO'}})] * 10)
+
+    assert all(status == 200 for status, data in responses)
+    assert len(upstream.requests) == 1
+
+def test_failed_leader_leaves_waiters_a_miss():
+    """Test that coalesced lookups get a miss, not the leader's cancellation, when the leader fails"""
+    async def run():
+        service = AsyncMetarService(Mock())
+        release = asyncio.Event()
+
+        async def load_metar(station_id):
+            await release.wait()
+            raise asyncio.CancelledError()
+
+        service.load_metar = load_metar
+        leader = asyncio.ensure_future(service.get_metar_cached('KHIO'))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(service.get_metar_cached('KHIO')) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(leader, *waiters, return_exceptions=True)
+        return results, service._inflight
+
+    (leader, *waiters), inflight = asyncio.run(run())
+    assert isinstance(leader, asyncio.CancelledError)
+    assert waiters == [None, None, None]
+    assert inflight == {}
+
+def test_async_batch_route():
+    """Test that the async batch route splits results and errors per station"""
+    upstream = FakeUpstream({"KHIO", "KJFK"})
+    (status, data), = run_requests(upstream, ('/metar/batch', {'json_body': {'station_ids': ['KHIO', 'kjfk', 'XXXX']}}))
+
+    assert status == 200
+    assert sorted(data['results']) == ['KHIO', 'KJFK']
+    assert data['errors'] == {'XXXX': 'No METAR data found for XXXX'}
+    assert len(upstream.requests) == 1
+
+def test_async_client_retries_server_errors():
+    """Test that the async client retries 5xx responses"""
+    upstream = FakeUpstream({"KHIO"}, statuses=[503, 500])
+
+    async def fetch():
+        web_app = web.Application()
+        web_app.router.add_get('/api/data/metar', upstream.handle)
+        server = TestServer(web_app)
+        await server.start_server()
+        client = AsyncUpstreamClient(retries=2, backoff=0)
+        try:
+            return await client.get(str(server.make_url('/api/data/metar?ids=KHIO')))
+        finally:
+            await client.aclose()
+            await server.close()
+
+    response = asyncio.run(fetch())
+    assert response.status_code == 200
+    assert response.text == metar_for("KHIO")
+    assert len(upstream.requests) == 3
+
+def test_cancelled_probe_releases_the_breaker():
+    """Test that a half-open probe cancelled mid-request lets a later request probe again"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record(True)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def hang(url, headers=None):
+            started.set()
+            await asyncio.sleep(60)
+
+        service = AsyncMetarService(Mock(get=hang))
+        task = asyncio.ensure_future(service.upstream_get('http://upstream.invalid/api/data/metar?ids=KHIO'))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with patch('app.upstream_breaker', breaker):
+        asyncio.run(run())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+def test_async_health_reports_upstream():
+    """Test that the async /health route reflects upstream failures"""
+    upstream = FakeUpstream(set(), statuses=[503] * 3)
+    with patch('app.upstream_health', UpstreamHealth()):
+        (status, data), = run_requests(upstream, ('/metar', {'form': {'station_id': 'KHIO'}}))
+        assert status == 404
+        status, data = asyncio.run(call_asgi(MetarASGIApp(), '/health', method='GET'))
+
+    assert status == 200
+    assert data['status'] == 'degraded'
+    assert data['upstream']['error_rate'] == 1.0
+
+def test_async_nearby_route():
+    """Test that the async /metar/nearby route batches the closest catalog stations"""
+    upstream = FakeUpstream({"KPDX", "KVUO"})
+    (status, data), = run_requests(upstream, ('/metar/nearby', {'form': {'lat': '45.52', 'lon': '-122.68', 'k': '3'}}))
+
+    assert status == 200
+    assert [station['station_id'] for station in data['stations']] == ['KPDX', 'KVUO', 'KHIO']
+    assert set(data['results']) == {'KPDX', 'KVUO'}
+    assert list(data['errors']) == ['KHIO']
+    assert len(upstream.requests) == 1
+
+def test_async_history_route_reads_off_the_event_loop():
+    """Test that /metar/history queries the store in a worker thread"""
+    threads = []
+
+    def metar_history(values):
+        threads.append(threading.current_thread())
+        return {'station_id': values['station_id'], 'observations': []}, 200
+
+    with patch('app.metar_history', side_effect=metar_history):
+        status, data = asyncio.run(call_asgi(MetarASGIApp(), '/metar/history', form={'station_id': 'KHIO'}))
+
+    assert status == 200
+    assert data == {'station_id': 'KHIO', 'observations': []}
+    assert threads and threads[0] is not threading.main_thread()
+
+def test_async_routes_reject_unsupported_methods():
+    """Test that each route answers only the methods its Flask route does, like Flask with a 405"""
+    application = MetarASGIApp()
+    for method, path in (('PUT', '/metar/KHIO'), ('POST', '/metar/KHIO'), ('DELETE', '/taf/KHIO'),
+                         ('POST', '/health'), ('POST', '/metrics'), ('GET', '/metar'), ('GET', '/metar/batch'),
+                         ('PUT', '/metar/history')):
+        status, data = asyncio.run(call_asgi(application, path, method=method))
+        assert (method, path, status) == (method, path, 405)
+        assert data == {'error': 'Method not allowed'}
+
+    # History is off here, so a GET gets past the method check to the 404
+    status, data = asyncio.run(call_asgi(application, '/metar/history', method='GET'))
+    assert status == 404
+    status, data = asyncio.run(call_asgi(application, '/metar/history', method='POST'))
+    assert status == 404
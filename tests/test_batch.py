@@ -0,0 +1,123 @@
+import sys
+import os
+from unittest.mock import patch, Mock
+from urllib.parse import parse_qs, urlparse
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, chunk_stations, split_metars, get_metars_cached
+from helpers import metar_for
+
+def fake_upstream(known):
+    """Build an upstream.get replacement answering for the known stations"""
+    def get(url):
+        ids = parse_qs(urlparse(url).query)['ids'][0].split(',')
+        response = Mock()
+        lines = [metar_for(station_id) for station_id in ids if station_id in known]
+        response.status_code = 200 if lines else 204
+        response.text = '\n'.join(lines)
+        return response
+    return get
+
+def test_split_metars():
+    """Test splitting a multi-station response per station"""
+    text = "\n".join([
+        "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987",
+        "KJFK 141251Z 31008KT 10SM FEW250 12/M01 A3012",
+        "",
+        "METAR KHIO 141153Z 18004KT 10SM CLR 15/14 A2986",
+    ])
+    metars = split_metars(text)
+    assert metars == {
+        "KHIO": "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987",
+        "KJFK": "KJFK 141251Z 31008KT 10SM FEW250 12/M01 A3012",
+    }
+
+def test_chunk_stations_balances_chunks():
+    """Test that stations are split into the fewest even chunks"""
+    stations = [f"K{i:03d}" for i in range(210)]
+    chunks = chunk_stations(stations, 100)
+    assert [len(chunk) for chunk in chunks] == [70, 70, 70]
+    assert sum(chunks, []) == stations
+
+    assert chunk_stations(["KHIO"], 100) == [["KHIO"]]
+
+@patch('app.upstream.get')
+def test_get_metars_cached_fetches_in_chunks(mock_get):
+    """Test that missing stations are fetched in chunked upstream requests"""
+    stations = [f"K{i:03d}" for i in range(25)]
+    mock_get.side_effect = fake_upstream(set(stations))
+
+    with patch('app.BATCH_CHUNK_SIZE', 10):
+        metars, errors = get_metars_cached(stations)
+
+    assert errors == {}
+    assert metars == {station_id: metar_for(station_id) for station_id in stations}
+    assert mock_get.call_count == 3
+
+    # A second lookup is served from the cache
+    metars, errors = get_metars_cached(stations)
+    assert len(metars) == 25
+    assert mock_get.call_count == 3
+
+@patch('app.upstream.get')
+def test_batch_route_reports_errors_per_station(mock_get):
+    """Test that unknown stations and failed chunks are reported separately"""
+    mock_get.side_effect = fake_upstream({"KHIO", "KJFK"})
+    client = app.test_client()
+
+    response = client.post('/metar/batch', json={'station_ids': ['khio', 'KJFK', 'XXXX', 'KHIO']})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert list(data['results']) == ['KHIO', 'KJFK']
+    assert "Wind: South at 5 knots" in data['results']['KHIO']['decoded_report']
+    assert 'decoded' not in data['results']['KHIO']
+    assert data['errors'] == {'XXXX': 'No METAR data found for XXXX'}
+    assert mock_get.call_count == 1
+
+@patch('app.upstream.get')
+def test_batch_route_upstream_failure(mock_get):
+    """Test that a failed upstream request marks its stations as errors"""
+    mock_get.side_effect = Exception("Network error")
+    client = app.test_client()
+
+    response = client.post('/metar/batch', data={'station_ids': 'KHIO,KJFK'})
+    data = response.get_json()
+    assert data['results'] == {}
+    assert data['errors'] == {
+        'KHIO': 'Unable to fetch METAR data for KHIO',
+        'KJFK': 'Unable to fetch METAR data for KJFK',
+    }
+
+@patch('app.upstream.get')
+def test_batch_route_json_option(mock_get):
+    """Test that the batch route can return structured fields"""
+    mock_get.side_effect = fake_upstream({"KHIO"})
+    client = app.test_client()
+
+    response = client.post('/metar/batch', json={'station_ids': 'KHIO', 'format': 'json'})
+    decoded = response.get_json()['results']['KHIO']['decoded']
+    assert decoded['wind_speed'] == 5
+    assert decoded['altimeter'] == 29.87
+
+def test_batch_route_validates_input():
+    """Test that empty and oversized batches are rejected"""
+    client = app.test_client()
+
+    response = client.post('/metar/batch', json={'station_ids': []})
+    assert response.status_code == 400
+
+    with patch('app.BATCH_MAX_STATIONS', 2):
+        response = client.post('/metar/batch', json={'station_ids': ['KHIO', 'KJFK', 'KLAX']})
+    assert response.status_code == 400
+
+def test_batch_route_rejects_bodies_that_are_not_objects():
+    """Test that JSON lists, strings and non-list station_ids are a 400, not a 500"""
+    client = app.test_client()
+
+    for body in (['KHIO'], 'KHIO', 7, {'station_ids': 7}, {'station_ids': None}):
+        for path in ('/metar/batch', '/taf/batch'):
+            response = client.post(path, json=body)
+            assert response.status_code == 400
+            assert response.get_json() == {'error': 'Please enter at least one station ID'}
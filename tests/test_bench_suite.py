@@ -0,0 +1,31 @@
+import sys
+import os
+
+# Add the app and benchmarks directories to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from bench_suite import compare, corpus_coverage, CORPUS_FEATURES
+from corpus import generate_corpus
+
+def test_corpus_covers_required_features():
+    """Test that the generated corpus shows every feature the suite needs"""
+    coverage = corpus_coverage(generate_corpus(2000, 0))
+    assert set(coverage) == set(CORPUS_FEATURES)
+    assert all(coverage.values())
+    assert corpus_coverage(["KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"]) == dict.fromkeys(CORPUS_FEATURES, 0)
+
+def test_compare_flags_regressions_by_direction():
+    """Test that throughput drops and latency rises regress, tails get more slack"""
+    baseline = {'decode_reports_per_sec': 1000.0, 'metar_hit_p50_ms': 1.0,
+                'metar_hit_p99_ms': 2.0, 'decode_peak_bytes_per_report': 600.0}
+    current = {'decode_reports_per_sec': 700.0, 'metar_hit_p50_ms': 0.5,
+               'metar_hit_p99_ms': 2.6, 'decode_peak_bytes_per_report': 800.0, 'new_metric': 1.0}
+
+    rows = {row[0]: row for row in compare(current, baseline, 0.2)}
+    assert set(rows) == set(baseline)
+    assert rows['decode_reports_per_sec'][3] == 0.3
+    assert rows['decode_reports_per_sec'][4]
+    assert not rows['metar_hit_p50_ms'][4]
+    assert not rows['metar_hit_p99_ms'][4]
+    assert rows['decode_peak_bytes_per_report'][4]
@@ -0,0 +1,104 @@
+import pytest
+import sys
+import os
+import csv
+import gzip
+import io
+import json
+import subprocess
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bulk_decode import chunked, decode_chunk, decode_stream, main, read_lines
+
+METARS = [
+    "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987",
+    "METAR EGLL 141250Z 24012G25KT 9999 -SHRA SCT012 BKN080 12/09 Q1013",
+    "METAR KJFK 141251Z 31010KT 1/2SM FG BKN004 M02/M03 A3001",
+]
+
+@pytest.fixture
+def archive(tmp_path):
+    """Write the sample METARs to a plain and a gzipped file, with blank lines"""
+    plain = tmp_path / 'archive.txt'
+    plain.write_text(METARS[0] + '\n\n' + METARS[1] + '\n')
+    zipped = tmp_path / 'archive.txt.gz'
+    with gzip.open(zipped, 'wt') as f:
+        f.write(METARS[2] + '\n')
+    return [str(plain), str(zipped)]
+
+def test_read_lines_skips_blanks_and_reads_gzip(archive):
+    """Test that input files are streamed line by line, gzip included"""
+    assert list(read_lines(archive)) == METARS
+
+def test_read_lines_stdin(monkeypatch):
+    """Test that '-' or no inputs read from stdin"""
+    monkeypatch.setattr('sys.stdin', io.StringIO('\n'.join(METARS)))
+    assert list(read_lines([])) == METARS
+
+def test_chunked():
+    """Test that lines are grouped into bounded chunks"""
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+def test_decode_chunk():
+    """Test that a chunk decodes to structured records"""
+    records = decode_chunk(METARS[:2], with_text=True)
+
+    assert records[0]['station'] == 'KHIO'
+    assert records[1]['wind_gust'] == 25
+    assert records[1]['weather'] == ['-SHRA']
+    assert "Wind: South at 5 knots" in records[0]['decoded_report']
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_decode_stream_process_pool(ordered):
+    """Test that the process pool decodes every chunk, in order when asked"""
+    lines = METARS * 10
+    results = list(decode_stream(chunked(lines, 3), workers=2, ordered=ordered))
+    stations = [record['station'] for records in results for record in records]
+
+    assert len(stations) == len(lines)
+    if ordered:
+        assert stations == [metar.split()[1] for metar in lines]
+    else:
+        assert sorted(stations) == sorted(metar.split()[1] for metar in lines)
+
+def test_main_writes_jsonl(archive, tmp_path, capsys):
+    """Test the CLI writing JSON lines and reporting throughput"""
+    output = tmp_path / 'decoded.jsonl'
+    assert main([*archive, '-o', str(output), '--workers', '0', '--chunk-size', '2']) == 0
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [record['raw'] for record in records] == METARS
+    assert 'Decoded 3 reports' in capsys.readouterr().err
+
+def test_main_writes_csv(archive, tmp_path):
+    """Test the CLI writing CSV with flattened weather and clouds"""
+    output = tmp_path / 'decoded.csv'
+    main([*archive, '-o', str(output), '--format', 'csv', '--workers', '0'])
+
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['station'] for row in rows] == ['KHIO', 'EGLL', 'KJFK']
+    assert rows[1]['weather'] == '-SHRA'
+    assert rows[1]['clouds'] == 'SCT:1200 BKN:8000'
+    assert rows[2]['temperature'] == '-2'
+
+def test_main_writes_csv_recent_weather(tmp_path):
+    """Test that recent weather is flattened in CSV like present weather"""
+    archive = tmp_path / 'archive.txt'
+    archive.write_text("METAR KJFK 141251Z 31010KT 10SM BKN040 M02/M03 A3001 RESN RETSRA\n")
+    output = tmp_path / 'decoded.csv'
+    main([str(archive), '-o', str(output), '--format', 'csv', '--workers', '0'])
+
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]['weather'] == ''
+    assert rows[0]['recent_weather'] == 'SN TSRA'
+
+def test_bulk_decode_does_not_load_the_web_app():
+    """Test that importing the bulk decoder leaves app, its upstream session and stores unbuilt"""
+    script = "import sys, bulk_decode; print('app' in sys.modules, 'flask' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'False']
@@ -0,0 +1,173 @@
+import pytest
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import TTLCache
+from app import app, decode_memo, get_metar_cached, parse_metar_cached
+from helpers import FakeClock
+
+def test_cache_hit_and_miss():
+    """Test that cached values are returned and counted"""
+    cache = TTLCache(maxsize=4, ttl=60)
+    assert cache.get("KHIO") is None
+    cache.set("KHIO", "METAR KHIO")
+    assert cache.get("KHIO") == "METAR KHIO"
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['size'] == 1
+
+def test_cache_entries_expire():
+    """Test that entries expire after the time to live"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=4, ttl=60, clock=clock)
+    cache.set("KHIO", "METAR KHIO")
+
+    clock.now = 59
+    assert cache.get("KHIO") == "METAR KHIO"
+    clock.now = 60
+    assert cache.get("KHIO") is None
+    assert cache.stats()['expirations'] == 1
+    assert len(cache) == 0
+
+def test_cache_evicts_least_recently_used():
+    """Test LRU eviction once the cache is full"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("KHIO", "a")
+    cache.set("KJFK", "b")
+    # Touch KHIO so KJFK becomes the least recently used entry
+    cache.get("KHIO")
+    cache.set("KLAX", "c")
+
+    assert cache.get("KJFK") is None
+    assert cache.get("KHIO") == "a"
+    assert cache.get("KLAX") == "c"
+    assert cache.stats()['evictions'] == 1
+
+def test_get_or_load_does_not_cache_failures():
+    """Test that a loader returning None is retried on the next call"""
+    cache = TTLCache(maxsize=4, ttl=60)
+    loader = Mock(side_effect=[None, "METAR KHIO"])
+
+    assert cache.get_or_load("KHIO", loader) is None
+    assert cache.get_or_load("KHIO", loader) == "METAR KHIO"
+    assert cache.get_or_load("KHIO", loader) == "METAR KHIO"
+    assert loader.call_count == 2
+
+def test_get_or_load_coalesces_concurrent_misses():
+    """Test that concurrent misses for one key run the loader once"""
+    cache = TTLCache(maxsize=4, ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        release.wait(5)
+        return f"METAR {key}"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("KHIO", loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Wait until every follower is parked behind the leader
+    deadline = time.monotonic() + 5
+    while cache.stats()['coalesced'] < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["KHIO"]
+    assert results == ["METAR KHIO"] * 8
+
+def test_get_or_load_propagates_errors_to_waiters():
+    """Test that a failing loader raises in every coalesced caller"""
+    cache = TTLCache(maxsize=4, ttl=60)
+    loader = Mock(side_effect=RuntimeError("upstream down"))
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("KHIO", loader)
+    assert len(cache) == 0
+
+@patch('app.upstream.get')
+def test_cached_fetch_hits_upstream_once(mock_get):
+    """Test that repeated lookups for a station share one upstream request"""
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.text = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+    mock_get.return_value = mock_response
+
+    for _ in range(3):
+        assert get_metar_cached("KHIO") == "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+    assert mock_get.call_count == 1
+
+@patch('app.upstream.get')
+def test_metar_route_uses_cache_and_reports_stats(mock_get):
+    """Test that /metar is served from the cache and /stats exposes counters"""
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.text = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+    mock_get.return_value = mock_response
+    client = app.test_client()
+
+    for _ in range(2):
+        response = client.post('/metar', data={'station_id': 'KHIO'})
+        assert response.status_code == 200
+    assert mock_get.call_count == 1
+
+    stats = client.get('/stats').get_json()
+    assert stats['cache']['hits'] == 1
+    assert stats['cache']['misses'] == 1
+    assert stats['cache']['size'] == 1
+    # The new report is decoded once when it is published, then both requests hit the memo
+    assert stats['decode']['misses'] == 1
+    assert stats['decode']['hits'] == 2
+
+def test_cache_without_ttl_never_expires():
+    """Test that ttl=None keeps entries until they are evicted"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=None, clock=clock)
+    cache.set("KHIO", "METAR KHIO")
+    clock.now = 1e9
+    assert cache.get("KHIO") == "METAR KHIO"
+
+    cache.set("KJFK", "METAR KJFK")
+    cache.set("KLAX", "METAR KLAX")
+    assert cache.get("KHIO") is None
+    assert cache.stats()['evictions'] == 1
+
+def test_cache_hit_rate():
+    """Test that the hit rate is reported as a fraction of lookups"""
+    cache = TTLCache(maxsize=4, ttl=60)
+    assert cache.stats()['hit_rate'] == 0.0
+    cache.set("KHIO", "METAR KHIO")
+    for key in ["KHIO", "KHIO", "KHIO", "KJFK"]:
+        cache.get(key)
+    assert cache.stats()['hit_rate'] == 0.75
+
+def test_decode_memo_reuses_parsed_report():
+    """Test that repeated raw text is parsed and rendered only once"""
+    metar_text = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+    first = parse_metar_cached(metar_text)
+    report = first.render()
+
+    with patch('decoder.parse_metar') as mock_parse, patch('decoder.render_report') as mock_render:
+        second = parse_metar_cached(metar_text)
+        assert second.render() == report
+    assert second is first
+    mock_parse.assert_not_called()
+    mock_render.assert_not_called()
+    assert decode_memo.stats()['hits'] == 1
+
+def test_decode_memo_skips_empty_text():
+    """Test that undecodable text is not memoized"""
+    assert parse_metar_cached("   ") is None
+    assert len(decode_memo) == 0
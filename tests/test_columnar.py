@@ -0,0 +1,77 @@
+import pytest
+import sys
+import os
+import math
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import parse_metar
+from columnar import decode_columns
+
+FIELDS = [
+    'station', 'day', 'time', 'wind_dir', 'wind_speed', 'wind_gust', 'wind_unit',
+    'visibility_sm', 'visibility_m', 'temperature', 'dewpoint', 'altimeter', 'altimeter_unit',
+]
+
+METARS = [
+    "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987",
+    "SPECI EGLL 141250Z 24012G25KT 9999 -SHRA SCT012 BKN080 12/09 Q1013",
+    "KJFK 141251Z 31010KT 1/2SM FG BKN004 M02/M03 A3001",
+    "METAR LFPG 141300Z 05003MPS CAVOK 21/M01 Q1020",
+    "METAR EDDF 141250Z VRB02KT 0800 FG VV002 05/05 Q1015 NOSIG",
+    "METAR KSEA 141253Z 18005KT",
+    "METAR KSEA",
+    "METAR",
+    "",
+    "   ",
+    # Groups in the header positions are not read as fields
+    "METAR 18005KT 20010KT 12/10",
+    "METAR KBOS 141254Z 9999 RMK 4/003 A2992 A3001",
+]
+
+def test_columns_match_parse_metar():
+    """Test that every column agrees with parse_metar row by row"""
+    columns = decode_columns(METARS)
+    for index, metar_text in enumerate(METARS):
+        decoded = parse_metar(metar_text)
+        for name in FIELDS:
+            expected = getattr(decoded, name) if decoded else None
+            got = columns[name][index]
+            if isinstance(expected, float):
+                assert math.isclose(got, expected), (metar_text, name)
+            else:
+                assert got == expected, (metar_text, name)
+        assert bool(columns['cavok'][index]) == (decoded.cavok if decoded else False)
+
+def test_numeric_columns_are_typed_arrays_with_masks():
+    """Test that numeric columns store typed values and a validity byte per row"""
+    columns = decode_columns(METARS[:3])
+    gust = columns['wind_gust']
+
+    assert gust.values.typecode == 'q'
+    assert list(gust.values) == [0, 25, 0]
+    assert bytes(gust.valid) == b'\x00\x01\x00'
+    assert gust.tolist() == [None, 25, None]
+    assert columns['altimeter'].values.typecode == 'd'
+    assert columns['temperature'].tolist() == [16, 12, -2]
+
+def test_empty_batch():
+    """Test that an empty batch gives empty columns"""
+    columns = decode_columns([])
+    assert columns['station'] == []
+    assert len(columns['temperature']) == 0
+
+def test_reports_with_line_breaks_are_rejected():
+    """Test that multi-line strings cannot shift rows"""
+    with pytest.raises(ValueError):
+        decode_columns(["METAR KHIO 141253Z\n18005KT"])
+
+def test_to_numpy_masked_array():
+    """Test the conversion to a numpy masked array"""
+    numpy = pytest.importorskip('numpy')
+    temperature = decode_columns(METARS[:3] + [""])['temperature'].to_numpy()
+
+    assert isinstance(temperature, numpy.ma.MaskedArray)
+    assert temperature.count() == 3
+    assert temperature.mean() == pytest.approx((16 + 12 - 2) / 3)
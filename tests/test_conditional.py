@@ -0,0 +1,122 @@
+import pytest
+import sys
+import os
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import decoder
+from app import app, upstream_validators, change_listeners, polls, fetch_metar, fetch_metar_batch, publish_changes
+from helpers import upstream_response
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+KHIO_NEXT = "METAR KHIO 141353Z 18006KT 10SM CLR 17/15 A2987"
+KJFK = "KJFK 141251Z 31010KT 1/2SM FG BKN004 M02/M03 A3001"
+
+@pytest.fixture(autouse=True)
+def restore_listeners():
+    """End every test with the change listeners it started with"""
+    listeners = list(change_listeners)
+    yield
+    change_listeners[:] = listeners
+
+def poll_counts():
+    return polls.value(result='updated'), polls.value(result='unchanged')
+
+@patch('app.upstream.get')
+def test_revalidates_with_stored_validators(mock_get):
+    """Test that a refresh sends the stored ETag and reuses the body on 304"""
+    mock_get.side_effect = [
+        upstream_response(200, KHIO, {'ETag': '"abc"', 'Last-Modified': 'Thu, 14 Mar 2024 12:55:00 GMT'}),
+        upstream_response(304),
+    ]
+
+    assert fetch_metar('KHIO') == KHIO
+    assert fetch_metar('KHIO') == KHIO
+
+    first, second = mock_get.call_args_list
+    assert first.kwargs == {}
+    assert second.kwargs['headers'] == {
+        'If-None-Match': '"abc"', 'If-Modified-Since': 'Thu, 14 Mar 2024 12:55:00 GMT'}
+
+@patch('app.upstream.get')
+def test_no_validators_without_upstream_support(mock_get):
+    """Test that plain GETs are sent when the upstream sends no validators"""
+    mock_get.return_value = upstream_response(200, KHIO)
+
+    fetch_metar('KHIO')
+    fetch_metar('KHIO')
+
+    assert all(call.kwargs == {} for call in mock_get.call_args_list)
+
+@patch('app.upstream.get')
+def test_conditional_requests_can_be_disabled(mock_get):
+    """Test that METAR_CONDITIONAL_REQUESTS=0 stores no validators"""
+    mock_get.return_value = upstream_response(200, KHIO, {'ETag': '"abc"'})
+
+    with patch('app.CONDITIONAL_REQUESTS', False):
+        fetch_metar('KHIO')
+        fetch_metar('KHIO')
+
+    assert all(call.kwargs == {} for call in mock_get.call_args_list)
+    assert len(upstream_validators) == 0
+
+@patch('app.upstream.get')
+def test_batch_counts_updated_and_unchanged(mock_get):
+    """Test that only stations with a new report are counted and published"""
+    mock_get.side_effect = [
+        upstream_response(200, f"{KHIO}\n{KJFK}", {'ETag': '"1"'}),
+        upstream_response(304),
+        upstream_response(200, f"{KHIO_NEXT}\n{KJFK}", {'ETag': '"2"'}),
+    ]
+    published = []
+    change_listeners.append(published.append)
+    updated, unchanged = poll_counts()
+
+    assert fetch_metar_batch(['KHIO', 'KJFK']) == {'KHIO': KHIO, 'KJFK': KJFK}
+    assert fetch_metar_batch(['KHIO', 'KJFK']) == {'KHIO': KHIO, 'KJFK': KJFK}
+    assert fetch_metar_batch(['KHIO', 'KJFK']) == {'KHIO': KHIO_NEXT, 'KJFK': KJFK}
+
+    assert published == [{'KHIO': KHIO, 'KJFK': KJFK}, {'KHIO': KHIO_NEXT}]
+    assert poll_counts() == (updated + 3, unchanged + 3)
+    assert mock_get.call_args_list[2].kwargs['headers'] == {'If-None-Match': '"1"'}
+
+def test_updated_reports_are_decoded_once():
+    """Test that publishing decodes new reports into the memo"""
+    with patch('decoder.parse_metar', wraps=decoder.parse_metar) as parse:
+        publish_changes({'KHIO': KHIO})
+        publish_changes({'KHIO': KHIO})
+    assert parse.call_count == 1
+    assert decoder.decode_memo.get(KHIO) is not None
+
+def test_failing_listener_does_not_break_fetch():
+    """Test that an exception in one listener still reaches the others"""
+    published = []
+    change_listeners.extend([Mock(side_effect=RuntimeError), published.append])
+
+    assert publish_changes({'KHIO': KHIO}) == {'KHIO': KHIO}
+    assert published == [{'KHIO': KHIO}]
+
+def test_metrics_expose_poll_counters():
+    """Test that the poll counters appear on /metrics"""
+    publish_changes({'KHIO': KHIO})
+    body = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'metar_polls_total{result="updated"}' in body
+
+def test_stub_answers_conditional_requests():
+    """Test the ETag handling of the benchmark stub against the real client"""
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+    from stub_upstream import StubUpstream
+    server = StubUpstream().start()
+    try:
+        with patch('app.METAR_API_URL', f'{server.url}/api/data/metar'):
+            first = fetch_metar('KHIO')
+            sent = server.bytes_sent
+            assert fetch_metar('KHIO') == first
+            assert server.bytes_sent == sent
+            server.advance(['KHIO'])
+            assert fetch_metar('KHIO') != first
+            assert server.bytes_sent > sent
+    finally:
+        server.stop()
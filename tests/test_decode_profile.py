@@ -0,0 +1,127 @@
+import pytest
+import sys
+import os
+import asyncio
+import json
+from unittest.mock import patch
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from decoder import DECODE_PROFILE_WINDOW, decode_memo, enable_decode_profile, parse_metar, parse_metar_cached
+from asgi import MetarASGIApp
+from bulk_decode import main
+from metrics import DecodeProfile
+from helpers import FakeClock
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987 RMK AO2 SLP125 T01560150"
+EGLL = "METAR EGLL 141250Z 24012G25KT 9999 -SHRA SCT012 BKN080 12/09 Q1013"
+
+@pytest.fixture(autouse=True)
+def profile_off():
+    """Start and end every test with profiling off"""
+    enable_decode_profile(False)
+    yield
+    enable_decode_profile(False)
+
+def test_profile_keeps_the_slowest_reports_per_window():
+    """Test totals by kind, the bounded sample, render time joining a report, and windows aging out"""
+    clock = FakeClock()
+    profile = DecodeProfile(slowest=2, window=60, clock=clock)
+    for raw, seconds in (('A', 0.001), ('B', 0.003), ('C', 0.002)):
+        profile.record(raw, [('header', 1, 0.0001), ('sky', 2, seconds)])
+    state = profile.state()
+    assert state['reports'] == 3
+    assert state['groups']['sky'] == {'tokens': 6, 'seconds': 0.006, 'mean_us': 1000.0}
+    assert [report['raw'] for report in state['slowest']] == ['B', 'C']
+
+    # Rendering A after its parse makes it the slowest
+    profile.record_render('A', 0.005)
+    state = profile.state()
+    assert [report['raw'] for report in state['slowest']] == ['A', 'B']
+    assert state['slowest'][0]['groups'] == {'header': 0.0001, 'render': 0.005, 'sky': 0.001}
+    assert state['groups']['render']['tokens'] == 1
+
+    clock.now = 70
+    profile.record('D', [('wind', 1, 0.0001)])
+    assert [report['raw'] for report in profile.state()['slowest']] == ['A', 'B']
+    clock.now = 130
+    assert [report['raw'] for report in profile.state()['slowest']] == ['D']
+
+    merged = DecodeProfile(slowest=2)
+    merged.merge(state)
+    merged.merge(state)
+    assert merged.state()['reports'] == 6
+    assert merged.state()['groups']['sky']['tokens'] == 12
+    assert [report['raw'] for report in merged.state()['slowest']] == ['A', 'A']
+
+def test_profiled_decode_matches_and_counts_groups():
+    """Test that profiling decodes exactly like parse_metar and times every group by kind"""
+    plain = [parse_metar(text).to_dict() for text in (KHIO, EGLL)]
+    profile = enable_decode_profile()
+    assert [parse_metar(text).to_dict() for text in (KHIO, EGLL)] == plain
+
+    groups = profile.state()['groups']
+    assert {kind: counts['tokens'] for kind, counts in groups.items()} == {
+        'header': 2, 'wind': 2, 'visibility': 2, 'weather': 1, 'sky': 3,
+        'temperature': 2, 'altimeter': 2, 'remarks': 3}
+    assert parse_metar_cached(KHIO).render().startswith("Weather report for KHIO")
+    assert profile.state()['groups']['render']['tokens'] == 1
+
+def test_profile_off_skips_the_profiled_decoder():
+    """Test that with profiling off parse_metar and render() take the plain path"""
+    with patch('decoder.parse_metar_profiled', side_effect=AssertionError('profiled')), \
+            patch('metrics.DecodeProfile.record_render', side_effect=AssertionError('profiled')):
+        assert parse_metar(KHIO).render().startswith("Weather report for KHIO")
+
+def test_admin_decode_profile_endpoints():
+    """Test /admin/decode-profile on Flask and ASGI, off, on, and reset"""
+    client = app.test_client()
+    assert client.get('/admin/decode-profile').get_json() == {'enabled': False}
+
+    enable_decode_profile()
+    parse_metar_cached(KHIO).render()
+    body = client.get('/admin/decode-profile?reset=1').get_json()
+    assert body['enabled'] is True and body['reports'] == 1
+    assert body['window_seconds'] == DECODE_PROFILE_WINDOW
+    assert body['slowest'][0]['raw'] == KHIO
+    assert 'render' in body['slowest'][0]['groups']
+
+    async def call(application):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/admin/decode-profile', 'query_string': b'',
+                 'headers': []}
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        return sent[0]['status'], json.loads(sent[1]['body'])
+
+    status, body = asyncio.run(call(MetarASGIApp()))
+    assert status == 200
+    assert body['enabled'] is True and body['reports'] == 0 and body['slowest'] == []
+
+def test_bulk_decode_profile(tmp_path, capsys):
+    """Test that --profile merges worker profiles into a table on stderr or a JSON file"""
+    archive = tmp_path / 'archive.txt'
+    archive.write_text('\n'.join([KHIO, EGLL]) + '\n')
+    output = tmp_path / 'decoded.jsonl'
+    profile_path = tmp_path / 'profile.json'
+
+    assert main([str(archive), '-o', str(output), '--workers', '0', '--text', '--profile', str(profile_path)]) == 0
+    profile = json.loads(profile_path.read_text())
+    assert profile['reports'] == 2
+    assert profile['groups']['wind']['tokens'] == 2
+    assert {report['raw'] for report in profile['slowest']} == {KHIO, EGLL}
+
+    decode_memo.clear()
+    assert main([str(archive), '-o', str(output), '--workers', '1', '--chunk-size', '1', '--profile']) == 0
+    err = capsys.readouterr().err
+    assert "Decode profile: 2 reports" in err
+    assert "Slowest reports:" in err and KHIO in err
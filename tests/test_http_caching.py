@@ -0,0 +1,110 @@
+import sys
+import os
+import asyncio
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+from app import app, metar_cache, decode_memo, last_reports, not_modified, report_max_age
+from asgi import MetarASGIApp
+
+def metar_at(station_id, observed):
+    return f"METAR {station_id} {observed:%d%H%M}Z 18005KT 10SM CLR 16/15 A2987"
+
+def test_get_route_matches_post_and_sets_cache_headers():
+    """Test that GET /metar/<station> serves the POST body with a strong ETag and max-age"""
+    observed = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    metar_cache.set('KHIO', metar_at('KHIO', observed))
+    client = app.test_client()
+
+    get = client.get('/metar/khio?format=json')
+    post = client.post('/metar', data={'station_id': 'KHIO', 'format': 'json'})
+
+    assert get.status_code == 200
+    assert get.data == post.data
+    assert json.loads(get.data)['decoded']['wind_speed'] == 5
+    assert get.headers['ETag'].startswith('"') and get.headers['ETag'] == post.headers['ETag']
+    assert get.headers['Cache-Control'] == f'public, max-age={app_module.MAX_AGE}'
+    assert client.get('/metar/KHIO').headers['ETag'] != get.headers['ETag']
+
+def test_if_none_match_answers_304_without_decoding():
+    """Test that a current ETag gets an empty 304 without the decoder, and a new report a new ETag"""
+    observed = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    metar_cache.set('KHIO', metar_at('KHIO', observed))
+    client = app.test_client()
+    etag = client.get('/metar/KHIO').headers['ETag']
+    answered = not_modified.value()
+
+    decode_memo.clear()
+    with patch('decoder.parse_metar', side_effect=AssertionError('decoded')):
+        response = client.get('/metar/KHIO', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert not_modified.value() == answered + 1
+
+    metar_cache.set('KHIO', metar_at('KHIO', observed.replace(minute=(observed.minute + 1) % 60)))
+    response = client.get('/metar/KHIO', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_max_age_runs_until_the_next_report_is_due():
+    """Test that max-age counts down to observation + interval + delay, within bounds"""
+    observed = 1_000_000.0
+    with patch('app.REPORT_INTERVAL', 3600), patch('app.REPORT_DELAY', 300), \
+            patch('app.MAX_AGE_MIN', 30), patch('app.MAX_AGE', 1800):
+        assert report_max_age(observed, now=observed + 60) == 1800
+        assert report_max_age(observed, now=observed + 3000) == 900
+        assert report_max_age(observed, now=observed + 4000) == 30
+        assert report_max_age(None) == 30
+
+@patch('app.upstream.get')
+def test_stale_reports_must_be_revalidated(mock_get):
+    """Test that a report served stale is marked no-cache"""
+    mock_get.return_value = Mock(status_code=503, text='', headers={})
+    last_reports.set('KHIO', metar_at('KHIO', datetime.now(timezone.utc)))
+
+    response = app.test_client().get('/metar/KHIO')
+    assert response.status_code == 200
+    assert json.loads(response.data)['stale'] is True
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+def test_async_get_route_and_304():
+    """Test that the ASGI app serves GET /metar/<station> and revalidates ETags the same way"""
+    metar_cache.set('KHIO', metar_at('KHIO', datetime.now(timezone.utc)))
+
+    async def call(application, headers=()):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/metar/KHIO', 'query_string': b'',
+                 'headers': list(headers)}
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+    async def run():
+        application = MetarASGIApp()
+        try:
+            first = await call(application)
+            again = await call(application, [(b'if-none-match', first[1][b'etag'])])
+        finally:
+            await application.service.client.aclose()
+        return first, again
+
+    (status, headers, body), (again_status, again_headers, again_body) = asyncio.run(run())
+    assert status == 200
+    assert body == app.test_client().get('/metar/KHIO').data
+    assert again_status == 304
+    assert again_body == b''
+    assert again_headers[b'etag'] == headers[b'etag']
+    assert b'content-type' not in again_headers
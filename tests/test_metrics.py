@@ -0,0 +1,127 @@
+import pytest
+import sys
+import os
+import requests
+from unittest.mock import patch
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Registry, UpstreamHealth
+from app import app, last_reports, stage_seconds, upstream_requests
+from helpers import FakeClock, metar_for, upstream_response
+
+@pytest.fixture(autouse=True)
+def fresh_upstream_health():
+    """Start every test with fresh upstream health"""
+    with patch('app.upstream_health', UpstreamHealth()):
+        yield
+
+def test_counter_and_histogram_exposition():
+    """Test the text exposition format of counters and histograms"""
+    registry = Registry()
+    counter = registry.counter('test_requests_total', 'Requests', ['status'])
+    histogram = registry.histogram('test_seconds', 'Latency', buckets=(0.1, 1.0))
+    counter.inc(status=200)
+    counter.inc(2, status=200)
+    counter.inc(status='error')
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(5)
+
+    assert registry.render().splitlines() == [
+        '# HELP test_requests_total Requests',
+        '# TYPE test_requests_total counter',
+        'test_requests_total{status="200"} 3',
+        'test_requests_total{status="error"} 1',
+        '# HELP test_seconds Latency',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        'test_seconds_sum 5.15',
+        'test_seconds_count 3',
+    ]
+
+def test_label_values_are_escaped():
+    """Test that quotes and backslashes in label values are escaped"""
+    registry = Registry()
+    registry.counter('test_total', 'Test', ['path']).inc(path='a"b\\c')
+    assert 'test_total{path="a\\"b\\\\c"} 1' in registry.render()
+
+def test_upstream_health_window():
+    """Test error rate, reachability and ages over the recent window"""
+    clock = FakeClock()
+    health = UpstreamHealth(window=4, clock=clock)
+    assert health.state()['reachable'] is None
+
+    for status_code in (200, 503, None, 200, 200):
+        clock.now += 1
+        health.record(status_code)
+    state = health.state()
+
+    assert state['reachable'] is True
+    assert state['error_rate'] == 0.5
+    assert state['requests'] == 4
+    assert state['last_success_ago'] == 0
+    assert state['last_error_ago'] == 2
+
+@patch('app.upstream.get')
+def test_metar_request_records_stages_and_upstream_status(mock_get):
+    """Test that /metar feeds the stage histograms and upstream counters"""
+    mock_get.return_value = upstream_response(200, metar_for('KHIO'))
+    before = {stage: stage_seconds.count(stage=stage) for stage in ('fetch', 'decode', 'response')}
+    ok_before = upstream_requests.value(status=200)
+
+    response = app.test_client().post('/metar', data={'station_id': 'KHIO'})
+
+    assert response.status_code == 200
+    for stage, count in before.items():
+        assert stage_seconds.count(stage=stage) == count + 1
+    assert upstream_requests.value(status=200) == ok_before + 1
+
+@patch('app.upstream.get')
+def test_metrics_endpoint(mock_get):
+    """Test that /metrics serves the text exposition format"""
+    mock_get.side_effect = requests.ConnectionError('down')
+    client = app.test_client()
+    client.post('/metar', data={'station_id': 'KHIO'})
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE metar_stage_seconds histogram' in text
+    assert 'metar_stage_seconds_bucket{stage="fetch",le="+Inf"}' in text
+    assert 'metar_upstream_requests_total{status="error"}' in text
+    assert 'metar_requests_total{endpoint="get_metar",status="404"}' in text
+    assert 'metar_cache_misses_total 1' in text
+
+@patch('app.upstream.get')
+def test_health_reflects_upstream(mock_get):
+    """Test that /health turns degraded on errors and unhealthy when unreachable with nothing to serve"""
+    client = app.test_client()
+    data = client.get('/health').get_json()
+    assert data['status'] == 'healthy'
+    assert data['upstream']['reachable'] is None
+
+    failed = upstream_response(503)
+    mock_get.side_effect = [upstream_response(200, metar_for('KHIO')), failed, failed]
+    for station_id in ('KHIO', 'KJFK', 'KLAX'):
+        client.post('/metar', data={'station_id': station_id})
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'degraded'
+
+    mock_get.side_effect = requests.ConnectionError('down')
+    client.post('/metar', data={'station_id': 'KSEA'})
+    # KHIO can still be served stale
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'degraded'
+
+    last_reports.clear()
+    response = client.get('/health')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'unhealthy'
+    assert response.get_json()['upstream']['reachable'] is False
@@ -0,0 +1,156 @@
+import sys
+import os
+import random
+import time
+from unittest.mock import patch, Mock
+from urllib.parse import parse_qs, urlparse
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import TTLCache
+from prefetch import PrefetchScheduler
+from app import app, metar_cache, prefetcher, refresh_metars
+from helpers import FakeClock, metar_for
+
+def make_scheduler(clock, cache, **kwargs):
+    """Scheduler refreshing into the given cache, recording each batch"""
+    batches = []
+
+    def refresh(station_ids):
+        batches.append(list(station_ids))
+        metars = {station_id: metar_for(station_id) for station_id in station_ids}
+        for station_id, metar in metars.items():
+            cache.set(station_id, metar)
+        return metars, {}
+
+    kwargs.setdefault('lead', 60)
+    kwargs.setdefault('jitter', 0)
+    scheduler = PrefetchScheduler(refresh, cache.ttl, clock=clock, rng=random.Random(0), **kwargs)
+    return scheduler, batches
+
+def test_hot_stations_are_configured_plus_top_n():
+    """Test that the hot set is the configured list plus the most requested stations"""
+    scheduler = PrefetchScheduler(Mock(), 300, stations=['KHIO'], top_n=2)
+    for station_id in ['KJFK', 'KJFK', 'KJFK', 'KLAX', 'KLAX', 'KSEA', 'KHIO']:
+        scheduler.record(station_id)
+    assert scheduler.hot_stations() == ['KHIO', 'KJFK', 'KLAX']
+
+def test_disabled_without_stations():
+    """Test that nothing is recorded or started without configuration"""
+    scheduler = PrefetchScheduler(Mock(), 300)
+    scheduler.record('KHIO')
+    scheduler.start()
+
+    assert not scheduler.enabled
+    assert scheduler.requests == {}
+    assert scheduler.state()['running'] is False
+
+def test_refreshes_ahead_of_expiry_keep_cache_warm():
+    """Test that hot stations never expire while the scheduler runs on time"""
+    clock = FakeClock()
+    cache = TTLCache(ttl=300, clock=clock)
+    scheduler, batches = make_scheduler(clock, cache, stations=['KHIO', 'KJFK'])
+
+    assert scheduler.run_pending()
+    assert batches == [['KHIO', 'KJFK']]
+    assert scheduler.next_refresh == 240
+
+    for step in range(1, 20):
+        clock.now = step * 60
+        scheduler.run_pending()
+        assert cache.get('KHIO') == metar_for('KHIO')
+    assert len(batches) == 5
+    assert cache.stats()['expirations'] == 0
+
+def test_jitter_refreshes_early_within_bounds():
+    """Test that jitter only moves refreshes earlier, by at most jitter seconds"""
+    scheduler = PrefetchScheduler(Mock(), 300, lead=60, jitter=15, rng=random.Random(1))
+    intervals = [scheduler.interval() for _ in range(100)]
+    assert all(225 <= interval <= 240 for interval in intervals)
+    assert len(set(intervals)) > 1
+
+def test_request_counts_decay_each_cycle():
+    """Test that stations stop being hot once their traffic stops"""
+    clock = FakeClock()
+    cache = TTLCache(ttl=300, clock=clock)
+    scheduler, batches = make_scheduler(clock, cache, top_n=1)
+    for _ in range(4):
+        scheduler.record('KHIO')
+
+    scheduler.run_once()
+    scheduler.run_once()
+    scheduler.run_once()
+    assert batches == [['KHIO'], ['KHIO'], ['KHIO']]
+    assert scheduler.hot_stations() == []
+    scheduler.run_once()
+    assert len(batches) == 3
+
+def test_state_reports_lag_and_failures():
+    """Test the admin state after a late cycle and a failed cycle"""
+    clock = FakeClock()
+    refresh = Mock(side_effect=[({}, {'KHIO': 'Unable to fetch METAR data for KHIO'}), ConnectionError('down')])
+    scheduler = PrefetchScheduler(refresh, 300, stations=['KHIO'], lead=60, jitter=0, clock=clock)
+
+    clock.now = 5
+    scheduler.run_pending()
+    clock.now = 250
+    scheduler.run_pending()
+    clock.now = 260
+    state = scheduler.state()
+
+    assert state['lag'] == 5
+    assert state['cycles'] == 2
+    assert state['failures'] == 2
+    assert state['last_success_ago'] is None
+    assert state['last_run_ago'] == 10
+    assert state['next_refresh_in'] == 230
+    assert state['errors'] == {'KHIO': 'down'}
+
+def test_refresh_metars_uses_batch_query():
+    """Test that a refresh fetches all stations in one request and caches them"""
+    def get(url):
+        ids = parse_qs(urlparse(url).query)['ids'][0].split(',')
+        response = Mock()
+        response.status_code = 200
+        response.text = '\n'.join(metar_for(station_id) for station_id in ids if station_id != 'XXXX')
+        return response
+
+    with patch('app.upstream.get', side_effect=get) as mock_get:
+        metars, errors = refresh_metars(['KHIO', 'KJFK', 'XXXX'])
+
+    assert mock_get.call_count == 1
+    assert sorted(metars) == ['KHIO', 'KJFK']
+    assert errors == {'XXXX': 'No METAR data found for XXXX'}
+    assert metar_cache.get('KJFK') == metar_for('KJFK')
+
+def test_metar_route_records_requests_and_admin_state():
+    """Test that /metar feeds the top-N counts shown at /admin/prefetch"""
+    client = app.test_client()
+    metar_cache.set('KHIO', metar_for('KHIO'))
+
+    with patch.object(prefetcher, 'top_n', 5), patch.object(prefetcher, 'requests', prefetcher.requests.copy()):
+        client.post('/metar', data={'station_id': 'KHIO'})
+        data = client.get('/admin/prefetch').get_json()
+
+    assert data['enabled'] is True
+    assert data['running'] is False
+    assert data['stations'] == ['KHIO']
+
+def test_background_thread_runs_and_stops():
+    """Test that start() runs a first cycle in the background and stop() joins it"""
+    refresh = Mock(return_value=({'KHIO': metar_for('KHIO')}, {}))
+    scheduler = PrefetchScheduler(refresh, 300, stations=['KHIO'])
+    scheduler.start()
+    try:
+        for _ in range(200):
+            if scheduler.cycles:
+                break
+            time.sleep(0.01)
+        assert scheduler.state()['running'] is True
+    finally:
+        scheduler.stop()
+
+    refresh.assert_called_once_with(['KHIO'])
+    assert scheduler.state()['running'] is False
+    assert scheduler.last_success is not None
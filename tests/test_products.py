@@ -0,0 +1,145 @@
+import sys
+import os
+import asyncio
+import json
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, metar_cache, parse_metar, parse_taf, split_reports, split_metars, refresh_metars
+from asgi import MetarASGIApp, UpstreamResponse
+from helpers import upstream_response
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987 RMK AO2 SLP125 T01560150"
+KJFK = "METAR KJFK 141251Z 31010KT 10SM CLR M02/M05 A3001"
+KHIO_TAF = """TAF KHIO 141120Z 1412/1512 18005KT P6SM SCT250
+    FM141800 27012G20KT 6SM -SHRA BKN030
+      TEMPO 1418/1422 2SM RA OVC015
+    PROB30 TEMPO 1500/1504 1 1/2SM TSRA BKN020CB"""
+KJFK_TAF = """TAF AMD KJFK 141130Z 1412/1518 31010KT 9999 FEW040
+    BECMG 1420/1422 36005KT"""
+
+def test_remarks_are_decoded_apart_from_the_report():
+    """Test SLP, T-group and peak wind remarks, and that groups after RMK don't leak into the body"""
+    decoded = parse_metar("METAR KBOS 141254Z 9999 M01/M03 Q1012 RMK AO1 SLP982 T10111028 PK WND 28045/1955 A3001")
+    remarks = decoded.remarks
+    assert decoded.altimeter == 1012 and decoded.altimeter_unit == 'hPa'
+    assert remarks.station_type == 'AO1'
+    assert remarks.sea_level_pressure == 998.2
+    assert (remarks.temperature, remarks.dewpoint) == (-1.1, -2.8)
+    assert (remarks.peak_wind_dir, remarks.peak_wind_speed, remarks.peak_wind_time) == (280, 45, '1955')
+    assert decoded.to_dict()['remarks']['sea_level_pressure'] == 998.2
+
+    report = parse_metar(KHIO + " PK WND 29050/55").render()
+    assert "Sea level pressure 1012.5 hectopascals" in report
+    assert "Precise temperature 15.6°C, Dewpoint 15.0°C" in report
+    # Minutes past the observation minute belong to the hour before
+    assert "Peak wind West at 50 knots at 11:55 UTC" in report
+    assert parse_metar(KJFK).remarks is None
+    assert parse_metar("METAR KJFK 141251Z 31010KT RMK PRESFR").remarks is None
+
+def test_parse_taf_periods():
+    """Test the TAF header, change groups, PROB TEMPO and when prevailing periods end"""
+    decoded = parse_taf(' '.join(KHIO_TAF.split()))
+    assert (decoded.station, decoded.issued, decoded.valid_from, decoded.valid_to) == (
+        'KHIO', '141120', '141200', '151200')
+    base, from_group, tempo, prob = decoded.periods
+    assert (base.change, base.start, base.end, base.visibility_sm, base.visibility_above) == (
+        None, '141200', '141800', 6.0, True)
+    assert (from_group.change, from_group.start, from_group.end) == ('FM', '141800', '151200')
+    assert (from_group.wind_speed, from_group.wind_gust, from_group.weather) == (12, 20, ('-SHRA',))
+    assert (tempo.change, tempo.start, tempo.end, tempo.clouds) == ('TEMPO', '141800', '142200', (('OVC', 1500),))
+    assert (prob.change, prob.probability, prob.visibility_sm, prob.weather) == ('TEMPO', 30, 1.5, ('TSRA',))
+    assert parse_taf(KHIO) is None
+
+    report = decoded.render().splitlines()
+    assert report[:3] == ["Forecast for KHIO", "Issued day 14 11:20 UTC", "Valid from day 14 12:00 to day 15 12:00 UTC"]
+    assert report[3].startswith("Day 14 12:00 to day 14 18:00: Wind: South at 5 knots; "
+                                "Visibility: More than 6 statute miles")
+    assert report[6].startswith("30% chance, temporarily day 15 00:00 to day 15 04:00: Visibility: 1 1/2 statute miles")
+    assert json.loads(json.dumps(decoded.to_dict()))['periods'][3]['probability'] == 30
+
+def test_split_reports_files_tafs_apart_from_metars():
+    """Test that TAF blocks are joined into one report each and METAR lines are kept as before"""
+    reports = split_reports('\n'.join([KHIO, KHIO_TAF, KJFK, KJFK_TAF, '']))
+    assert reports['metar'] == {'KHIO': KHIO, 'KJFK': KJFK}
+    assert reports['taf']['KHIO'] == ' '.join(KHIO_TAF.split())
+    assert reports['taf']['KJFK'].startswith('TAF AMD KJFK') and reports['taf']['KJFK'].endswith('36005KT')
+    assert split_metars('\n'.join([KHIO, KHIO_TAF])) == {'KHIO': KHIO}
+
+@patch('app.upstream.get')
+def test_taf_lookup_also_refreshes_the_metar(mock_get):
+    """Test that a TAF miss fetches the METAR along in the same request, so /metar needs no second one"""
+    mock_get.return_value = upstream_response(200, '\n'.join([KHIO, KHIO_TAF]))
+    client = app.test_client()
+
+    taf_response = client.post('/taf', data={'station_id': 'khio', 'format': 'json'})
+    assert taf_response.status_code == 200
+    body = taf_response.get_json()
+    assert body['station_id'] == 'KHIO'
+    assert body['raw_taf'].startswith('TAF KHIO')
+    assert body['decoded']['periods'][1]['change'] == 'FM'
+    assert body['decoded_report'].startswith('Forecast for KHIO')
+    mock_get.assert_called_once_with("https://aviationweather.gov/api/data/metar?ids=KHIO&taf=true")
+
+    assert client.post('/metar', data={'station_id': 'KHIO'}).get_json()['raw_metar'] == KHIO
+    assert client.get('/taf/KHIO').status_code == 200
+    assert mock_get.call_count == 1
+
+    mock_get.return_value = upstream_response(200, KJFK)
+    missing = client.post('/taf', data={'station_id': 'KJFK'})
+    assert missing.status_code == 404
+    assert client.post('/taf', data={'station_id': 'K!'}).status_code == 404
+
+@patch('app.upstream.get')
+def test_bundled_products_ride_along_every_metar_poll(mock_get):
+    """Test that with TAF bundled one refresh of a station set fills both caches in one request"""
+    mock_get.return_value = upstream_response(200, '\n'.join([KHIO, KHIO_TAF, KJFK, KJFK_TAF]))
+    with patch('app.BUNDLED_PRODUCTS', ['taf']):
+        metars, errors = refresh_metars(['KHIO', 'KJFK'])
+    assert metars == {'KHIO': KHIO, 'KJFK': KJFK} and errors == {}
+    mock_get.assert_called_once_with("https://aviationweather.gov/api/data/metar?ids=KHIO,KJFK&taf=true")
+
+    batch = app.test_client().post('/taf/batch', json={'station_ids': ['KJFK', 'KHIO', 'bad!']})
+    assert sorted(batch.get_json()['results']) == ['KHIO', 'KJFK']
+    assert list(batch.get_json()['errors']) == ['BAD!']
+    assert mock_get.call_count == 1
+
+def test_async_taf_routes():
+    """Test that the ASGI app serves /taf/<station> and /taf/batch through the same fetch"""
+    async def call(application, method, path, body=b'', headers=()):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers)}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        return sent[0]['status'], json.loads(sent[1]['body'])
+
+    async def run():
+        application = MetarASGIApp()
+        service = application._ensure_service()
+        service.client.get = Mock(side_effect=lambda url, headers=None: asyncio.sleep(
+            0, result=UpstreamResponse(200, '\n'.join([KHIO, KHIO_TAF, KJFK]), {})))
+        try:
+            single = await call(application, 'GET', '/taf/KHIO')
+            batch = await call(application, 'POST', '/taf/batch', json.dumps({'station_ids': ['KHIO', 'KJFK']}).encode(),
+                               [(b'content-type', b'application/json')])
+        finally:
+            await service.client.aclose()
+        return single, batch, service.client.get.call_count
+
+    (status, body), (batch_status, batch), calls = asyncio.run(run())
+    assert status == 200
+    assert body['raw_taf'].startswith('TAF KHIO')
+    assert batch_status == 200
+    assert list(batch['results']) == ['KHIO']
+    assert batch['errors'] == {'KJFK': 'No TAF data found for KJFK'}
+    assert metar_cache.get('KHIO') == KHIO
+    assert calls == 2
@@ -0,0 +1,98 @@
+import sys
+import os
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+# Add the app and benchmarks directories to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from werkzeug.serving import make_server
+
+import app as app_module
+from bench_replay import (Request, generate_traffic, parse_traffic, record_line, replay, route_of, station_ids,
+                          summarize)
+from stub_upstream import StubUpstream
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, ''
+
+def test_parse_traffic_reads_json_access_log_and_bare_lines():
+    """Test the three recorded traffic formats and that other lines are skipped"""
+    lines = [
+        '{"method": "POST", "path": "/metar/batch", "json": {"station_ids": ["KHIO", "KJFK"]}}',
+        '{"method": "post", "path": "/metar", "form": {"station_id": "KHIO"}}',
+        '127.0.0.1 - - [14/Oct/2024:12:53:00 +0000] "GET /metar/KJFK?format=json HTTP/1.1" 200 512 "-" "curl"',
+        'GET /taf/KHIO',
+        '# comment',
+        'not a request',
+    ]
+    batch, single, logged, bare = parse_traffic(lines)
+    assert batch == Request('POST', '/metar/batch', b'{"station_ids": ["KHIO", "KJFK"]}', 'application/json')
+    assert single == Request('POST', '/metar', b'station_id=KHIO', 'application/x-www-form-urlencoded')
+    assert logged == Request('GET', '/metar/KJFK?format=json', None, None)
+    assert [route_of(request) for request in (batch, single, logged, bare)] == [
+        'POST /metar/batch', 'POST /metar', 'GET /metar/<station>', 'GET /taf/<station>']
+    assert list(parse_traffic([record_line(request) for request in (batch, single, logged)])) == [
+        batch, single, logged]
+
+def test_generated_traffic_favors_popular_stations():
+    """Test that generated traffic mixes the routes and asks for the first stations most"""
+    stations = station_ids(50)
+    assert len(set(stations)) == 50 and stations[0] == 'KHIO'
+    requests = generate_traffic(2000, stations, batch_share=0.1, get_share=0.3, seed=1)
+    routes = [route_of(request) for request in requests]
+    assert 100 < routes.count('POST /metar/batch') < 300
+    assert 450 < routes.count('GET /metar/<station>') < 750
+    assert generate_traffic(2000, stations, seed=1) == generate_traffic(2000, stations, seed=1)
+    gets = [request.path for request in requests if request.method == 'GET']
+    assert gets.count('/metar/KHIO') > gets.count(f'/metar/{stations[-1]}') * 5
+
+def test_stub_serves_corpus_with_injected_errors():
+    """Test corpus reports, TAFs on request, and that error_rate and jitter apply per request"""
+    stub = StubUpstream(latency=0.001, jitter=0.001, error_rate=0.5, seed=3, corpus=[KHIO]).start()
+    try:
+        answers = [fetch(f'{stub.url}/api/data/metar?ids=KHIO,KJFK&taf=true') for _ in range(40)]
+    finally:
+        stub.stop()
+    failed = [body for status, body in answers if status == 503]
+    served = [body for status, body in answers if status == 200]
+    assert len(failed) == stub.errors and 8 < stub.errors < 32
+    assert len(failed) + len(served) == 40 == stub.requests
+    lines = served[0].splitlines()
+    assert lines[0] == KHIO
+    assert any(line.startswith('TAF KHIO') for line in lines)
+    assert any('KJFK' in line.split()[:2] and not line.startswith('TAF') for line in lines)
+
+def test_replay_reports_latency_and_errors():
+    """Test an open-loop replay against the Flask app and a failing stub upstream"""
+    stub = StubUpstream(error_rate=1.0).start()
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    requests = [Request('GET', '/health', None, None), Request('GET', '/metar/KHIO', None, None)]
+    try:
+        with patch('app.METAR_API_URL', f'{stub.url}/api/data/metar'), patch('app.UPSTREAM_RATE_WAIT', 0), \
+                patch('app.upstream.retries', 0):
+            app_module.metar_cache.clear()
+            app_module.last_reports.clear()
+            results, elapsed = replay(f'http://127.0.0.1:{server.server_port}', requests, rps=200, duration=0.1)
+    finally:
+        server.shutdown()
+        stub.stop()
+        app_module.upstream_breaker.reset()
+
+    summary = summarize(results, elapsed)
+    assert summary['all']['requests'] == 20
+    assert summary['routes']['GET /metar/<station>']['error_rate'] == 1.0
+    assert summary['statuses']['404'] == 10
+    assert summary['all']['p50_ms'] <= summary['all']['p95_ms'] <= summary['all']['p99_ms']
+    assert summary['all']['throughput_rps'] > 0
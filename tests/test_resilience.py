@@ -0,0 +1,179 @@
+import pytest
+import sys
+import os
+import requests
+from unittest.mock import patch
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import (app, metar_cache, upstream_breaker, upstream_throttled, breaker_transitions, stale_served,
+                 health_status, upstream_permit)
+from metrics import UpstreamHealth
+from upstream import CircuitBreaker, TokenBucket, UpstreamUnavailable
+from helpers import FakeClock, upstream_response
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+KJFK = "METAR KJFK 141251Z 31010KT 10SM CLR 16/15 A3001"
+
+def test_token_bucket_sheds_past_the_burst_and_refills():
+    """Test that the bucket allows a burst, sheds beyond it and refills at the rate"""
+    clock = FakeClock(1000.0)
+    bucket = TokenBucket(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+
+    assert [bucket.acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.throttled == 1
+    clock.now += 0.5
+    assert bucket.acquire()
+    assert not bucket.acquire()
+    assert bucket.acquire(wait=0.5)
+    assert clock.now == pytest.approx(1001.0)
+    assert not bucket.acquire(wait=0.1)
+    assert TokenBucket(rate=0, burst=1).acquire() and TokenBucket(rate=0, burst=1).acquire()
+
+def test_circuit_breaker_opens_probes_and_closes():
+    """Test the closed, open, half-open cycle and the transitions it reports"""
+    clock = FakeClock(1000.0)
+    transitions = []
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, on_transition=transitions.append, clock=clock)
+
+    for failed in (True, True, False, True, True):
+        assert breaker.allow()
+        breaker.record(failed)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot() == {'state': 'open', 'failures': 3, 'retry_in': 30}
+
+    clock.now += 30
+    probe = breaker.allow()
+    assert probe == CircuitBreaker.PROBE
+    assert not breaker.allow()
+    breaker.record(True, probe)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    probe = breaker.allow()
+    assert probe == CircuitBreaker.PROBE
+    breaker.record(False, probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert transitions == ['open', 'half_open', 'open', 'half_open', 'closed']
+
+def test_stragglers_do_not_end_the_probe():
+    """Test that requests allowed while closed do not let a second probe start while the first is in flight"""
+    clock = FakeClock(1000.0)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    stragglers = [breaker.allow(), breaker.allow()]
+    assert stragglers == [True, True]
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    probe = breaker.allow()
+    assert probe == CircuitBreaker.PROBE
+    # One straggler is shed by the rate limit, the other fails and reopens the breaker
+    breaker.release(stragglers[0])
+    assert not breaker.allow()
+    breaker.record(True, stragglers[1])
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 30
+    assert not breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.record(False, probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@patch('app.upstream.get')
+def test_open_breaker_stops_upstream_requests(mock_get):
+    """Test that failures open the breaker and later lookups do not reach the upstream"""
+    mock_get.return_value = upstream_response(503)
+    opened = breaker_transitions.value(state='open')
+    refused = upstream_throttled.value(reason='circuit_open')
+    client = app.test_client()
+
+    for _ in range(upstream_breaker.failure_threshold):
+        client.post('/metar', data={'station_id': 'KHIO'})
+    calls = mock_get.call_count
+    assert upstream_breaker.state == CircuitBreaker.OPEN
+    assert breaker_transitions.value(state='open') == opened + 1
+
+    assert client.post('/metar', data={'station_id': 'KJFK'}).status_code == 404
+    assert mock_get.call_count == calls
+    assert upstream_throttled.value(reason='circuit_open') == refused + 1
+    with pytest.raises(UpstreamUnavailable):
+        upstream_permit()
+
+    # Nothing was ever fetched, so there is nothing stale to serve either
+    body, status = health_status()
+    assert status == 503
+    assert body['status'] == 'unhealthy'
+    assert body['upstream']['breaker']['state'] == 'open'
+
+def test_health_unhealthy_while_the_breaker_is_open_with_no_reports():
+    """Test that an open breaker with no report to serve stale makes /health answer 503"""
+    with patch('app.upstream_health', UpstreamHealth()):
+        for _ in range(upstream_breaker.failure_threshold):
+            upstream_breaker.record(True)
+        assert upstream_breaker.state == CircuitBreaker.OPEN
+        health = app.test_client().get('/health')
+
+    assert health.status_code == 503
+    assert health.get_json()['status'] == 'unhealthy'
+    assert health.get_json()['upstream']['breaker']['state'] == 'open'
+
+@patch('app.upstream.get')
+def test_health_stays_up_while_the_breaker_is_open(mock_get):
+    """Test that an upstream outage leaves /health at 200 degraded while /metar serves stale reports"""
+    mock_get.return_value = upstream_response(200, KHIO)
+    client = app.test_client()
+    with patch('app.upstream_health', UpstreamHealth()):
+        assert client.post('/metar', data={'station_id': 'KHIO'}).status_code == 200
+        metar_cache.clear()
+        mock_get.side_effect = requests.ConnectionError('down')
+        for _ in range(upstream_breaker.failure_threshold + 1):
+            single = client.post('/metar', data={'station_id': 'KHIO'})
+        assert upstream_breaker.state == CircuitBreaker.OPEN
+        assert single.status_code == 200 and single.get_json()['stale'] is True
+
+        health = client.get('/health')
+        assert health.status_code == 200
+        assert health.get_json()['status'] == 'degraded'
+        assert health.get_json()['upstream']['reachable'] is False
+        assert health.get_json()['upstream']['breaker']['state'] == 'open'
+
+@patch('app.upstream.get')
+def test_stale_reports_served_while_upstream_is_down(mock_get):
+    """Test that /metar and /metar/batch fall back to the last known report, flagged stale"""
+    mock_get.return_value = upstream_response(200, KHIO)
+    client = app.test_client()
+    assert 'stale' not in client.post('/metar', data={'station_id': 'KHIO'}).get_json()
+
+    metar_cache.clear()
+    mock_get.return_value = upstream_response(503)
+    served = stale_served.value()
+    single = client.post('/metar', data={'station_id': 'KHIO'})
+    batch = client.post('/metar/batch', json={'station_ids': ['KHIO', 'KJFK']})
+
+    assert single.status_code == 200
+    assert single.get_json()['stale'] is True
+    assert single.get_json()['raw_metar'] == KHIO
+    assert batch.get_json()['results']['KHIO']['stale'] is True
+    assert list(batch.get_json()['errors']) == ['KJFK']
+    assert stale_served.value() == served + 2
+
+@patch('app.upstream.get')
+def test_rate_limited_requests_are_shed(mock_get):
+    """Test that lookups past the upstream rate limit fail fast without a request"""
+    mock_get.return_value = upstream_response(200, KHIO)
+    clock = FakeClock(1000.0)
+    limiter = TokenBucket(rate=1, burst=1, clock=clock, sleep=clock.sleep)
+    shed = upstream_throttled.value(reason='rate_limit')
+    with patch('app.upstream_limiter', limiter), patch('app.UPSTREAM_RATE_WAIT', 0):
+        client = app.test_client()
+        assert client.post('/metar', data={'station_id': 'KHIO'}).status_code == 200
+        assert client.post('/metar', data={'station_id': 'KJFK'}).status_code == 404
+
+    assert mock_get.call_count == 1
+    assert upstream_throttled.value(reason='rate_limit') == shed + 1
+    assert upstream_breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,95 @@
+import pytest
+import sys
+import os
+import runpy
+import signal
+import time
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, serving, stream_hub, preload, drain, parse_sky, parse_weather, parse_metar, PROCESS_STARTED
+from store import ObservationStore
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+
+@pytest.fixture(autouse=True)
+def reset_serving():
+    """Start every test with a fresh serving state"""
+    saved = dict(serving)
+    serving.update(preload_seconds=None, first_metar_seconds=None, draining=False)
+    yield
+    serving.update(saved)
+
+def test_preload_warms_decode_tables():
+    """Test that preload fills the group caches before any request"""
+    parse_sky.cache_clear()
+    parse_weather.cache_clear()
+    seconds = preload()
+
+    assert seconds == serving['preload_seconds'] > 0
+    assert parse_sky.cache_info().currsize > 300
+    assert parse_weather.cache_info().currsize > 50
+    parse_sky('BKN030')
+    assert parse_sky.cache_info().hits >= 1
+    assert 'metar_preload_seconds' in app.test_client().get('/metrics').get_data(as_text=True)
+
+@patch('app.upstream.get')
+def test_first_metar_records_cold_start(mock_get):
+    """Test that the first served /metar records the time since process start, once"""
+    response = Mock()
+    response.status_code = 200
+    response.text = KHIO
+    response.headers = {}
+    mock_get.return_value = response
+    client = app.test_client()
+
+    assert PROCESS_STARTED <= time.time()
+    client.post('/metar', data={'station_id': 'KHIO'})
+    first = serving['first_metar_seconds']
+    assert 0 < first <= time.time() - PROCESS_STARTED
+    client.post('/metar', data={'station_id': 'KHIO'})
+    assert serving['first_metar_seconds'] == first
+    assert f'metar_cold_start_seconds {first}' in client.get('/metrics').get_data(as_text=True)
+
+def test_drain_fails_health_and_ends_streams():
+    """Test that draining turns /health to 503, closes streams and refuses new ones"""
+    subscription = stream_hub.subscribe(['KHIO'])
+    client = app.test_client()
+
+    drain()
+    assert subscription.closed
+    response = client.get('/health')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'draining'
+    assert client.get('/metar/stream?station_ids=KHIO').status_code == 503
+
+def test_store_reopen_starts_new_writer(tmp_path):
+    """Test that a reopened store (as in a forked worker) keeps writing and reading"""
+    store = ObservationStore(str(tmp_path / 'history.db'), parse_metar)
+    first_writer = store._writer
+    store.reopen()
+    assert store._writer is not first_writer and store._writer.is_alive()
+
+    store.append(KHIO, fetched_at=time.time())
+    store.flush()
+    assert store.latest('KHIO')[1] == KHIO
+    store.close()
+
+def test_gunicorn_config_drains_on_sigterm():
+    """Test the gunicorn settings and that SIGTERM drains before gunicorn's own exit"""
+    config = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    assert config['preload_app'] is True
+    assert config['worker_class'] == 'gthread'
+
+    worker = Mock()
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        config['post_worker_init'](worker)
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    assert serving['draining']
+    worker.handle_exit.assert_called_once_with(signal.SIGTERM, None)
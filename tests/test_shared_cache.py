@@ -0,0 +1,184 @@
+import pytest
+import sys
+import os
+import multiprocessing
+import threading
+import time
+from unittest.mock import patch
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+from app import metar_cache, last_reports, get_metar_cached, get_metars_cached, prefetcher, stream_hub
+from shared_cache import (CacheBackendError, CacheServer, MemoryBackend, RedisBackend, SQLiteBackend,
+                          open_backend, register_backend, BACKENDS)
+from helpers import FakeClock, upstream_response
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+KJFK = "METAR KJFK 141251Z 31010KT 10SM CLR 16/15 A3001"
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def backend(request, tmp_path):
+    """Each backend on a fake clock; redis runs against the local stand-in server"""
+    clock = FakeClock(1000.0)
+    if request.param == 'memory':
+        yield MemoryBackend(clock=clock)
+    elif request.param == 'sqlite':
+        backend = SQLiteBackend(str(tmp_path / 'cache.db'), clock=clock)
+        yield backend
+        backend.close()
+    else:
+        server = CacheServer(clock=clock).start()
+        backend = RedisBackend(*server.server_address, clock=clock)
+        yield backend
+        backend.close()
+        server.stop()
+
+def test_backend_entries_expire_with_time_left(backend):
+    """Test that entries come back with their remaining ttl and expire"""
+    backend.set_many({'KHIO': KHIO, 'KJFK': 'odd|value'}, ttl=300)
+    backend.clock.now += 100
+
+    assert backend.get_many(['KHIO', 'KJFK', 'KLAX']) == {'KHIO': (KHIO, 200), 'KJFK': ('odd|value', 200)}
+    backend.clock.now += 200
+    assert backend.get('KHIO') is None
+    assert backend.stats()['hits'] == 2
+    assert backend.stats()['misses'] == 2
+
+def test_backend_lease_is_exclusive_and_expires(backend):
+    """Test that one holder gets a key's lease until release or expiry"""
+    with backend.lock('KHIO', lease=30) as acquired:
+        assert acquired
+        with backend.lock('KHIO', wait=0) as again:
+            assert not again
+    with backend.lock('KHIO', lease=30) as acquired:
+        assert acquired
+        backend.clock.now += 31
+        with backend.lock('KHIO', wait=0) as taken_over:
+            assert taken_over
+    assert backend.stats()['lock_timeouts'] == 1
+
+def single_flight_worker(path, fetches, results):
+    """One worker: read the station, or take the lease and fetch it once"""
+    backend = SQLiteBackend(path)
+    cached = backend.get('KHIO')
+    if cached is None:
+        with backend.lock('KHIO', lease=10, wait=10):
+            cached = backend.get('KHIO')
+            if cached is None:
+                with fetches.get_lock():
+                    fetches.value += 1
+                time.sleep(0.2)
+                backend.set('KHIO', KHIO, 300)
+                cached = (KHIO, 300)
+    results.put(cached[0])
+
+def test_sqlite_single_flight_across_processes(tmp_path):
+    """Test that worker processes sharing the file fetch a station once"""
+    context = multiprocessing.get_context('fork')
+    fetches = context.Value('i', 0)
+    results = context.Queue()
+    path = str(tmp_path / 'cache.db')
+    SQLiteBackend(path).clear()
+    workers = [context.Process(target=single_flight_worker, args=(path, fetches, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    assert [results.get(timeout=5) for _ in workers] == [KHIO] * 4
+    assert fetches.value == 1
+
+@patch('app.upstream.get')
+def test_workers_share_fetched_reports(mock_get):
+    """Test that a report fetched by one worker serves another from the shared cache"""
+    mock_get.return_value = upstream_response(200, KHIO)
+    with patch('app.shared_cache', MemoryBackend()) as shared:
+        assert get_metar_cached('KHIO') == KHIO
+        metar_cache.clear()
+        shared.clock = lambda: time.time() + 100
+
+        assert get_metar_cached('KHIO') == KHIO
+        assert mock_get.call_count == 1
+        assert metar_cache._entries['KHIO'][0] - metar_cache.clock() <= metar_cache.ttl - 99
+
+@patch('app.upstream.get')
+def test_batch_reads_and_writes_shared_cache(mock_get):
+    """Test that batch lookups take shared entries and publish what they fetch"""
+    mock_get.return_value = upstream_response(200, KJFK)
+    with patch('app.shared_cache', MemoryBackend()) as shared:
+        shared.set('KHIO', KHIO, 300)
+        metars, errors = get_metars_cached(['KHIO', 'KJFK'])
+
+    assert metars == {'KHIO': KHIO, 'KJFK': KJFK}
+    assert errors == {}
+    mock_get.assert_called_once()
+    assert 'ids=KJFK' in mock_get.call_args[0][0]
+    assert shared.get('KJFK')[0] == KJFK
+
+@patch('app.upstream.get')
+def test_background_refreshes_run_once_across_workers(mock_get):
+    """Test that prefetch and stream refreshes read what another worker just refreshed"""
+    mock_get.return_value = upstream_response(200, '\n'.join([KHIO, KJFK]))
+    with patch('app.shared_cache', MemoryBackend()) as shared:
+        assert prefetcher.refresh(['KHIO', 'KJFK']) == ({'KHIO': KHIO, 'KJFK': KJFK}, {})
+        assert mock_get.call_count == 1
+
+        # Another worker: its own caches are empty, the shared tier is not
+        metar_cache.clear()
+        last_reports.clear()
+        assert prefetcher.refresh(['KHIO', 'KJFK']) == ({'KHIO': KHIO, 'KJFK': KJFK}, {})
+        assert stream_hub.refresh(['KHIO']) == ({'KHIO': KHIO}, {})
+        assert mock_get.call_count == 1
+        assert metar_cache.get('KHIO') == KHIO and last_reports.get('KHIO') == KHIO
+
+        # Within the prefetch lead the entry is due, so it is fetched again
+        shared.clock = lambda: time.time() + metar_cache.ttl - prefetcher.lead + 1
+        prefetcher.refresh(['KHIO', 'KJFK'])
+        assert mock_get.call_count == 2
+
+        # A worker waiting on the lease reads the holder's result instead of fetching
+        shared.clear()
+        results = []
+        with shared.lock(app_module.REFRESH_LEASE_KEY):
+            waiter = threading.Thread(target=lambda: results.append(prefetcher.refresh(['KHIO'])))
+            waiter.start()
+            time.sleep(0.05)
+            shared.set('KHIO', KHIO, metar_cache.ttl)
+        waiter.join(5)
+        assert results == [({'KHIO': KHIO}, {})]
+        assert mock_get.call_count == 2
+
+@patch('app.upstream.get')
+def test_unreachable_shared_cache_falls_back_to_upstream(mock_get):
+    """Test that a shared cache that is down only costs a direct fetch"""
+    mock_get.return_value = upstream_response(200, KHIO)
+    server = CacheServer().start()
+    address = server.server_address
+    server.stop()
+
+    with patch('app.shared_cache', RedisBackend(*address, timeout=0.2)) as shared:
+        assert get_metar_cached('KHIO') == KHIO
+        metars, errors = get_metars_cached(['KJFK'])
+    assert mock_get.call_count == 2
+    assert shared.errors >= 2
+    with pytest.raises(CacheBackendError):
+        shared.get('KHIO')
+
+def test_open_backend_by_url(tmp_path):
+    """Test building backends from METAR_SHARED_CACHE URLs, including plugged-in ones"""
+    assert open_backend('') is None
+    sqlite = open_backend(f'sqlite://{tmp_path}/cache.db')
+    assert isinstance(sqlite, SQLiteBackend) and sqlite.path == f'{tmp_path}/cache.db'
+    redis = open_backend('redis://cache.internal:6380/2')
+    assert (redis.host, redis.port, redis.db) == ('cache.internal', 6380, 2)
+    assert isinstance(open_backend('memory:'), MemoryBackend)
+
+    with pytest.raises(ValueError):
+        open_backend('memcached://cache:11211')
+    register_backend('custom', lambda url: MemoryBackend())
+    try:
+        assert isinstance(open_backend('custom://anything'), MemoryBackend)
+    finally:
+        del BACKENDS['custom']
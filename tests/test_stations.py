@@ -0,0 +1,108 @@
+import pytest
+import sys
+import os
+import gzip
+import json
+import math
+import random
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, stations_rejected
+from stations import EARTH_RADIUS_KM, StationCatalog, load_catalog, valid_station_id
+from helpers import metar_for
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def upstream_answering(*station_ids):
+    response = Mock()
+    response.status_code = 200
+    response.text = '\n'.join(metar_for(station_id) for station_id in station_ids)
+    response.headers = {}
+    return response
+
+def test_catalog_lookup_and_id_format():
+    """Test ID lookups against the bundled catalog and the ICAO format check"""
+    catalog = load_catalog()
+    assert 'KHIO' in catalog
+    assert 'ZZZZ' not in catalog
+    assert catalog.get('KHIO').name == 'Hillsboro Airport'
+    assert catalog.get('ZZZZ') is None
+    assert valid_station_id('KHIO') and valid_station_id('K1V4')
+    assert not valid_station_id('KHI') and not valid_station_id('1HIO') and not valid_station_id('KHIOX')
+
+def test_nearest_and_within_match_brute_force():
+    """Test k-nearest and radius searches against a full scan, across the poles and antimeridian"""
+    rng = random.Random(7)
+    rows = [(f'S{index:03d}', rng.uniform(-90, 90), rng.uniform(-180, 180), '') for index in range(1000)]
+    rows += [('NPOL', 89.9, 10, ''), ('EDGE', 0, 179.9, ''), ('WRAP', 0, -179.9, '')]
+    catalog = StationCatalog(rows)
+
+    for lat, lon in [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(50)] + [(90, 0), (0, 180)]:
+        by_distance = sorted((haversine_km(lat, lon, row[1], row[2]), row[0]) for row in rows)
+        nearest = catalog.nearest(lat, lon, k=5)
+        assert [station.station_id for station, _ in nearest] == [station_id for _, station_id in by_distance[:5]]
+        assert [km for _, km in nearest] == pytest.approx([km for km, _ in by_distance[:5]])
+        within = catalog.within(lat, lon, radius_km=1500)
+        assert [station.station_id for station, _ in within] == [
+            station_id for km, station_id in by_distance if km <= 1500]
+    assert [station.station_id for station, _ in catalog.nearest(0, 180, k=2)] == ['EDGE', 'WRAP']
+
+def test_load_aviationweather_station_list(tmp_path):
+    """Test loading the gzipped JSON station list with its own field names"""
+    path = str(tmp_path / 'stations.cache.json.gz')
+    with gzip.open(path, 'wt') as f:
+        json.dump([{'icaoId': 'KHIO', 'lat': 45.5404, 'lon': -122.9498, 'site': 'Portland/Hillsboro'},
+                   {'icaoId': '', 'lat': 1, 'lon': 1, 'site': 'No ICAO ID'}], f)
+    catalog = load_catalog(path)
+
+    assert len(catalog) == 1
+    assert catalog.get('KHIO').name == 'Portland/Hillsboro'
+
+@patch('app.upstream.get')
+def test_bad_station_ids_rejected_without_upstream(mock_get):
+    """Test that malformed IDs, and unknown ones in catalog mode, never reach the upstream"""
+    mock_get.return_value = upstream_answering('KHIO')
+    rejected = stations_rejected.value()
+    client = app.test_client()
+
+    assert client.post('/metar', data={'station_id': 'KH!O'}).status_code == 404
+    response = client.post('/metar/batch', json={'station_ids': ['KHIO', 'NOT-A-STATION']})
+    assert set(response.get_json()['results']) == {'KHIO'}
+    assert response.get_json()['errors'] == {'NOT-A-STATION': 'NOT-A-STATION is not an ICAO station ID'}
+    with patch('app.STATION_VALIDATION', 'catalog'):
+        response = client.post('/metar', data={'station_id': 'ZZZZ'})
+    assert response.get_json() == {'error': 'Unknown station ID ZZZZ'}
+
+    assert mock_get.call_count == 1
+    assert 'ids=KHIO' in mock_get.call_args[0][0]
+    assert stations_rejected.value() == rejected + 3
+
+@patch('app.upstream.get')
+def test_nearby_route_fetches_closest_stations_in_one_batch(mock_get):
+    """Test that /metar/nearby resolves a position or station and fetches the stations as a batch"""
+    mock_get.return_value = upstream_answering('KPDX', 'KVUO', 'KHIO', 'KSPB')
+    client = app.test_client()
+
+    data = client.get('/metar/nearby?lat=45.52&lon=-122.68&k=3').get_json()
+    assert [station['station_id'] for station in data['stations']] == ['KPDX', 'KVUO', 'KHIO']
+    assert data['stations'][0]['distance_km'] == pytest.approx(10.0, abs=0.5)
+    assert set(data['results']) == {'KPDX', 'KVUO', 'KHIO'}
+    mock_get.assert_called_once()
+
+    data = client.get('/metar/nearby?station_id=khio&radius=30').get_json()
+    assert [station['station_id'] for station in data['stations']] == ['KHIO', 'KVUO', 'KSPB', 'KPDX']
+    assert mock_get.call_count == 2
+    assert mock_get.call_args[0][0].endswith('ids=KSPB')
+
+def test_nearby_route_rejects_bad_queries():
+    """Test the 400 answers for missing, out-of-range and unknown centers"""
+    client = app.test_client()
+    for query in ('', 'lat=45', 'lat=95&lon=0', 'lat=45&lon=-122&k=0', 'lat=45&lon=-122&radius=-1',
+                  'lat=north&lon=west', 'station_id=ZZZZ'):
+        assert client.get(f'/metar/nearby?{query}').status_code == 400, query
@@ -0,0 +1,136 @@
+import pytest
+import sys
+import os
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from store import ObservationStore, observation_time
+from app import app, metar_cache, metar_history, parse_metar, warm_cache
+
+# 2024-03-14 13:00 UTC
+NOW = datetime(2024, 3, 14, 13, 0, tzinfo=timezone.utc).timestamp()
+
+def metar_at(station_id, ddhhmm):
+    return f"METAR {station_id} {ddhhmm}Z 18005KT 10SM CLR 16/15 A2987"
+
+@pytest.fixture
+def store(tmp_path):
+    """A store in a temporary file, closed after the test"""
+    store = ObservationStore(str(tmp_path / 'history.db'), parse_metar)
+    yield store
+    store.close()
+
+def test_observation_time_infers_month_and_year():
+    """Test that DDHHMM times resolve to the latest matching time"""
+    reference = datetime(2024, 3, 14, 13, 0, tzinfo=timezone.utc)
+    assert observation_time('14', '1253', reference) == datetime(2024, 3, 14, 12, 53, tzinfo=timezone.utc)
+    # Within the allowed clock skew
+    assert observation_time('14', '1345', reference) == datetime(2024, 3, 14, 13, 45, tzinfo=timezone.utc)
+    assert observation_time('29', '2350', reference) == datetime(2024, 2, 29, 23, 50, tzinfo=timezone.utc)
+    assert observation_time('31', '2350', reference) == datetime(2024, 1, 31, 23, 50, tzinfo=timezone.utc)
+    new_year = datetime(2024, 1, 1, 0, 5, tzinfo=timezone.utc)
+    assert observation_time('31', '2355', new_year) == datetime(2023, 12, 31, 23, 55, tzinfo=timezone.utc)
+    assert observation_time('Un', 'know', reference) is None
+
+def test_append_latest_and_history(store):
+    """Test that appended reports are indexed by station and observation time"""
+    for ddhhmm in ('141053', '141153', '141253'):
+        store.append(metar_at('KHIO', ddhhmm), fetched_at=NOW)
+    store.append(metar_at('KJFK', '141251'), fetched_at=NOW)
+    store.append("garbage", fetched_at=NOW)
+    store.flush()
+
+    observed_at, raw = store.latest('KHIO')
+    assert raw == metar_at('KHIO', '141253')
+    assert observed_at == datetime(2024, 3, 14, 12, 53, tzinfo=timezone.utc).timestamp()
+
+    rows = store.history('KHIO', NOW - 2 * 3600, NOW, limit=10)
+    assert [raw for _, raw in rows] == [metar_at('KHIO', '141253'), metar_at('KHIO', '141153')]
+    assert len(store.history('KHIO', 0, NOW, limit=1)) == 1
+    assert store.latest('XXXX') is None
+    assert store.stats()['written'] == 4
+    assert store.stats()['skipped'] == 1
+
+def test_refetched_report_is_stored_once(store):
+    """Test that fetching the same observation again only updates fetched_at"""
+    store.append(metar_at('KHIO', '141253'), fetched_at=NOW)
+    store.append(metar_at('KHIO', '141253'), fetched_at=NOW + 60)
+    store.flush()
+
+    assert len(store.history('KHIO', 0, NOW, limit=10)) == 1
+    assert store.recent(NOW + 30) == [('KHIO', metar_at('KHIO', '141253'), NOW + 60)]
+
+def test_store_survives_restart(tmp_path):
+    """Test that reports are read back after reopening the file"""
+    path = str(tmp_path / 'history.db')
+    store = ObservationStore(path, parse_metar)
+    store.append(metar_at('KHIO', '141253'), fetched_at=NOW)
+    store.close()
+
+    reopened = ObservationStore(path, parse_metar)
+    try:
+        assert reopened.latest('KHIO')[1] == metar_at('KHIO', '141253')
+    finally:
+        reopened.close()
+
+def test_warm_cache_loads_recent_reports(store):
+    """Test that startup warming caches only reports fetched within the TTL"""
+    now = time.time()
+    store.append("METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987", fetched_at=now - 10)
+    store.append("METAR KJFK 141251Z 31010KT 10SM CLR 16/15 A3001", fetched_at=now - metar_cache.ttl - 10)
+    store.flush()
+
+    with patch('app.history_store', store):
+        assert warm_cache() == 1
+    assert metar_cache.get('KHIO') == "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+    assert metar_cache.get('KJFK') is None
+
+@patch('app.upstream.get')
+def test_history_endpoint(mock_get, store):
+    """Test that fetched reports are recorded and served by /metar/history"""
+    observed = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    metar_text = metar_at('KHIO', observed.strftime('%d%H%M'))
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.text = metar_text
+    mock_get.return_value = mock_response
+    client = app.test_client()
+
+    with patch('app.history_store', store):
+        client.post('/metar', data={'station_id': 'KHIO'})
+        store.flush()
+        response = client.get('/metar/history?station_id=khio&format=json')
+        empty = client.get('/metar/history', query_string={
+            'station_id': 'KHIO', 'start': '2001-01-01T00:00Z', 'end': '2001-01-02T00:00Z'})
+        invalid = client.get('/metar/history?station_id=KHIO&limit=many')
+
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['station_id'] == 'KHIO'
+    assert data['observations'][0]['raw_metar'] == metar_text
+    assert data['observations'][0]['observed_at'] == observed.isoformat()
+    assert data['observations'][0]['decoded']['wind_speed'] == 5
+    assert empty.get_json()['observations'] == []
+    assert invalid.status_code == 400
+
+def test_history_endpoint_disabled():
+    """Test that /metar/history reports when no store is configured"""
+    with patch('app.history_store', None):
+        response = app.test_client().get('/metar/history?station_id=KHIO')
+    assert response.status_code == 404
+
+def test_history_endpoint_rejects_bad_limits(store):
+    """Test that limits below one or of the wrong type are a 400, not unbounded or a 500"""
+    client = app.test_client()
+    with patch('app.history_store', store):
+        for limit in ('-1', '0', 'many'):
+            response = client.get('/metar/history', query_string={'station_id': 'KHIO', 'limit': limit})
+            assert response.status_code == 400
+        # JSON bodies on the ASGI app can carry any type
+        for limit in (None, [10], {'n': 10}):
+            assert metar_history({'station_id': 'KHIO', 'limit': limit})[1] == 400
+        assert metar_history({'station_id': 'KHIO', 'start': [0]})[1] == 400
@@ -0,0 +1,151 @@
+import pytest
+import sys
+import os
+import asyncio
+import json
+from unittest.mock import patch, Mock
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, metar_cache, publish_changes, stream_hub
+from asgi import MetarASGIApp
+from stream import StreamHub, Subscription
+from helpers import upstream_response
+
+KHIO = "METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+KHIO_NEXT = "METAR KHIO 141353Z 18006KT 10SM CLR 17/15 A2987"
+
+def parse_events(chunk):
+    """Return (event, data) pairs of a server-sent events chunk, skipping comments"""
+    events = []
+    for message in chunk.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+        if fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+@pytest.fixture(autouse=True)
+def unsubscribe_streams():
+    """End every test with no stream subscribers"""
+    yield
+    for subscription in list(stream_hub._subscribers):
+        stream_hub.unsubscribe(subscription)
+
+def test_subscription_keeps_newest_report_per_station():
+    """Test that a slow subscriber gets the latest report per station, bounded"""
+    subscription = Subscription(['KHIO', 'KJFK', 'KLAX'], maxsize=2)
+    subscription.put('KHIO', 'old')
+    subscription.put('KHIO', 'new')
+    subscription.put('KJFK', 'jfk')
+    subscription.put('KLAX', 'lax')
+
+    assert subscription.get(0) == [('KJFK', 'jfk'), ('KLAX', 'lax')]
+    assert subscription.dropped == 2
+    assert subscription.get(0) == []
+
+def test_hub_fans_out_to_matching_subscribers():
+    """Test that reports only reach the subscribers following their station"""
+    hub = StreamHub(refresh=Mock(), interval=3600)
+    khio = hub.subscribe(['KHIO'])
+    both = hub.subscribe(['KHIO', 'KJFK'])
+    hub.publish({'KJFK': 'jfk'})
+    hub.publish({'KHIO': 'hio'})
+
+    assert khio.get(0) == [('KHIO', 'hio')]
+    assert both.get(0) == [('KJFK', 'jfk'), ('KHIO', 'hio')]
+    assert hub.published == 3
+    hub.stop()
+
+def test_hub_polls_union_of_stations_once():
+    """Test that one refresh covers every subscriber and follows unsubscribes"""
+    refresh = Mock(return_value=({}, {}))
+    hub = StreamHub(refresh=refresh, interval=3600, max_subscribers=2)
+    first = hub.subscribe(['KJFK', 'KHIO'])
+    second = hub.subscribe(['KHIO'])
+    assert hub.subscribe(['KLAX']) is None
+
+    hub.poll_once()
+    refresh.assert_called_once_with(['KHIO', 'KJFK'])
+
+    hub.unsubscribe(first)
+    assert hub.stations() == ['KHIO']
+    assert first.closed
+    hub.unsubscribe(second)
+    refresh.reset_mock()
+    hub.poll_once()
+    refresh.assert_not_called()
+    hub.stop()
+
+@patch('app.upstream.get')
+def test_stream_endpoint_shares_one_fetch(mock_get):
+    """Test that N streams share one upstream fetch and all get each new report"""
+    mock_get.return_value = upstream_response(200, KHIO)
+    client = app.test_client()
+
+    with patch('app.STREAM_HEARTBEAT', 0.01):
+        responses = [client.get('/metar/stream?station_ids=khio', buffered=False) for _ in range(3)]
+        streams = [iter(response.response) for response in responses]
+        for stream in streams:
+            (event, data), = parse_events(next(stream).decode())
+            assert event == 'metar'
+            assert data['station_id'] == 'KHIO'
+            assert data['raw_metar'] == KHIO
+        assert mock_get.call_count == 1
+        assert stream_hub.state()['subscribers'] == 3
+
+        mock_get.return_value = upstream_response(200, KHIO_NEXT)
+        stream_hub.poll_once()
+        assert mock_get.call_count == 2
+        for stream in streams:
+            assert [data['raw_metar'] for _, data in parse_events(next(stream).decode())] == [KHIO_NEXT]
+
+        for response in responses:
+            response.close()
+    assert stream_hub.state()['subscribers'] == 0
+    assert responses[0].mimetype == 'text/event-stream'
+
+def test_stream_endpoint_validation():
+    """Test that streams need stations and respect the subscriber limit"""
+    client = app.test_client()
+    assert client.get('/metar/stream').status_code == 400
+    with patch.object(stream_hub, 'max_subscribers', 0):
+        response = client.get('/metar/stream?station_ids=KHIO')
+    assert response.status_code == 503
+
+def test_async_stream_until_disconnect():
+    """Test that the ASGI stream sends the cached report, updates, then unsubscribes"""
+    metar_cache.set('KHIO', KHIO)
+
+    async def run():
+        disconnect = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        chunks = asyncio.Queue()
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            await chunks.put(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/metar/stream',
+                 'query_string': b'station_ids=KHIO&format=json', 'headers': []}
+        task = asyncio.ensure_future(MetarASGIApp()(scope, receive, send))
+        start = await chunks.get()
+        first = await chunks.get()
+        publish_changes({'KHIO': KHIO_NEXT})
+        second = await asyncio.wait_for(chunks.get(), 5)
+        disconnect.set()
+        await asyncio.wait_for(task, 5)
+        return start, first, second
+
+    with patch('app.STREAM_HEARTBEAT', 5):
+        start, first, second = asyncio.run(run())
+    assert start['status'] == 200
+    assert dict(start['headers'])[b'content-type'] == b'text/event-stream'
+    assert parse_events(first['body'].decode())[0][1]['decoded']['wind_speed'] == 5
+    assert parse_events(second['body'].decode())[0][1]['raw_metar'] == KHIO_NEXT
+    assert stream_hub.state()['subscribers'] == 0
@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from upstream import UpstreamClient
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers with the next status code from the server's script"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.server.requests += 1
+        body = b"METAR KHIO 141253Z 18005KT 10SM CLR 16/15 A2987"
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, statuses):
+        super().__init__(('127.0.0.1', 0), ScriptedHandler)
+        self.statuses = list(statuses)
+        self.requests = 0
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def start(statuses=()):
+        server = CountingServer(statuses)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/api/data/metar?ids=KHIO"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_client_applies_default_timeouts():
+    """Test that every request carries the configured connect/read timeouts"""
+    client = UpstreamClient(connect_timeout=1.5, read_timeout=4)
+    with patch.object(client.session, 'get') as mock_get:
+        client.get("https://example.invalid/")
+    mock_get.assert_called_once_with("https://example.invalid/", timeout=(1.5, 4))
+
+def test_client_accepts_gzip():
+    """Test that the session advertises compressed responses"""
+    client = UpstreamClient()
+    assert 'gzip' in client.session.headers['Accept-Encoding']
+
+def test_client_reuses_connections(make_server):
+    """Test that sequential requests share one keep-alive connection"""
+    server, url = make_server()
+    client = UpstreamClient()
+    for _ in range(5):
+        assert client.get(url).status_code == 200
+    client.close()
+
+    assert server.requests == 5
+    assert server.connections == 1
+
+def test_client_retries_server_errors(make_server):
+    """Test that 5xx responses are retried with backoff"""
+    server, url = make_server(statuses=[503, 502])
+    client = UpstreamClient(retries=2, backoff=0)
+    response = client.get(url)
+    client.close()
+
+    assert response.status_code == 200
+    assert server.requests == 3
+
+def test_client_returns_last_error_when_retries_run_out(make_server):
+    """Test that the final 5xx response is returned once retries are spent"""
+    server, url = make_server(statuses=[500, 500, 500])
+    client = UpstreamClient(retries=1, backoff=0)
+    response = client.get(url)
+    client.close()
+
+    assert response.status_code == 500
+    assert server.requests == 2
@@ -0,0 +1,180 @@
+"""Pooled HTTP client for upstream weather data requests, and the guards around it."""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client with timeouts and retries on server errors.
+
+    One requests.Session is shared by all callers, so connections to the
+    upstream host are pooled and reused instead of paying a TCP and TLS
+    handshake per request. 5xx responses are retried with exponential
+    backoff before being returned to the caller.
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, pool_size=10,
+                 retries=2, backoff=0.3):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, **kwargs):
+        """Send a GET request through the pooled session"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream request was not sent, to spare the upstream or the caller"""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter for the requests of one process.
+
+    Holds up to burst tokens and gains rate tokens per second; each request
+    takes one. acquire() waits at most wait seconds for a token and says
+    whether it got one, so a burst past the limit is shed instead of
+    queueing every caller behind it. rate=0 turns the limit off.
+    """
+
+    def __init__(self, rate, burst=10, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.throttled = 0
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, wait=0):
+        """Take a token, waiting up to wait seconds; False if none came"""
+        if not self.rate:
+            return True
+        deadline = self.clock() + wait
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                shortfall = (1 - self.tokens) / self.rate
+                if now + shortfall > deadline:
+                    self.throttled += 1
+                    return False
+            self.sleep(shortfall)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing, then probes it.
+
+    Closed, requests go through and consecutive failures are counted; at
+    failure_threshold the breaker opens. Open, allow() refuses requests
+    for reset_timeout seconds, so callers fail fast instead of each
+    waiting out timeouts. Then it turns half-open and lets a single probe
+    through: a success closes it, a failure opens it again. allow()
+    returns PROBE for that request; callers hand what allow() returned
+    back to record() or release(), so only the probe's own outcome lets
+    another probe through.
+    on_transition(state) is called on every change of state.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    PROBE = 'probe'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, on_transition=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_transition = on_transition
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = self.clock()
+        if self.on_transition is not None:
+            self.on_transition(state)
+
+    def allow(self):
+        """Return whether a request may be sent now: False, True, or PROBE for the half-open probe"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return self.PROBE
+
+    def release(self, permit=True):
+        """Give back an allowed request that was not sent after all"""
+        if permit == self.PROBE:
+            with self._lock:
+                self._probing = False
+
+    def record(self, failed, permit=True):
+        """Record the outcome of a request that was sent, with the permit allow() gave it"""
+        with self._lock:
+            # A request let through while closed may finish during the probe
+            if permit == self.PROBE:
+                self._probing = False
+            if not failed:
+                self.failures = 0
+                if self.state == self.HALF_OPEN:
+                    self._transition(self.CLOSED)
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failure_threshold and self.failures >= self.failure_threshold):
+                self._transition(self.OPEN)
+
+    def reset(self):
+        """Close the breaker and forget past failures"""
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(self.reset_timeout - (self.clock() - self.opened_at), 0), 3)
+            return {'state': self.state, 'failures': self.failures, 'retry_in': retry_in}